@@ -6,6 +6,14 @@ from dotenv import load_dotenv
 # Docker环境中，docker-compose会处理环境变量
 load_dotenv()
 
+
+def _getenv_bool(name: str, default: bool = False) -> bool:
+    """读取布尔型环境变量，接受 1/true/yes/on（不区分大小写）。"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
 # 项目根目录
 # /Users/lirenjie/Documents/CodeCraft/LevelRAG/JsonTreeRAG
 # app/core/config.py -> ../../..
@@ -19,6 +27,10 @@ DATA_DIR = BASE_DIR / "data"
 DB_DIR = BASE_DIR / "db"
 KNOWLEDGE_BASE_FILE = DATA_DIR / "combined_output.json"
 CHROMADB_PATH = DB_DIR / "chromadb"
+# 索引清单：记录每个已索引节点的内容哈希，用于增量索引
+INDEX_MANIFEST_FILE = DB_DIR / "index_manifest.json"
+# 索引脚本编译出的二进制知识库，供 KNOWLEDGE_BASE_LOADER=mmap 使用
+KNOWLEDGE_BASE_TREE_FILE = DB_DIR / "knowledge_base.tree"
 
 # 确保必要目录存在
 for directory in [DATA_DIR, DB_DIR, CHROMADB_PATH]:
@@ -28,20 +40,170 @@ for directory in [DATA_DIR, DB_DIR, CHROMADB_PATH]:
         # 在只读环境或权限受限环境下忽略
         pass
 
+# --- 知识库加载配置 ---
+# compact: 流式解析为紧凑表示（默认，内存占用低）；json: 完整 json.load 为嵌套 dict；
+# mmap: 映射索引脚本编译的二进制文件，多 worker 共享内存页且几乎无加载耗时
+KNOWLEDGE_BASE_LOADER = os.getenv("KNOWLEDGE_BASE_LOADER", "compact")
+
 # --- ChromaDB 配置 ---
 CHROMA_COLLECTION_NAME = "knowledge_base"
 
+# --- 向量检索后端 ---
+# chroma: 通过 ChromaDB 查询（默认）；numpy: 进程内对索引脚本导出的向量矩阵做精确检索
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+VECTOR_MATRIX_FILE = DB_DIR / "vectors.npy"
+VECTOR_META_FILE = DB_DIR / "vectors_meta.json"
+
+# --- 混合检索（词法 + 向量） ---
+# 是否在向量检索之外使用索引脚本生成的 BM25 词法索引，并以 RRF 融合两路结果。
+# 开启后检索结果的排序会变化，默认关闭，确认效果后再开启
+HYBRID_SEARCH_ENABLED = _getenv_bool("HYBRID_SEARCH_ENABLED", False)
+LEXICAL_INDEX_FILE = DB_DIR / "lexical_index.npz"
+# 融合前每一路检索取回的候选数
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+# RRF 融合常数 k（score = Σ 1 / (k + 名次)）
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", "60"))
+# 查询与某个节点名称完全相同（忽略大小写、全半角、空白和标点）且只有一个这样的节点时，
+# 直接使用该节点，不调用Embedding服务（开启后会加载词法索引，但不启用混合检索）；默认关闭
+EXACT_NAME_FAST_PATH = _getenv_bool("EXACT_NAME_FAST_PATH", False)
+
 # --- Embedding 服务配置 ---
 # 注意：URL将由客户端代码确保以'/'结尾
 EMBEDDING_API_BASE_URL = os.getenv("EMBEDDING_API_BASE_URL", "http://localhost:8001/v1")
 EMBEDDING_API_KEY = os.getenv("EMBEDDING_API_KEY", "dummy-key") # 提供一个默认值
 EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "bge-large-zh-v1.5")
 
+# --- 查询向量缓存 ---
+# 内存中最多缓存的查询向量数，0 表示禁用缓存
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+# 缓存条目有效期（秒），0 表示不过期
+EMBEDDING_CACHE_TTL = float(os.getenv("EMBEDDING_CACHE_TTL", "86400"))
+# 可选的磁盘缓存（SQLite 文件路径），为空表示只使用内存缓存
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")
+
+# --- 查询向量微批处理 ---
+# 合并并发查询的时间窗口（毫秒），0 表示禁用，每个查询单独请求
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", "0"))
+# 单个批次最多合并的查询数
+QUERY_BATCH_MAX_SIZE = int(os.getenv("QUERY_BATCH_MAX_SIZE", "32"))
+
 # --- LLM (vLLM) 服务配置 ---
 # 注意：URL将由客户端代码确保以'/'结尾
 LLM_API_BASE_URL = os.getenv("LLM_API_BASE_URL", "http://localhost:8002/v1")
 LLM_API_KEY = os.getenv("LLM_API_KEY", "dummy-key") # 提供一个默认值
 LLM_MODEL = os.getenv("LLM_MODEL", "Qwen1.5-14B-Chat")
+# 单次回答的最大输出 token 数
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "20000"))
+# 模型的上下文窗口大小；大于 0 时 max_tokens 会被限制为窗口减去提示词长度
+LLM_CONTEXT_WINDOW = int(os.getenv("LLM_CONTEXT_WINDOW", "0"))
+
+# --- 上游 HTTP 连接池（Embedding 与 LLM 客户端） ---
+# 每个客户端的最大连接数，以及保持的空闲长连接数和空闲连接的保持时间（秒）。
+# 空闲长连接数小于最大连接数时，突发流量结束后多出的连接会被关闭，下一次突发需要重新建立
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "100"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+# 是否启用 HTTP/2（需要安装 h2，仅对 https 生效）
+HTTP2_ENABLED = _getenv_bool("HTTP2_ENABLED", False)
+# 建立连接、写入请求、等待连接池空闲连接的超时（秒）
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "5"))
+HTTP_WRITE_TIMEOUT = float(os.getenv("HTTP_WRITE_TIMEOUT", "10"))
+HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", "5"))
+# 读取超时（秒）：Embedding 为整个响应；LLM 流式响应为相邻两个数据块的最大间隔
+EMBEDDING_READ_TIMEOUT = float(os.getenv("EMBEDDING_READ_TIMEOUT", "10"))
+LLM_READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "60"))
+# 请求失败（连接错误、超时、429/5xx）时的最大重试次数，退避间隔带随机抖动
+EMBEDDING_CLIENT_MAX_RETRIES = int(os.getenv("EMBEDDING_CLIENT_MAX_RETRIES", "2"))
+LLM_CLIENT_MAX_RETRIES = int(os.getenv("LLM_CLIENT_MAX_RETRIES", "1"))
+
+# --- LLM 准入控制 ---
+# 同时进行的LLM调用数上限（按 vLLM 的承载能力设置），0 表示不限制
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "0"))
+# 名额用完时允许排队的请求数，队列已满时立即返回 429
+LLM_QUEUE_MAX_SIZE = int(os.getenv("LLM_QUEUE_MAX_SIZE", "64"))
+# 在队列中等待的最长时间（秒），超时返回 503
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+
+# --- 回答缓存 ---
+# 是否缓存完整回答（按知识路径 + 规范化问题 + 模型 + 提示词模板），默认关闭
+RESPONSE_CACHE_ENABLED = _getenv_bool("RESPONSE_CACHE_ENABLED", False)
+# 缓存回答的总字节数上限
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# 缓存条目有效期（秒），0 表示不过期（知识库重新索引后缓存总会失效）
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "0"))
+
+# --- 多轮对话检索缓存 ---
+# 是否按会话（历史用户消息）缓存检索结果，追问与上一轮的子树足够相关时直接复用，默认关闭。
+# 开启后会加载词法索引（LEXICAL_INDEX_FILE），用其 IDF 为追问中的词加权；不影响 HYBRID_SEARCH_ENABLED
+SESSION_CACHE_ENABLED = _getenv_bool("SESSION_CACHE_ENABLED", False)
+# 最多缓存的会话轮次数，以及条目有效期（秒，0 表示不过期）
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "4096"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "1800"))
+# 追问中知识库检索词出现在上一轮子树中的比例（按 IDF 加权）不低于该值时复用上一轮的检索结果
+SESSION_CACHE_MIN_SCORE = float(os.getenv("SESSION_CACHE_MIN_SCORE", "0.6"))
 
 # --- RAG 配置 ---
 TOP_K_RESULTS = int(os.getenv("TOP_K_RESULTS", "3"))
+# 提示词中知识子树的 token 预算（估算值），超出时按与查询的相关性裁剪；0 表示不限制（默认）。
+# 裁剪会省略部分条目，与提示词模板中“条目不可遗漏”的要求相冲突，只在子树可能超出模型上下文窗口时
+# 按模型窗口设置（如 6000），并相应调整提示词模板
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "0"))
+# 是否使用前 TOP_K_RESULTS 个检索结果构建上下文（合并互为祖先/后代的结果，总大小受 CONTEXT_TOKEN_BUDGET 限制）；
+# 关闭时只使用最相关的一个结果
+CONTEXT_MULTI_RESULT = _getenv_bool("CONTEXT_MULTI_RESULT", False)
+# 按知识路径缓存的子树序列化结果数量，0 表示不缓存
+PROMPT_CONTEXT_CACHE_SIZE = int(os.getenv("PROMPT_CONTEXT_CACHE_SIZE", "1024"))
+# 子树序列化缓存占用内存的上限（字节），超出时按 LRU 淘汰；0 表示只按条目数限制
+PROMPT_CONTEXT_CACHE_MAX_BYTES = int(os.getenv("PROMPT_CONTEXT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# 单条序列化结果超过该大小（字节）时不缓存（靠近根节点的完整子树最大，缓存它们收益低、占用高）；0 表示不限制
+PROMPT_CONTEXT_CACHE_MAX_ENTRY_BYTES = int(os.getenv("PROMPT_CONTEXT_CACHE_MAX_ENTRY_BYTES", str(4 * 1024 * 1024)))
+# ChromaDB 查询与子树提取使用的专用线程池大小
+RETRIEVAL_EXECUTOR_WORKERS = int(os.getenv("RETRIEVAL_EXECUTOR_WORKERS", "16"))
+
+# --- 索引器 Embedding 批处理配置 ---
+# 每次请求发送给Embedding服务的文档数
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# 同时进行的Embedding请求数上限
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+# 单个批次失败后的最大重试次数，以及指数退避的基础等待秒数
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "3"))
+EMBEDDING_RETRY_BACKOFF = float(os.getenv("EMBEDDING_RETRY_BACKOFF", "1.0"))
+# 流式索引时每攒够多少个待更新节点就执行一次 Embedding + 写入
+INDEX_CHUNK_SIZE = int(os.getenv("INDEX_CHUNK_SIZE", "2000"))
+# 内容（name + desc）相同的节点只生成一次Embedding，向量复用到所有路径
+INDEX_DEDUP_CONTENT = _getenv_bool("INDEX_DEDUP_CONTENT", True)
+# 写入 ChromaDB 时每个 upsert 请求的条目数，以及同时进行的写入请求数上限
+INDEX_WRITE_BATCH_SIZE = int(os.getenv("INDEX_WRITE_BATCH_SIZE", "500"))
+INDEX_WRITE_CONCURRENCY = int(os.getenv("INDEX_WRITE_CONCURRENCY", "2"))
+
+# --- 索引热重载与管理接口 ---
+# 轮询知识库与索引文件变化的间隔（秒），检测到重新索引后在后台加载并切换快照；0 表示不自动重载
+INDEX_RELOAD_INTERVAL = float(os.getenv("INDEX_RELOAD_INTERVAL", "10"))
+# 管理接口（如 POST /admin/reload）的访问密钥，请求需携带 "Authorization: Bearer <密钥>"；为空时禁用管理接口
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "")
+
+# --- 多进程服务（python -m app.server） ---
+# worker 进程数；大于 1 时主进程预先加载索引后 fork 出各 worker，只读的索引内存在 worker 间共享
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", "1"))
+# 是否在 fork 之前于主进程中加载索引快照（仅 VECTOR_BACKEND=numpy 时生效，ChromaDB 客户端不能跨 fork 使用）
+SERVER_PRELOAD = _getenv_bool("SERVER_PRELOAD", True)
+# 关闭时等待 worker 处理完进行中请求的最长时间（秒）
+SERVER_GRACEFUL_TIMEOUT = float(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+
+# --- 流式输出 ---
+# 合并短时间内到达的 token 增量以减少网络写入的时间窗口（毫秒），0 表示每个增量单独发送
+SSE_COALESCE_MS = float(os.getenv("SSE_COALESCE_MS", "0"))
+# 合并的增量累计超过该字符数时立即发送
+SSE_COALESCE_MAX_CHARS = int(os.getenv("SSE_COALESCE_MAX_CHARS", "64"))
+
+# --- 日志配置 ---
+# 日志级别（DEBUG 时会记录完整提示词和检索结果详情）
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# text: 普通文本；json: 每行一个JSON对象（结构化日志）
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# 是否通过队列由后台线程格式化和写出日志，避免在请求路径上做同步 I/O
+LOG_ASYNC = _getenv_bool("LOG_ASYNC", True)
+# 提示词等大体积内容在日志中的最大字符数，超出部分截断；0 表示不截断
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "2000"))
+# INFO 级别下记录完整提示词和检索结果详情的请求比例（0~1），0 表示只在 DEBUG 级别记录
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0"))
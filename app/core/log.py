@@ -0,0 +1,149 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+
+from app.core import config
+
+# 服务端日志配置。
+# 开启 LOG_ASYNC 时，请求线程只把日志记录放入队列，格式化和写出都在后台线程中完成；
+# 提示词、检索结果等大体积内容通过 payload_enabled() 控制是否记录，并以 Truncated 延迟截断。
+
+# 当前请求的ID，由 main 中的中间件设置
+request_id_var: contextvars.ContextVar[str] = contextvars.ContextVar("request_id", default="-")
+
+_listener = None
+
+
+class RequestIdFilter(logging.Filter):
+    """为日志记录附加 request_id 字段（必须在产生日志的线程中执行，才能读到请求上下文）。"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not hasattr(record, "request_id"):
+            record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行JSON，便于日志系统按字段检索。"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    只入队、不格式化的 QueueHandler。
+
+    标准 QueueHandler.prepare() 会在调用线程中完成消息格式化，这里推迟到后台线程。
+    异常信息在入队前转为文本（traceback 对象不能安全地跨线程延迟处理）；
+    消息参数按引用传递，记录日志后不应再修改这些对象。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class Truncated:
+    """
+    延迟截断的日志参数：只有日志真正被格式化时才会转成字符串并截断。
+
+    用法: logging.info("提示词: %s", Truncated(prompt))
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit: int = None):
+        self.value = value
+        self.limit = config.LOG_PAYLOAD_MAX_CHARS if limit is None else limit
+
+    def __str__(self) -> str:
+        text = self.value if isinstance(self.value, str) else str(self.value)
+        if self.limit <= 0 or len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}...（已截断，共 {len(text)} 字符）"
+
+
+class LazyJson:
+    """延迟序列化的日志参数，格式化时才执行 json.dumps。"""
+
+    __slots__ = ("value", "indent")
+
+    def __init__(self, value, indent: int = None):
+        self.value = value
+        self.indent = indent
+
+    def __str__(self) -> str:
+        return json.dumps(self.value, ensure_ascii=False, indent=self.indent)
+
+
+def payload_enabled(logger: logging.Logger = None) -> bool:
+    """
+    是否记录大体积内容（完整提示词、检索结果详情）。
+    DEBUG 级别开启时总是记录；否则按 LOG_PAYLOAD_SAMPLE_RATE 抽样（默认 0，不记录）。
+    """
+    logger = logger or logging.getLogger()
+    if logger.isEnabledFor(logging.DEBUG):
+        return True
+    rate = config.LOG_PAYLOAD_SAMPLE_RATE
+    return rate > 0 and logger.isEnabledFor(logging.INFO) and random.random() < rate
+
+
+def setup_logging(stream=None):
+    """
+    按配置初始化根日志记录器（只在进程启动时调用一次）。
+
+    LOG_FORMAT=json 时输出结构化的单行JSON；LOG_ASYNC 开启时通过队列交给后台线程写出。
+    stream 为日志输出流，默认 sys.stderr。
+    """
+    global _listener
+    root = logging.getLogger()
+    if _listener is not None:
+        return
+    root.setLevel(config.LOG_LEVEL)
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    if config.LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - [%(request_id)s] %(message)s'))
+
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+
+    if config.LOG_ASYNC:
+        queue_handler = _DeferredQueueHandler(queue.SimpleQueue())
+        queue_handler.addFilter(RequestIdFilter())
+        root.addHandler(queue_handler)
+        _listener = logging.handlers.QueueListener(queue_handler.queue, handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+    else:
+        handler.addFilter(RequestIdFilter())
+        root.addHandler(handler)
+
+
+def shutdown_logging():
+    """停止后台日志线程，并写出队列中剩余的日志。"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
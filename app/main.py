@@ -1,25 +1,95 @@
 # FastAPI 主应用和 API 端点
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
+import asyncio
+import contextlib
+import hmac
 import logging
+import re
 import uuid
 import time
+from contextlib import asynccontextmanager
 from typing import Literal, Optional, List
-import asyncio
 
-from app.services.retrieval import get_context_from_retrieval
-from app.services.llm_handler import build_prompt, get_llm_stream
+from app.services.admission import AdmissionRejected, get_admission_controller
+from app.services.http_clients import pool_stats
+from app.services.llm_handler import get_llm_client, LLM_ERROR_PREFIX
+from app.services.retrieval import (
+    aget_conversation_context, aclose_clients, get_async_embedding_client, get_snapshot, reload_snapshot,
+    watch_index
+)
+from app.services.answer import start_answer, NOT_FOUND_MESSAGE
+from app.services.sse import ChunkEncoder, DONE_EVENT, coalesce_chunks
+from app.services.metrics import FIRST_CHUNK_SECONDS, REGISTRY, REQUEST_SECONDS, REQUESTS
 from app.core import config
+from app.core.log import Truncated, request_id_var, setup_logging
+
+# 配置日志（每条日志带上请求ID；默认由后台线程格式化和写出）
+setup_logging()
+
+# 客户端通过 X-Request-ID 传入的请求ID只接受有限的字符，避免污染日志
+_REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+class RequestIdMiddleware:
+    """
+    为每个 HTTP 请求设置请求ID（沿用合法的 X-Request-ID 请求头，否则生成新的），
+    写入 request_id_var 供日志使用，并在响应头中返回。
+    纯 ASGI 实现，不会像 BaseHTTPMiddleware 那样额外包装流式响应。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_id = None
+        for name, value in scope.get("headers", []):
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")
+                break
+        if not request_id or not _REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        header = (b"x-request-id", request_id.encode("latin-1"))
+
+        async def send_with_request_id(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), header]}
+            await send(message)
 
-# 配置日志
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+        token = request_id_var.set(request_id)
+        try:
+            await self.app(scope, receive, send_with_request_id)
+        finally:
+            request_id_var.reset(token)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时在线程中预先加载索引快照，避免第一个请求承担加载开销
+    await asyncio.to_thread(get_snapshot)
+    # 在应用生命周期内创建共享的上游客户端（连接池），关闭时统一释放
+    get_async_embedding_client()
+    get_llm_client()
+    watcher = None
+    if config.INDEX_RELOAD_INTERVAL > 0:
+        watcher = asyncio.create_task(watch_index(config.INDEX_RELOAD_INTERVAL))
+    yield
+    if watcher is not None:
+        watcher.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await watcher
+    # 关闭共享的上游客户端（连接池）和检索线程池
+    await aclose_clients()
 
 app = FastAPI(
     title="OpenAI-Compatible RAG API",
     description="一个基于树形JSON知识库的、符合OpenAI标准的RAG问答系统",
     version="1.1.0",
+    lifespan=lifespan,
 )
+app.add_middleware(RequestIdMiddleware)
 
 # --- OpenAI 兼容的 Pydantic 模型 ---
 
@@ -30,7 +100,7 @@ class ChatMessage(BaseModel):
 class ChatCompletionRequest(BaseModel):
     model: Optional[str] = None
     messages: List[ChatMessage]
-    stream: bool = Field(default=False, description="是否以流式方式返回响应")
+    stream: bool = Field(default=False, description="是否以流式方式返回响应，否则返回完整的 chat.completion 对象")
     # 可以根据需要添加其他OpenAI参数，如 temperature, max_tokens 等
 
 class Delta(BaseModel):
@@ -41,6 +111,7 @@ class ChoiceDelta(BaseModel):
     index: int = 0
     finish_reason: Optional[str] = None
 
+# 流式响应数据块的结构（实际输出由 app.services.sse.ChunkEncoder 按相同格式直接编码）
 class StreamingChatCompletion(BaseModel):
     id: str = Field(default_factory=lambda: f"chatcmpl-{uuid.uuid4().hex}")
     object: str = "chat.completion.chunk"
@@ -48,97 +119,195 @@ class StreamingChatCompletion(BaseModel):
     model: str
     choices: List[ChoiceDelta]
 
+class Choice(BaseModel):
+    message: ChatMessage
+    index: int = 0
+    finish_reason: Optional[str] = "stop"
+
+class ChatCompletion(BaseModel):
+    id: str = Field(default_factory=lambda: f"chatcmpl-{uuid.uuid4().hex}")
+    object: str = "chat.completion"
+    created: int = Field(default_factory=lambda: int(time.time()))
+    model: str
+    choices: List[Choice]
+
 
 @app.get("/")
 def read_root():
     return {"message": "Welcome to the OpenAI-Compatible RAG API. Visit /docs for documentation."}
 
-async def stream_generator(retrieved_path, retrieved_subtree, user_question, model_name: str):
-    """生成器函数，用于处理并以OpenAI兼容格式流式传输LLM的响应。"""
-    # 1. 构建提示
-    prompt = build_prompt(retrieved_path, retrieved_subtree, user_question)
-    logging.info(f"构建的提示: \n{prompt}")
-    
-    # 2. 获取LLM流
-    llm_response_stream = get_llm_stream(prompt, model=model_name)
-    
-    # 3. 迭代流并yield OpenAI兼容的数据块
-    async for chunk in llm_response_stream:
-        if chunk: # 确保内容不为空
-            response_chunk = StreamingChatCompletion(
-                model=model_name,
-                choices=[ChoiceDelta(delta=Delta(content=chunk))]
-            )
-            # 兼容 pydantic v1/v2 的 JSON 序列化（优先使用 v2 的 model_dump_json）
-            json_str = response_chunk.model_dump_json() if hasattr(response_chunk, 'model_dump_json') else response_chunk.json()
-            yield f"data: {json_str}\n\n"
-    
-    # 4. 发送带有 finish_reason 的最后一个数据块
-    final_chunk = StreamingChatCompletion(
+@app.get("/metrics")
+def metrics():
+    """以 Prometheus 文本格式返回各阶段耗时、缓存命中和错误等指标。"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+def _record_request(mode: str, status: str, started: float):
+    REQUESTS.inc(mode=mode, status=status)
+    REQUEST_SECONDS.observe(time.perf_counter() - started, mode=mode)
+
+async def stream_generator(chunks, model_name: str, started: Optional[float] = None):
+    """
+    生成器函数，用于处理并以OpenAI兼容格式流式传输LLM的响应。
+    chunks 为 start_answer 返回的回答流（占用的LLM调用名额在回答流结束或关闭时归还）；
+    started 为收到请求时的 time.perf_counter()，用于记录首个回答块的耗时和请求总耗时。
+    """
+    if started is None:
+        started = time.perf_counter()
+    # 同一个流的 id / created / model 固定，数据块由预编码的模板生成
+    encoder = ChunkEncoder(model_name)
+    if config.SSE_COALESCE_MS > 0:
+        chunks = coalesce_chunks(chunks, config.SSE_COALESCE_MS, config.SSE_COALESCE_MAX_CHARS)
+    # 客户端中途断开时生成器被关闭，请求计为 cancelled
+    status = "cancelled"
+    first_chunk = True
+    try:
+        # 1. 迭代回答流（含回答缓存）并yield OpenAI兼容的数据块
+        async for chunk in chunks:
+            if first_chunk:
+                FIRST_CHUNK_SECONDS.observe(time.perf_counter() - started, mode="stream")
+                first_chunk = False
+            yield encoder.content(chunk)
+
+        # 2. 发送带有 finish_reason 的最后一个数据块
+        yield encoder.stop()
+        
+        # 3. 发送流结束标志
+        yield DONE_EVENT
+        status = "ok"
+    finally:
+        # 客户端断开时生成器被取消或关闭，关闭回答流（连带关闭上游LLM流并归还名额）
+        await chunks.aclose()
+        _record_request("stream", status, started)
+
+def _completion(model_name: str, content: str) -> ChatCompletion:
+    """构建非流式请求返回的 chat.completion 对象。"""
+    return ChatCompletion(
         model=model_name,
-        choices=[ChoiceDelta(delta=Delta(), finish_reason="stop")]
+        choices=[Choice(message=ChatMessage(role="assistant", content=content))]
     )
-    json_str = final_chunk.model_dump_json() if hasattr(final_chunk, 'model_dump_json') else final_chunk.json()
-    yield f"data: {json_str}\n\n"
-    
-    # 5. 发送流结束标志
-    yield "data: [DONE]\n\n"
 
 @app.post("/v1/chat/completions")
 async def chat_completions(request: ChatCompletionRequest):
     """
-    接收符合OpenAI标准的聊天请求，检索相关知识，并以流式方式返回LLM的回答。
+    接收符合OpenAI标准的聊天请求，检索相关知识，并返回LLM的回答。
+    stream 为 true 时以SSE流式返回，否则返回完整的 chat.completion 对象。
     """
-    # 只处理流式请求
-    if not request.stream:
-        raise HTTPException(status_code=400, detail="This endpoint only supports streaming requests. Please set 'stream: true'.")
+    started = time.perf_counter()
+    mode = "stream" if request.stream else "json"
 
-    # 从消息列表中提取最后一个用户问题
-    user_question = next((msg.content for msg in reversed(request.messages) if msg.role == 'user'), None)
+    # 从消息列表中提取用户消息，最后一条为本轮问题（之前的用户消息用于多轮对话的检索缓存）
+    user_messages = [msg.content for msg in request.messages if msg.role == 'user']
+    user_question = user_messages[-1] if user_messages else None
     
     if not user_question:
         raise HTTPException(status_code=400, detail="No user message found in the request.")
         
-    logging.info(f"收到问题: {user_question}")
+    logging.info("收到问题: %s", Truncated(user_question))
 
     # 1. 确定模型名（请求优先，否则使用默认配置）
     model_name = request.model or config.LLM_MODEL
 
-    # 2. 检索上下文（在线程池中运行以避免阻塞事件循环）
-    loop = asyncio.get_running_loop()
-    retrieved_path, retrieved_subtree = await loop.run_in_executor(
-        None, lambda: get_context_from_retrieval(user_question)
-    )
+    # 2. 检索上下文（异步向量化 + 专用线程池中的向量检索，不阻塞事件循环；追问可复用上一轮的结果）
+    retrieved_path, retrieved_subtree = await aget_conversation_context(user_messages)
 
-    # 3. 如果没有找到上下文，返回特定的流式消息
+    # 3. 如果没有找到上下文，返回特定的消息
     if not retrieved_path or not retrieved_subtree:
         logging.warning("未能从知识库中检索到相关上下文。")
+        _record_request(mode, "not_found", started)
+        if not request.stream:
+            return _completion(model_name, NOT_FOUND_MESSAGE)
         async def not_found_stream():
-            error_message = "抱歉，我无法在知识库中找到与您问题相关的信息。请尝试换一种问法。"
+            encoder = ChunkEncoder(model_name)
             # 发送错误消息块
-            response_chunk = StreamingChatCompletion(
-                model=model_name,
-                choices=[ChoiceDelta(delta=Delta(content=error_message))]
-            )
-            json_str = response_chunk.model_dump_json() if hasattr(response_chunk, 'model_dump_json') else response_chunk.json()
-            yield f"data: {json_str}\n\n"
+            yield encoder.content(NOT_FOUND_MESSAGE)
             # 发送结束块
-            final_chunk = StreamingChatCompletion(
-                model=model_name,
-                choices=[ChoiceDelta(delta=Delta(), finish_reason="stop")]
-            )
-            json_str = final_chunk.model_dump_json() if hasattr(final_chunk, 'model_dump_json') else final_chunk.json()
-            yield f"data: {json_str}\n\n"
-            yield "data: [DONE]\n\n"
+            yield encoder.stop()
+            yield DONE_EVENT
         return StreamingResponse(not_found_stream(), media_type="text/event-stream")
 
-    logging.info(f"成功检索到上下文路径: {retrieved_path}")
+    logging.info("成功检索到上下文路径: %s", retrieved_path)
 
-    # 4. 创建并返回流式响应
-    return StreamingResponse(
-        stream_generator(retrieved_path, retrieved_subtree, user_question, model_name),
-        media_type="text/event-stream"
-    )
+    # 4. 开始生成回答: 回答缓存未命中且启用准入控制时先获取LLM调用名额，超出承载能力时在响应开始前快速失败
+    controller = get_admission_controller()
+    try:
+        chunks = await start_answer(
+            retrieved_path, retrieved_subtree, user_question, model_name, admission=controller
+        )
+    except AdmissionRejected as e:
+        logging.warning("LLM准入被拒绝（%s），进行中 %d，排队 %d", e.reason, controller.active, controller.waiting)
+        _record_request(mode, "rejected", started)
+        raise HTTPException(
+            status_code=e.status_code,
+            detail="The service is at capacity. Please retry later.",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+    # 5. 非流式请求：生成完整回答后一次性返回；请求被取消时关闭回答流（连带关闭上游LLM流并归还名额）。
+    # LLM调用失败时（回答流中出现错误信息）返回 502，而不是把错误信息作为回答内容返回 200
+    if not request.stream:
+        status = "error"
+        failed = False
+        try:
+            parts = []
+            async for chunk in chunks:
+                failed = failed or chunk.startswith(LLM_ERROR_PREFIX)
+                parts.append(chunk)
+            if not failed:
+                status = "ok"
+        finally:
+            await chunks.aclose()
+            _record_request(mode, status, started)
+        if failed:
+            raise HTTPException(status_code=502, detail="The language model request failed. Please retry later.")
+        return _completion(model_name, "".join(parts))
+
+    # 6. 创建并返回流式响应
+    return StreamingResponse(stream_generator(chunks, model_name, started=started), media_type="text/event-stream")
+
+def _require_admin(authorization: Optional[str]):
+    """校验管理接口的 Bearer 密钥；未配置 ADMIN_API_KEY 时管理接口不可用。"""
+    if not config.ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled. Set ADMIN_API_KEY to enable them.")
+    if not hmac.compare_digest(authorization or "", f"Bearer {config.ADMIN_API_KEY}"):
+        raise HTTPException(status_code=401, detail="Invalid admin API key.")
+
+@app.post("/admin/reload")
+async def reload_index(force: bool = False, authorization: Optional[str] = Header(default=None)):
+    """
+    重新加载知识库和向量索引（需要 ADMIN_API_KEY）。
+    新快照在后台线程中构建，完成后原子替换；进行中的请求继续使用旧快照。
+    """
+    _require_admin(authorization)
+
+    try:
+        reloaded = await asyncio.to_thread(reload_snapshot, force)
+    except Exception as e:
+        logging.error(f"重新加载索引快照失败，继续使用当前索引: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500, detail=f"Reload failed; the current index is still being served: {e}"
+        )
+    snapshot = get_snapshot()
+    return {
+        "reloaded": reloaded,
+        "generation": snapshot.generation,
+        "version": snapshot.version,
+        "nodes": len(snapshot.tree),
+        "vectors": snapshot.backend.count(),
+        "loaded_at": int(snapshot.loaded_at),
+    }
+
+@app.get("/admin/admission")
+async def admission_stats(authorization: Optional[str] = Header(default=None)):
+    """返回LLM准入控制的进行中/排队请求数和累计拒绝次数（需要 ADMIN_API_KEY）。"""
+    _require_admin(authorization)
+    controller = get_admission_controller()
+    return {"enabled": controller is not None, **(controller.stats() if controller is not None else {})}
+
+@app.get("/admin/pools")
+async def connection_pools(authorization: Optional[str] = Header(default=None)):
+    """返回 Embedding / LLM 上游连接池的连接数（需要 ADMIN_API_KEY）。"""
+    _require_admin(authorization)
+    return pool_stats()
 
 # 添加一个用于开发时快速启动的命令
 if __name__ == "__main__":
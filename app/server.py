@@ -0,0 +1,196 @@
+# 多进程服务入口（预先 fork 的 uvicorn worker）
+#
+# 用法:
+#   python -m app.server --host 0.0.0.0 --port 8000 --workers 4
+#
+# 主进程绑定监听端口并（SERVER_PRELOAD 开启时）预先加载索引快照，然后 fork 出各 worker，
+# 各 worker 在同一个监听 socket 上接受连接。索引只加载一次：NumPy 向量矩阵（memmap）、
+# mmap 知识库和词法索引数组在 worker 间共享物理内存，新增 worker 几乎不增加内存和启动时间。
+# 主进程负责在 worker 异常退出时重新拉起，收到 SIGTERM/SIGINT 时通知所有 worker 优雅退出。
+#
+# 注意: 每个 worker 有各自的指标、缓存和准入控制名额；POST /admin/reload 只作用于处理该请求的 worker
+# （各 worker 仍会按 INDEX_RELOAD_INTERVAL 自行检测并重载新索引）。
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+from app.core import config
+from app.core.log import setup_logging, shutdown_logging
+
+# worker 启动后这么短时间内退出视为启动失败，重新拉起前等待，避免反复崩溃时空转
+_MIN_WORKER_LIFETIME = 1.0
+
+
+def _bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(app, sock: socket.socket, log_level: str):
+    """在 worker 进程中运行 uvicorn（不返回）。"""
+    code = 0
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        # fork 之前主进程已停止日志线程，子进程中重新启动
+        setup_logging()
+        server = uvicorn.Server(uvicorn.Config(app, log_level=log_level, lifespan="on"))
+        server.run(sockets=[sock])
+        if not server.started:
+            code = 3
+    except BaseException:
+        logging.exception("worker 异常退出")
+        code = 1
+    finally:
+        shutdown_logging()
+        os._exit(code)
+
+
+class Arbiter:
+    """
+    主进程: fork 并监督 worker。
+
+    Args:
+        app: ASGI 应用。
+        sock: 已绑定并开始监听的 socket，由所有 worker 共享。
+        workers (int): worker 数。
+        log_level (str): uvicorn 的日志级别。
+        graceful_timeout (float): 关闭时等待 worker 退出的最长时间（秒），超时后强制结束。
+    """
+
+    def __init__(self, app, sock: socket.socket, workers: int, log_level: str = "info",
+                 graceful_timeout: float = 30.0):
+        self.app = app
+        self.sock = sock
+        self.workers = max(1, workers)
+        self.log_level = log_level
+        self.graceful_timeout = graceful_timeout
+        # pid -> (worker 序号, 启动时间)
+        self._children = {}
+        self._stopping = False
+
+    def _spawn(self, slot: int):
+        # 有后台线程时 fork 不安全，fork 前先停止日志线程，父子进程各自重新启动
+        shutdown_logging()
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(self.app, self.sock, self.log_level)
+        setup_logging()
+        self._children[pid] = (slot, time.monotonic())
+        logging.info("已启动 worker %d（pid %d）", slot, pid)
+
+    def _handle_stop(self, signum, frame):
+        self._stopping = True
+
+    def _reap(self):
+        """回收已退出的 worker，返回需要重新拉起的 (序号, 存活时间) 列表。"""
+        exited = []
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            slot, started = self._children.pop(pid, (None, 0.0))
+            if slot is None:
+                continue
+            if not self._stopping:
+                logging.error("worker %d（pid %d）意外退出，状态 %s，正在重新拉起。", slot, pid, status)
+            exited.append((slot, time.monotonic() - started))
+        return exited
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        for slot in range(self.workers):
+            self._spawn(slot)
+        logging.info("主进程 pid %d，共 %d 个 worker。", os.getpid(), self.workers)
+
+        while not self._stopping:
+            for slot, lifetime in self._reap():
+                if self._stopping:
+                    break
+                if lifetime < _MIN_WORKER_LIFETIME:
+                    time.sleep(_MIN_WORKER_LIFETIME)
+                self._spawn(slot)
+            time.sleep(0.2)
+        return self._shutdown()
+
+    def _shutdown(self) -> int:
+        logging.info("正在停止 %d 个 worker...", len(self._children))
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.graceful_timeout
+        while self._children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self._children):
+            logging.warning("worker pid %d 未在 %ss 内退出，强制结束。", pid, self.graceful_timeout)
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self._reap()
+        self.sock.close()
+        return 0
+
+
+def serve(app, host: str = "0.0.0.0", port: int = 8000, workers: int = None, preload: bool = None,
+          log_level: str = "info", backlog: int = 2048) -> int:
+    """
+    启动服务。workers 为 1 时直接在当前进程中运行 uvicorn；大于 1 时以预先 fork 的多进程方式运行。
+    workers / preload 为空时使用 SERVER_WORKERS / SERVER_PRELOAD 配置。
+    """
+    workers = config.SERVER_WORKERS if workers is None else workers
+    preload = config.SERVER_PRELOAD if preload is None else preload
+    if workers <= 1:
+        uvicorn.run(app, host=host, port=port, log_level=log_level)
+        return 0
+
+    if config.VECTOR_BACKEND != "numpy":
+        logging.warning("多 worker 模式下每个 worker 会各自打开 ChromaDB，建议设置 VECTOR_BACKEND=numpy 以共享向量索引。")
+    sock = _bind_socket(host, port, backlog)
+    if preload:
+        from app.services.retrieval import preload_snapshot
+
+        start = time.perf_counter()
+        if preload_snapshot():
+            logging.info("主进程已预加载索引快照，耗时 %.2fs。", time.perf_counter() - start)
+            # 预加载的对象此后只读：移出 GC 跟踪，避免 worker 中的垃圾回收遍历它们时触发写时复制
+            gc.freeze()
+    return Arbiter(app, sock, workers, log_level, config.SERVER_GRACEFUL_TIMEOUT).run()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JsonTreeRAG 多进程服务")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None, help="worker 数，默认使用 SERVER_WORKERS")
+    parser.add_argument("--no-preload", action="store_true", help="不在主进程中预加载索引")
+    parser.add_argument("--log-level", default="info", help="uvicorn 日志级别")
+    args = parser.parse_args(argv)
+
+    from app.main import app
+
+    sys.exit(serve(app, args.host, args.port, args.workers, False if args.no_preload else None, args.log_level))
+
+
+if __name__ == "__main__":
+    main()
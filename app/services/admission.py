@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Optional
+
+from app.core import config
+from app.services.metrics import REGISTRY, Counter, GaugeFunc, Histogram
+
+# LLM 调用的准入控制。
+# 不加限制时，流量高峰下所有请求同时打到 vLLM，每个用户的延迟一起变差。这里限制同时进行的LLM调用数，
+# 超出的请求在有界队列中等待；队列已满或等待超时的请求立即被拒绝（429/503 + Retry-After），
+# 而不是拖慢已经在生成的回答。
+
+ADMISSION_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "rag_llm_queue_wait_seconds", "请求在LLM准入队列中的等待时间（含未等待直接进入的请求）。",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)))
+ADMISSION_REJECTED = REGISTRY.register(Counter(
+    "rag_llm_rejected_total", "被准入控制拒绝的请求数（queue_full: 队列已满，timeout: 等待超时）。", ("reason",)))
+
+
+class AdmissionRejected(Exception):
+    """请求未能获得LLM调用名额。status_code 为建议返回的 HTTP 状态码，retry_after 为建议的重试间隔（秒）。"""
+
+    def __init__(self, reason: str, status_code: int, retry_after: int):
+        super().__init__(f"LLM admission rejected: {reason}")
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionSlot:
+    """一个已获得的LLM调用名额；release() 可重复调用，只会归还一次。"""
+
+    __slots__ = ("_controller", "_acquired_at", "released", "__weakref__")
+
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._acquired_at = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if not self.released:
+            self.released = True
+            self._controller._release(time.monotonic() - self._acquired_at)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class AdmissionController:
+    """
+    带有界等待队列的并发限制器（只在事件循环线程中使用）。
+
+    名额按到达顺序（FIFO）分配；释放名额时直接交给队首的等待者，新到达的请求不会插队。
+
+    Args:
+        max_concurrent (int): 同时进行的LLM调用数上限。
+        max_queue (int): 等待队列长度上限，0 表示不排队，名额用完时直接拒绝。
+        queue_timeout (float): 在队列中等待的最长时间（秒）。
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int, queue_timeout: float):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._waiters: deque = deque()
+        # 名额平均占用时间（指数移动平均），用于估算 Retry-After
+        self._avg_hold = 0.0
+        self._stats = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+
+    @property
+    def active(self) -> int:
+        return self._active
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def retry_after(self) -> int:
+        """按当前排队人数和名额平均占用时间估算的重试间隔（秒，至少 1）。"""
+        rounds = (len(self._waiters) + 1) / self.max_concurrent
+        return max(1, math.ceil(rounds * self._avg_hold))
+
+    async def acquire(self) -> AdmissionSlot:
+        """
+        获取一个名额。名额已满时排队等待；队列已满或等待超时时抛出 AdmissionRejected。
+        调用方必须在LLM调用结束后释放返回的名额（或以 async with 使用）。
+        """
+        start = time.monotonic()
+        if self._active < self.max_concurrent and not self._waiters:
+            return self._admit(start)
+        if len(self._waiters) >= self.max_queue:
+            self._stats["rejected_queue_full"] += 1
+            ADMISSION_REJECTED.inc(reason="queue_full")
+            raise AdmissionRejected("queue_full", 429, self.retry_after())
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        self._stats["queued"] += 1
+        try:
+            await asyncio.wait_for(future, self.queue_timeout)
+        except asyncio.TimeoutError:
+            # 超时与名额交接可能发生在同一轮事件循环中（Python 3.12+ 的 wait_for 此时仍抛出超时）：
+            # 已为本请求预留的名额转交给下一个等待者，否则该名额会永久泄漏
+            if future.done() and not future.cancelled():
+                self._active -= 1
+                self._wake_next()
+            self._stats["rejected_timeout"] += 1
+            ADMISSION_REJECTED.inc(reason="timeout")
+            raise AdmissionRejected("timeout", 503, self.retry_after()) from None
+        except asyncio.CancelledError:
+            # 等待期间请求被取消：若名额恰好已交给本请求，则转交给下一个等待者
+            if future.done() and not future.cancelled():
+                self._active -= 1
+                self._wake_next()
+            raise
+        finally:
+            if not future.done() or future.cancelled():
+                try:
+                    self._waiters.remove(future)
+                except ValueError:
+                    pass
+        # 名额已在 _wake_next 中预先占用
+        return self._admit(start, reserved=True)
+
+    def _admit(self, start: float, reserved: bool = False) -> AdmissionSlot:
+        if not reserved:
+            self._active += 1
+        self._stats["admitted"] += 1
+        ADMISSION_WAIT_SECONDS.observe(time.monotonic() - start)
+        return AdmissionSlot(self)
+
+    def _release(self, held: float):
+        self._avg_hold = held if not self._avg_hold else 0.9 * self._avg_hold + 0.1 * held
+        self._active -= 1
+        self._wake_next()
+
+    def _wake_next(self):
+        while self._waiters and self._active < self.max_concurrent:
+            future = self._waiters.popleft()
+            if not future.done():
+                # 先占用名额，避免在等待者恢复运行前被新请求抢走
+                self._active += 1
+                future.set_result(None)
+                return
+
+    def stats(self) -> dict:
+        """返回当前的进行中/排队请求数、配置的上限和累计的准入/拒绝次数。"""
+        stats = dict(self._stats)
+        stats.update({
+            "active": self._active,
+            "waiting": len(self._waiters),
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "avg_hold_seconds": round(self._avg_hold, 3),
+        })
+        return stats
+
+
+@lru_cache(maxsize=1)
+def get_admission_controller() -> Optional[AdmissionController]:
+    """返回LLM调用的准入控制器；LLM_MAX_CONCURRENCY 为 0 时不限制并返回 None。"""
+    if config.LLM_MAX_CONCURRENCY <= 0:
+        return None
+    logging.info(
+        "LLM准入控制: 并发上限 %d，队列上限 %d，等待超时 %ss",
+        config.LLM_MAX_CONCURRENCY, config.LLM_QUEUE_MAX_SIZE, config.LLM_QUEUE_TIMEOUT,
+    )
+    return AdmissionController(config.LLM_MAX_CONCURRENCY, config.LLM_QUEUE_MAX_SIZE, config.LLM_QUEUE_TIMEOUT)
+
+
+def _collect_slots():
+    controller = get_admission_controller() if get_admission_controller.cache_info().currsize else None
+    if controller is None:
+        return {}
+    return {("active",): controller.active, ("waiting",): controller.waiting}
+
+
+REGISTRY.register(GaugeFunc(
+    "rag_llm_slots", "LLM准入控制的当前状态（active: 进行中的LLM调用，waiting: 排队中的请求）。",
+    ("state",), _collect_slots))
@@ -0,0 +1,133 @@
+import logging
+import time
+import weakref
+from typing import AsyncIterator, Optional, Tuple
+
+from app.core.log import Truncated, payload_enabled
+from app.services.admission import AdmissionController, AdmissionSlot
+from app.services.llm_handler import build_prompt, get_llm_stream, LLM_ERROR_PREFIX, PROMPT_TEMPLATE_HASH
+from app.services.metrics import (
+    CACHE_EVENTS, ERRORS, LLM_OUTPUT_TOKENS, LLM_TOKENS_PER_SECOND, STAGE_SECONDS, stage_timer
+)
+from app.services.response_cache import get_response_cache
+from app.services.retrieval import aget_context_from_retrieval, get_snapshot
+from app.utils.text import estimate_tokens
+
+# 检索 + 生成的完整问答流程，供流式接口、非流式接口和批量脚本共用。
+
+# 知识库中没有相关内容时返回给用户的回答
+NOT_FOUND_MESSAGE = "抱歉，我无法在知识库中找到与您问题相关的信息。请尝试换一种问法。"
+
+
+async def start_answer(retrieved_path: str, retrieved_subtree, user_question: str, model_name: str,
+                       admission: Optional[AdmissionController] = None) -> AsyncIterator[str]:
+    """
+    开始回答一个问题，返回逐块产出回答文本的异步生成器。
+
+    启用回答缓存时先查询缓存，命中则返回回放缓存的生成器，不占用LLM调用名额。未命中且传入 admission
+    （准入控制器）时，在返回之前获取LLM调用名额：名额不足时在这里抛出 AdmissionRejected，调用方可以在
+    开始响应之前拒绝请求。名额在生成器结束或被关闭时归还；生成器未被迭代就被回收时兜底归还。
+    """
+    # 0. 查询回答缓存（启用时）
+    cache = get_response_cache()
+    cache_key = index_version = None
+    if cache is not None:
+        cache_key = cache.make_key(retrieved_path, user_question, model_name, PROMPT_TEMPLATE_HASH)
+        index_version = get_snapshot().version
+        cached_chunks = cache.get(cache_key, index_version)
+        if cached_chunks is not None:
+            logging.info("回答缓存命中，跳过LLM调用。")
+            CACHE_EVENTS.inc(cache="response", result="hit")
+            return _replay(cached_chunks)
+        CACHE_EVENTS.inc(cache="response", result="miss")
+
+    # 1. 需要调用LLM: 获取名额（队列已满或等待超时时抛出 AdmissionRejected）
+    slot = await admission.acquire() if admission is not None else None
+    chunks = _generate(retrieved_path, retrieved_subtree, user_question, model_name,
+                       cache, cache_key, index_version, slot)
+    if slot is not None:
+        # 生成器未开始迭代就被关闭时其 finally 不会执行，被回收时兜底归还名额
+        weakref.finalize(chunks, slot.release)
+    return chunks
+
+
+async def _replay(cached_chunks) -> AsyncIterator[str]:
+    for chunk in cached_chunks:
+        yield chunk
+
+
+async def _generate(retrieved_path: str, retrieved_subtree, user_question: str, model_name: str,
+                    cache, cache_key, index_version, slot: Optional[AdmissionSlot]) -> AsyncIterator[str]:
+    """
+    调用LLM生成回答。完整生成且未出错的回答会写入缓存（中途出错或调用方提前停止迭代时不会写入）；
+    结束或被关闭时归还 slot。
+    """
+    try:
+        # 构建提示
+        with stage_timer("build_prompt"):
+            prompt = build_prompt(retrieved_path, retrieved_subtree, user_question)
+        # 完整提示词可能有数百KB，只在 DEBUG 级别或被抽样时记录（延迟截断）
+        if payload_enabled():
+            logging.info("构建的提示（%d 字符）: \n%s", len(prompt), Truncated(prompt))
+
+        # 迭代LLM流，记录首个 token 的耗时和输出速度
+        collected = [] if cache is not None else None
+        start = time.perf_counter()
+        first_token_at = None
+        output_tokens = 0
+        failed = False
+        async for chunk in get_llm_stream(prompt, model=model_name):
+            if chunk: # 确保内容不为空
+                if chunk.startswith(LLM_ERROR_PREFIX):
+                    failed = True
+                    collected = None
+                else:
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                        STAGE_SECONDS.observe(first_token_at - start, stage="llm_first_token")
+                    output_tokens += estimate_tokens(chunk)
+                    if collected is not None:
+                        collected.append(chunk)
+                yield chunk
+
+        end = time.perf_counter()
+        STAGE_SECONDS.observe(end - start, stage="llm_total")
+        if failed:
+            ERRORS.inc(stage="llm")
+        if output_tokens:
+            LLM_OUTPUT_TOKENS.inc(output_tokens)
+            if end > first_token_at:
+                LLM_TOKENS_PER_SECOND.observe(output_tokens / (end - first_token_at))
+
+        # 完整生成的回答写入缓存
+        if collected:
+            cache.put(cache_key, collected, index_version)
+    finally:
+        if slot is not None:
+            slot.release()
+
+
+async def generate_answer(retrieved_path: str, retrieved_subtree, user_question: str,
+                          model_name: str) -> AsyncIterator[str]:
+    """根据检索到的上下文生成回答，逐块返回文本（含回答缓存，不经过准入控制）。"""
+    chunks = await start_answer(retrieved_path, retrieved_subtree, user_question, model_name)
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        await chunks.aclose()
+
+
+async def answer_question(user_question: str, model_name: str) -> Tuple[Optional[str], str]:
+    """
+    非流式地回答一个问题：检索上下文并生成完整回答。
+
+    Returns:
+        tuple[str | None, str]: (知识路径, 回答文本)；未检索到上下文时知识路径为 None，
+        回答为 NOT_FOUND_MESSAGE。
+    """
+    retrieved_path, retrieved_subtree = await aget_context_from_retrieval(user_question)
+    if not retrieved_path or not retrieved_subtree:
+        return None, NOT_FOUND_MESSAGE
+    chunks = [chunk async for chunk in generate_answer(retrieved_path, retrieved_subtree, user_question, model_name)]
+    return retrieved_path, "".join(chunks)
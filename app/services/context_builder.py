@@ -0,0 +1,202 @@
+import logging
+from typing import List, Optional
+
+import numpy as np
+
+from app.utils.text import estimate_tokens
+
+# 基于 token 预算的上下文构建。
+# 命中高层节点（如顶层编码 "02"）时完整子树可能非常大，既拉长预填充时间，也可能超出模型上下文。
+# 这里按广度优先逐层展开子树，每层按与查询向量的相似度挑选分支，预算用尽后以摘要节点代替其余分支。
+
+# 每个节点在 indent=2 的JSON中除 name/desc 文本和缩进外的固定字符数（键名、引号、括号等）的估算
+NODE_SYNTAX_CHARS = 36
+# indent=2 时每个节点占约 6 行，每深一层每行多缩进 4 个空格
+NODE_LINES = 6
+# 摘要节点中最多列出的被省略分支名称数
+SUMMARY_MAX_NAMES = 8
+# 为摘要节点预留的预算比例
+SUMMARY_RESERVE_RATIO = 0.1
+# 多结果上下文中，剩余预算低于该比例时不再纳入排名靠后的结果
+MIN_RESULT_BUDGET_RATIO = 0.1
+
+
+class PrunedSubtree(dict):
+    """
+    经过预算裁剪的子树。与查询相关，因此不能按知识路径缓存其序列化结果。
+    本身就是普通 dict，可直接 json.dumps。
+    """
+
+
+class MergedContext(list):
+    """
+    多个检索结果的子树，按相关性排列，可直接 json.dumps。
+    pruned 为 True 时其中包含按预算裁剪过的子树，与查询相关，不能按知识路径缓存其序列化结果。
+    """
+
+    def __init__(self, subtrees=(), pruned: bool = False):
+        super().__init__(subtrees)
+        self.pruned = pruned
+
+
+def is_query_specific(subtree) -> bool:
+    """上下文是否经过与查询相关的裁剪（此时不能按知识路径缓存序列化结果）。"""
+    return isinstance(subtree, PrunedSubtree) or getattr(subtree, 'pruned', False)
+
+
+def collapse_paths(path_ids: List[str]) -> List[str]:
+    """
+    合并互为祖先/后代的检索结果（路径ID）：保留祖先路径（其子树已包含后代节点），
+    合并后的结果排在组内最靠前的名次上；重复的路径只保留一次。
+    """
+    kept: List[str] = []
+    for path_id in path_ids:
+        if any(path_id == p or path_id.startswith(p + '>') for p in kept):
+            continue
+        descendants = [i for i, p in enumerate(kept) if p.startswith(path_id + '>')]
+        if descendants:
+            # 祖先取代名次最靠前的后代，其余后代被合并
+            kept[descendants[0]] = path_id
+            for i in reversed(descendants[1:]):
+                del kept[i]
+        else:
+            kept.append(path_id)
+    return kept
+
+
+def _node_cost(name: str, desc: str, depth: int) -> int:
+    """估算一个节点（不含子节点）序列化后的 token 数，depth 为相对子树根的深度。"""
+    structure = NODE_SYNTAX_CHARS + NODE_LINES * (4 * depth + 2)
+    return estimate_tokens(name) + estimate_tokens(desc) + (structure + 3) // 4
+
+
+def estimate_subtree_tokens(subtree: dict, limit: Optional[int] = None) -> int:
+    """
+    由各节点的 name/desc 估算子树按 indent=2 序列化后的 token 数，无需实际 json.dumps。
+
+    估算值略高于序列化结果的实际估算值（偏保守）。传入 limit 时，累计超过 limit 即停止遍历
+    并返回当前累计值，用于只需判断子树是否超出预算的场合。
+    """
+    total = 0
+    stack = [(subtree, 0)]
+    while stack:
+        node, depth = stack.pop()
+        total += _node_cost(node.get('name', ''), node.get('desc', ''), depth)
+        if limit is not None and total > limit:
+            break
+        for child in node.get('child') or []:
+            if isinstance(child, dict):
+                stack.append((child, depth + 1))
+    return total
+
+
+def _rank(candidates: List[tuple], query_vector, backend) -> List[tuple]:
+    """按候选节点与查询向量的余弦相似度降序排列；无法取得向量时保持原顺序。"""
+    if query_vector is None or backend is None or len(candidates) <= 1:
+        return candidates
+    try:
+        vectors = backend.get_embeddings([c[0] for c in candidates])
+    except Exception as e:
+        logging.warning(f"获取节点向量失败，按原顺序裁剪子树: {e}")
+        return candidates
+    if not vectors:
+        return candidates
+    q = np.asarray(query_vector, dtype=np.float32)
+    norm = np.linalg.norm(q)
+    if norm:
+        q = q / norm
+    # 没有向量的节点排在最后，同分时保持原顺序
+    scored = [
+        (float(np.dot(vectors[c[0]], q)) if c[0] in vectors else float('-inf'), i, c)
+        for i, c in enumerate(candidates)
+    ]
+    scored.sort(key=lambda x: (-x[0], x[1]))
+    return [c for _, _, c in scored]
+
+
+def _summary_node(omitted: List[dict]) -> dict:
+    names = [n.get('name', '') for n in omitted[:SUMMARY_MAX_NAMES]]
+    more = '等' if len(omitted) > SUMMARY_MAX_NAMES else ''
+    return {
+        'name': f"（另有 {len(omitted)} 个分支因篇幅省略）",
+        'desc': f"省略的分支: {'、'.join(names)}{more}",
+        'child': [],
+    }
+
+
+def prune_subtree(path_id: str, subtree: dict, budget_tokens: int,
+                  query_vector: Optional[List[float]] = None, backend=None) -> PrunedSubtree:
+    """
+    在 token 预算内广度优先地展开子树。
+
+    根节点总是保留；之后逐层收集已保留节点的子节点，按与查询向量的相似度（使用向量后端中
+    已存储的节点向量）从高到低纳入，直到预算用尽。未纳入的分支在其父节点下以一个摘要节点代替，
+    摘要中列出部分被省略的分支名称。
+
+    Args:
+        path_id (str): 子树根节点的路径ID，用于推导子节点的路径ID以查询向量。
+        subtree (dict): 完整子树（name/desc/child 结构）。
+        budget_tokens (int): 子树序列化后的 token 预算（估算值）。
+        query_vector: 查询向量；为 None 时按原顺序纳入。
+        backend: 向量后端（需实现 get_embeddings）。
+    """
+    root = PrunedSubtree(name=subtree.get('name', ''), desc=subtree.get('desc', ''), child=[])
+    used = _node_cost(root['name'], root['desc'], 0)
+    # 展开节点时预留一部分预算给摘要节点
+    node_budget = budget_tokens - int(budget_tokens * SUMMARY_RESERVE_RATIO)
+    # frontier 中的元素: (原节点, 输出节点, 路径ID)
+    frontier = [(subtree, root, path_id)]
+    depth = 0
+    kept = 1
+    omitted_total = 0
+
+    while frontier:
+        # 收集本层的全部候选子节点: (路径ID, 原节点, 父输出节点)
+        candidates = []
+        for node, out, node_path in frontier:
+            for child in node.get('child') or []:
+                if isinstance(child, dict) and child.get('name'):
+                    candidates.append((f"{node_path}>{child['name']}", child, out))
+        if not candidates:
+            break
+
+        depth += 1
+        next_frontier = []
+        omitted = {}
+        exhausted = False
+        for child_path, child, parent_out in _rank(candidates, query_vector, backend):
+            cost = _node_cost(child['name'], child.get('desc', ''), depth)
+            if exhausted or used + cost > node_budget:
+                exhausted = True
+                omitted.setdefault(id(parent_out), (parent_out, []))[1].append(child)
+                continue
+            used += cost
+            kept += 1
+            child_out = {'name': child['name'], 'desc': child.get('desc', ''), 'child': []}
+            parent_out['child'].append(child_out)
+            next_frontier.append((child, child_out, child_path))
+
+        if omitted:
+            # 预算已用尽，不再展开更深的层级；已保留节点的子节点同样以摘要代替
+            summaries = [(parent_out, children, depth) for parent_out, children in omitted.values()]
+            for child, child_out, _ in next_frontier:
+                grandchildren = [c for c in child.get('child') or [] if isinstance(c, dict) and c.get('name')]
+                if grandchildren:
+                    summaries.append((child_out, grandchildren, depth + 1))
+            for parent_out, children, summary_depth in summaries:
+                omitted_total += len(children)
+                summary = _summary_node(children)
+                cost = _node_cost(summary['name'], summary['desc'], summary_depth)
+                # 预留预算也不够时只省略、不再附加摘要
+                if used + cost <= budget_tokens:
+                    used += cost
+                    parent_out['child'].append(summary)
+            break
+        frontier = next_frontier
+
+    logging.info(
+        f"子树 '{path_id}' 超出上下文预算，裁剪后保留 {kept} 个节点，省略 {omitted_total} 个分支"
+        f"（约 {used}/{budget_tokens} tokens）。"
+    )
+    return root
+
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+# 查询向量的微批处理。
+# 高并发时每个请求各自发送 input=[query] 会让Embedding服务承担大量小请求；
+# 这里把短时间窗口内到达的查询合并成一次 embeddings.create 调用，再把向量分发回各个请求。
+
+
+class EmbeddingBatcher:
+    """
+    将并发的查询向量化请求合并为批量请求。
+
+    第一个查询到达后开始计时，窗口（window_ms）结束或攒够 max_batch 个查询时立即发送。
+    同一批次中的重复文本只发送一次。批次失败时，该批次内的所有等待者都会收到同一个异常。
+
+    Args:
+        client: AsyncOpenAI 客户端。
+        model (str): Embedding 模型名称。
+        window_ms (float): 合并窗口（毫秒）。
+        max_batch (int): 单个批次的最大查询数。
+    """
+
+    def __init__(self, client, model: str, window_ms: float, max_batch: int):
+        self.client = client
+        self.model = model
+        self.window = window_ms / 1000
+        self.max_batch = max(1, max_batch)
+        self._pending: List[tuple] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set = set()
+        self._stats = {"requests": 0, "batches": 0, "inputs": 0}
+
+    async def embed(self, text: str) -> List[float]:
+        """提交一个查询并等待其所在批次返回向量。"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        self._stats["requests"] += 1
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        # 保留任务引用，避免在完成前被垃圾回收
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[tuple]):
+        # 同一批次内的重复文本只请求一次
+        positions: Dict[str, int] = {}
+        inputs: List[str] = []
+        for text, _ in batch:
+            if text not in positions:
+                positions[text] = len(inputs)
+                inputs.append(text)
+        self._stats["batches"] += 1
+        self._stats["inputs"] += len(inputs)
+        try:
+            response = await self.client.embeddings.create(input=inputs, model=self.model)
+            vectors = [None] * len(inputs)
+            for i, item in enumerate(response.data):
+                vector = getattr(item, 'embedding', None)
+                if vector is None and isinstance(item, dict):
+                    vector = item.get('embedding')
+                index = getattr(item, 'index', None)
+                vectors[index if isinstance(index, int) else i] = vector
+        except Exception as e:
+            logging.error(f"批量查询向量化失败（{len(inputs)} 条）: {e}")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors[positions[text]])
+
+    def stats(self) -> dict:
+        """返回已处理的请求数、批次数和平均批大小。"""
+        stats = dict(self._stats)
+        stats["avg_batch_size"] = round(stats["inputs"] / stats["batches"], 2) if stats["batches"] else 0.0
+        return stats
@@ -0,0 +1,177 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+# 查询向量缓存。
+# 技术人员会反复提出相同的诊断问题，缓存命中时可以省去一次到Embedding服务的往返。
+# 内存层为带 TTL 的 LRU；可选的磁盘层使用 SQLite，进程重启后依然有效。
+
+
+def normalize_query(text: str) -> str:
+    """规范化查询文本：NFKC（全角转半角等）、去除首尾空白、合并连续空白、英文小写。"""
+    text = unicodedata.normalize('NFKC', text)
+    return ' '.join(text.split()).lower()
+
+
+class EmbeddingCache:
+    """
+    线程安全的查询向量缓存，键为 (Embedding 模型, 规范化后的查询文本)。
+    get/put 同时访问两层；异步调用方应在事件循环中只使用 get_memory/put_memory，
+    把 get_disk/put_disk 交给线程池执行。
+
+    Args:
+        model (str): Embedding 模型名称，模型变化时缓存自然失效。
+        max_entries (int): 内存层最多保留的条目数，超出时淘汰最久未使用的条目。
+        ttl_seconds (float): 条目有效期（秒），0 表示不过期。
+        persist_path (str | Path | None): SQLite 文件路径，为空时不启用磁盘层。
+    """
+
+    def __init__(self, model: str, max_entries: int, ttl_seconds: float = 0, persist_path=None):
+        self.model = model
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # SQLite 访问单独加锁，磁盘 IO 期间不阻塞内存层
+        self._db_lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        self._db = None
+        if persist_path:
+            try:
+                self._db = sqlite3.connect(str(persist_path), check_same_thread=False)
+                self._db.execute(
+                    "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                    "key TEXT PRIMARY KEY, created REAL NOT NULL, vector BLOB NOT NULL)"
+                )
+                self._db.commit()
+            except Exception as e:
+                logging.error(f"无法打开查询向量磁盘缓存 {persist_path}: {e}")
+                self._db = None
+
+    def _key(self, text: str) -> str:
+        raw = f"{self.model}\x00{normalize_query(text)}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _expired(self, created: float, now: float) -> bool:
+        return bool(self.ttl_seconds) and now - created > self.ttl_seconds
+
+    @property
+    def has_disk(self) -> bool:
+        """是否启用了磁盘层。"""
+        return self._db is not None
+
+    def get(self, text: str) -> Optional[List[float]]:
+        """返回缓存的向量（先查内存层，再查磁盘层）；未命中或已过期时返回 None。"""
+        vector = self.get_memory(text)
+        if vector is None and self.has_disk:
+            vector = self.get_disk(text)
+        return vector
+
+    def get_memory(self, text: str) -> Optional[List[float]]:
+        """
+        只查内存层，不做任何磁盘 IO，可在事件循环中直接调用。
+        启用磁盘层时未命中不计入 misses，由随后的 get_disk 计数。
+        """
+        key = self._key(text)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, vector = entry
+                if not self._expired(created, now):
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return vector
+                del self._entries[key]
+                self._stats["expirations"] += 1
+            if self._db is None:
+                self._stats["misses"] += 1
+            return None
+
+    def get_disk(self, text: str) -> Optional[List[float]]:
+        """查磁盘层（阻塞的 SQLite 查询），命中时回填内存层。"""
+        key = self._key(text)
+        now = time.time()
+        row = None
+        with self._db_lock:
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT created, vector FROM query_embeddings WHERE key = ?", (key,)
+                    ).fetchone()
+                except Exception as e:
+                    logging.warning(f"读取查询向量磁盘缓存失败: {e}")
+        with self._lock:
+            if row is not None and not self._expired(row[0], now):
+                vector = array('f')
+                vector.frombytes(row[1])
+                vector = vector.tolist()
+                self._store(key, row[0], vector)
+                self._stats["disk_hits"] += 1
+                return vector
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, text: str, vector: List[float]):
+        """写入缓存（内存层，以及启用时的磁盘层）。"""
+        self.put_memory(text, vector)
+        if self.has_disk:
+            self.put_disk(text, vector)
+
+    def put_memory(self, text: str, vector: List[float]):
+        """只写入内存层，可在事件循环中直接调用。"""
+        if not vector or self.max_entries <= 0:
+            return
+        key = self._key(text)
+        with self._lock:
+            self._store(key, time.time(), vector)
+
+    def put_disk(self, text: str, vector: List[float]):
+        """写入磁盘层（阻塞的 SQLite 写入和提交）。"""
+        if not vector or self.max_entries <= 0:
+            return
+        key = self._key(text)
+        with self._db_lock:
+            if self._db is None:
+                return
+            try:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (key, created, vector) VALUES (?, ?, ?)",
+                    (key, time.time(), array('f', vector).tobytes()),
+                )
+                self._db.commit()
+            except Exception as e:
+                logging.warning(f"写入查询向量磁盘缓存失败: {e}")
+
+    def _store(self, key: str, created: float, vector: List[float]):
+        self._entries[key] = (created, vector)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def clear(self):
+        """清空内存层（磁盘层保留）。"""
+        with self._lock:
+            self._entries.clear()
+
+    def close(self):
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> dict:
+        """返回命中/未命中等计数以及当前条目数。"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        lookups = stats["hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,119 @@
+import logging
+from typing import Dict, Optional, Union
+
+import httpx
+from openai import DefaultAsyncHttpxClient, DefaultHttpxClient, Timeout
+
+from app.core import config
+from app.services.metrics import REGISTRY, Counter, GaugeFunc
+
+# Embedding / LLM 客户端共用的 HTTP 连接池配置。
+# OpenAI SDK 默认的 httpx 客户端使用默认连接上限和长达 10 分钟的读超时，突发流量下连接频繁建立、
+# 上游变慢时请求长时间挂起。这里按配置构建连接池、分阶段超时，并统计连接池状态。
+# 重试由 OpenAI SDK 负责（max_retries，指数退避并带随机抖动）。
+# 客户端基于 SDK 的 DefaultHttpxClient / DefaultAsyncHttpxClient 构建，与 SDK 自带客户端使用相同的传输实现。
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "rag_http_requests_total", "发往上游服务的 HTTP 请求数（含重试）。", ("client",)))
+
+# 已创建的连接池，按客户端名称登记，用于统计
+_pools: Dict[str, Union[DefaultHttpxClient, DefaultAsyncHttpxClient]] = {}
+
+
+def _http2_enabled() -> bool:
+    if not config.HTTP2_ENABLED:
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        logging.warning("HTTP2_ENABLED 已开启但未安装 h2（pip install 'httpx[http2]'），使用 HTTP/1.1。")
+        return False
+    return True
+
+
+def build_timeout(read_timeout: float) -> Timeout:
+    """分阶段超时：连接、读取（流式响应中为相邻数据块的最大间隔）、写入、等待连接池空闲连接。"""
+    return Timeout(
+        connect=config.HTTP_CONNECT_TIMEOUT,
+        read=read_timeout,
+        write=config.HTTP_WRITE_TIMEOUT,
+        pool=config.HTTP_POOL_TIMEOUT,
+    )
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=config.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=config.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.HTTP_KEEPALIVE_EXPIRY,
+    )
+
+
+def build_async_http_client(name: str, read_timeout: float) -> DefaultAsyncHttpxClient:
+    """构建异步 HTTP 客户端（传给 AsyncOpenAI 的 http_client），并登记到连接池统计中。"""
+
+    async def _count_request(request):
+        HTTP_REQUESTS.inc(client=name)
+
+    client = DefaultAsyncHttpxClient(
+        # http2 只在 https 上协商生效，明文 http 仍使用 HTTP/1.1
+        http2=_http2_enabled(),
+        limits=_limits(),
+        timeout=build_timeout(read_timeout),
+        event_hooks={"request": [_count_request]},
+    )
+    _pools[name] = client
+    return client
+
+
+def build_http_client(name: str, read_timeout: float) -> DefaultHttpxClient:
+    """构建同步 HTTP 客户端（传给 OpenAI 的 http_client），并登记到连接池统计中。"""
+
+    def _count_request(request):
+        HTTP_REQUESTS.inc(client=name)
+
+    client = DefaultHttpxClient(
+        http2=_http2_enabled(),
+        limits=_limits(),
+        timeout=build_timeout(read_timeout),
+        event_hooks={"request": [_count_request]},
+    )
+    _pools[name] = client
+    return client
+
+
+def pool_stats(name: Optional[str] = None) -> Dict[str, dict]:
+    """
+    返回各连接池的连接数：active（正在处理请求）、idle（空闲的长连接）、http2（HTTP/2 连接数）。
+    连接信息来自 httpcore 连接池，取不到时只返回已关闭标志。
+    """
+    stats = {}
+    for pool_name, client in list(_pools.items()):
+        if name is not None and pool_name != name:
+            continue
+        entry = {"active": 0, "idle": 0, "http2": 0, "closed": client.is_closed}
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        for connection in list(getattr(pool, "connections", None) or []):
+            if connection.is_idle():
+                entry["idle"] += 1
+            else:
+                entry["active"] += 1
+            if "HTTP/2" in repr(connection):
+                entry["http2"] += 1
+        stats[pool_name] = entry
+    return stats
+
+
+def _collect_connections():
+    values = {}
+    for pool_name, entry in pool_stats().items():
+        if entry["closed"]:
+            continue
+        values[(pool_name, "active")] = entry["active"]
+        values[(pool_name, "idle")] = entry["idle"]
+    return values
+
+
+REGISTRY.register(GaugeFunc(
+    "rag_http_pool_connections", "上游连接池中的连接数（active: 处理中，idle: 空闲长连接）。",
+    ("client", "state"), _collect_connections))
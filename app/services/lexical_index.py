@@ -0,0 +1,251 @@
+import json
+import logging
+import math
+import os
+import re
+import unicodedata
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 基于倒排索引的词法检索（BM25）。
+# 技术人员常直接输入准确的零件名或故障码（如 "点火线圈"、"02"），纯向量检索对这类查询的排序不稳定，
+# 且每个查询都需要一次Embedding请求。这里对节点的 name / desc 建立倒排索引：
+#   - 中文等非 ASCII 文字切分为相邻两字的 2-gram（无需分词词典），索引中同时保留单字；
+#   - 连续的字母数字（零件号、故障码）作为一个完整的词，不再切分；
+# 检索时 name 与 desc 分字段计算 BM25，name 字段加权。
+# 索引由索引脚本（build_lexical_index_file）生成，服务端随索引快照一起加载。
+
+# BM25 参数
+BM25_K1 = 1.2
+BM25_B = 0.75
+# name 字段的权重（相对 desc）
+NAME_FIELD_WEIGHT = 2.0
+
+_FIELDS = ("name", "desc")
+_ASCII_WORD = re.compile(r"[0-9a-z]+(?:[._\-/][0-9a-z]+)*")
+
+
+def normalize_text(text: str) -> str:
+    """全角转半角、转小写。"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+def normalize_name(text: str) -> str:
+    """用于名称精确匹配的规范化：在 normalize_text 基础上去掉空白与标点。"""
+    return "".join(ch for ch in normalize_text(text) if ch.isalnum())
+
+
+def tokenize(text: str, unigrams: bool = False) -> List[str]:
+    """
+    将文本切分为检索词: 连续的 ASCII 字母数字为一个词；其他文字按相邻两字切分为 2-gram，
+    长度为 1 的片段保留该字。标点和空白作为分隔符，2-gram 不跨越分隔符和 ASCII 词。
+
+    unigrams=True 时额外产出每个单字（建索引时使用）。查询时只用 2-gram：单字的倒排列表很长、
+    区分度低，只有查询片段本身只有一个字时才按单字检索。
+    """
+    text = normalize_text(text)
+    tokens: List[str] = []
+    run: List[str] = []
+
+    def _flush_run():
+        if unigrams or len(run) == 1:
+            tokens.extend(run)
+        if len(run) > 1:
+            tokens.extend(run[i] + run[i + 1] for i in range(len(run) - 1))
+        run.clear()
+
+    i = 0
+    length = len(text)
+    while i < length:
+        ch = text[i]
+        if ch.isascii() and ch.isalnum():
+            _flush_run()
+            match = _ASCII_WORD.match(text, i)
+            tokens.append(match.group())
+            i = match.end()
+            continue
+        if ch.isalnum():
+            run.append(ch)
+        else:
+            _flush_run()
+        i += 1
+    _flush_run()
+    return tokens
+
+
+class LexicalIndex:
+    """
+    name / desc 两个字段的 BM25 倒排索引（CSR 形式的 NumPy 数组）。
+
+    每个字段: offsets[t]:offsets[t+1] 为词 t 的倒排列表区间，docs 为文档下标，tfs 为词频，
+    lengths 为每个文档该字段的词数。names 用于名称精确匹配的快速路径。
+    """
+
+    def __init__(self, ids: List[str], names: List[str], vocab: List[str], fields: Dict[str, dict]):
+        self.ids = ids
+        self.names = names
+        self.vocab = {term: i for i, term in enumerate(vocab)}
+        self.fields = fields
+        # 每个字段的 BM25 长度归一化项 k1 * (1 - b + b * dl / avgdl)，与查询无关，预先计算
+        self._norms = {}
+        for field in _FIELDS:
+            lengths = fields[field]["lengths"]
+            avgdl = float(lengths.mean()) if len(lengths) else 0.0
+            self._norms[field] = (BM25_K1 * (1 - BM25_B + BM25_B * lengths / (avgdl or 1.0))).astype(np.float32)
+        # 规范化名称 -> 文档下标列表（同名节点可能出现在不同分支下）
+        self._by_name: Dict[str, List[int]] = defaultdict(list)
+        for doc, name in enumerate(names):
+            key = normalize_name(name)
+            if key:
+                self._by_name[key].append(doc)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, records: Iterable[Tuple[str, str, str]]) -> "LexicalIndex":
+        """由 (path_id, name, desc) 记录构建索引；重复的路径ID只保留第一次出现的节点。"""
+        ids: List[str] = []
+        names: List[str] = []
+        seen = set()
+        vocab: Dict[str, int] = {}
+        postings = {f: defaultdict(list) for f in _FIELDS}
+        lengths = {f: [] for f in _FIELDS}
+        for path_id, name, desc in records:
+            if path_id in seen:
+                continue
+            seen.add(path_id)
+            doc = len(ids)
+            ids.append(path_id)
+            names.append(name)
+            for field, text in (("name", name), ("desc", desc)):
+                tokens = tokenize(text, unigrams=True)
+                lengths[field].append(len(tokens))
+                counts: Dict[str, int] = defaultdict(int)
+                for token in tokens:
+                    counts[token] += 1
+                for token, tf in counts.items():
+                    term = vocab.setdefault(token, len(vocab))
+                    postings[field][term].append((doc, tf))
+
+        fields = {}
+        for field in _FIELDS:
+            offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+            for term, plist in postings[field].items():
+                offsets[term + 1] = len(plist)
+            np.cumsum(offsets, out=offsets)
+            docs = np.empty(int(offsets[-1]), dtype=np.int32)
+            tfs = np.empty(int(offsets[-1]), dtype=np.float32)
+            for term, plist in postings[field].items():
+                start = offsets[term]
+                docs[start:start + len(plist)] = [d for d, _ in plist]
+                tfs[start:start + len(plist)] = [tf for _, tf in plist]
+            fields[field] = {
+                "offsets": offsets, "docs": docs, "tfs": tfs,
+                "lengths": np.asarray(lengths[field], dtype=np.float32),
+            }
+        terms = [None] * len(vocab)
+        for token, term in vocab.items():
+            terms[term] = token
+        return cls(ids, names, terms, fields)
+
+    def save(self, path) -> Path:
+        """写入 .npz 文件（先写临时文件再原子替换）。"""
+        path = Path(path)
+        vocab = [None] * len(self.vocab)
+        for token, term in self.vocab.items():
+            vocab[term] = token
+        meta = json.dumps({"ids": self.ids, "names": self.names, "vocab": vocab}, ensure_ascii=False)
+        arrays = {"meta": np.frombuffer(meta.encode("utf-8"), dtype=np.uint8)}
+        for field, data in self.fields.items():
+            for key, value in data.items():
+                arrays[f"{field}_{key}"] = value
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, path)
+        return path
+
+    @classmethod
+    def load(cls, path) -> "LexicalIndex":
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            fields = {
+                field: {key: data[f"{field}_{key}"] for key in ("offsets", "docs", "tfs", "lengths")}
+                for field in _FIELDS
+            }
+        return cls(meta["ids"], meta["names"], meta["vocab"], fields)
+
+    def match_name(self, query: str) -> List[str]:
+        """返回名称与查询（忽略大小写、全半角、空白和标点）完全相同的节点路径ID。"""
+        key = normalize_name(query)
+        return [self.ids[doc] for doc in self._by_name.get(key, ())]
+
+    def idf(self, token: str) -> float:
+        """检索词的 IDF（按 name / desc 中较大的文档频率计算）；不在索引中的词返回 0。"""
+        term = self.vocab.get(token)
+        if term is None:
+            return 0.0
+        df = max(int(self.fields[f]["offsets"][term + 1] - self.fields[f]["offsets"][term]) for f in _FIELDS)
+        total = len(self.ids)
+        return math.log(1 + (total - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, n_results: int) -> List[Tuple[str, float]]:
+        """返回 BM25 得分最高的 n_results 个 (路径ID, 得分)，得分为 0 的文档不返回。"""
+        total = len(self.ids)
+        terms = {self.vocab[t] for t in tokenize(query) if t in self.vocab}
+        if not terms or total == 0 or n_results <= 0:
+            return []
+        scores = np.zeros(total, dtype=np.float64)
+        for field in _FIELDS:
+            data = self.fields[field]
+            weight = NAME_FIELD_WEIGHT if field == "name" else 1.0
+            offsets = data["offsets"]
+            doc_parts, tf_parts, idf_parts = [], [], []
+            for term in terms:
+                start, end = offsets[term], offsets[term + 1]
+                if start == end:
+                    continue
+                df = end - start
+                doc_parts.append(data["docs"][start:end])
+                tf_parts.append(data["tfs"][start:end])
+                idf_parts.append(np.full(df, weight * math.log(1 + (total - df + 0.5) / (df + 0.5)), dtype=np.float32))
+            if not doc_parts:
+                continue
+            # 所有查询词的倒排列表拼接后一次性按文档累加
+            docs = np.concatenate(doc_parts)
+            tfs = np.concatenate(tf_parts)
+            contrib = np.concatenate(idf_parts) * tfs * (BM25_K1 + 1) / (tfs + self._norms[field][docs])
+            scores += np.bincount(docs, weights=contrib, minlength=total)
+        k = min(n_results, int(np.count_nonzero(scores)))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k] if k < total else np.arange(total)
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in top if scores[i] > 0]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[Tuple[str, float]]:
+    """按 RRF（score = Σ 1 / (k + 名次)）融合多个排序结果，返回按得分降序的 (ID, 得分)。"""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: -x[1])
+
+
+def load_lexical_index(path) -> Optional[LexicalIndex]:
+    """加载词法索引；文件不存在或无法加载时返回 None（仅使用向量检索）。"""
+    try:
+        index = LexicalIndex.load(path)
+    except FileNotFoundError:
+        logging.warning(f"词法索引文件 {path} 不存在，请重新运行索引脚本。仅使用向量检索。")
+        return None
+    except Exception as e:
+        logging.error(f"加载词法索引失败，仅使用向量检索: {e}", exc_info=True)
+        return None
+    logging.info(f"已加载词法索引，共 {len(index)} 个节点、{len(index.vocab)} 个检索词。")
+    return index
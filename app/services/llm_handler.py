@@ -1,19 +1,40 @@
 import json
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
 from openai import AsyncOpenAI
 import logging
 from functools import lru_cache
+from typing import NamedTuple, Optional
 
 from app.core import config
+from app.services.context_builder import is_query_specific
+from app.services.http_clients import build_async_http_client, build_timeout
+from app.services.metrics import CACHE_EVENTS
+from app.utils.text import estimate_tokens
 
 # --- 客户端初始化 ---
 @lru_cache(maxsize=1)
 def get_llm_client():
-    """根据配置初始化并返回用于LLM的OpenAI客户端。"""
+    """
+    根据配置初始化并返回用于LLM的OpenAI客户端。
+    使用按配置调优的共享连接池和分阶段超时（见 http_clients），应用关闭时由 aclose_llm_client 关闭。
+    """
     return AsyncOpenAI(
         api_key=config.LLM_API_KEY,
-        base_url=config.LLM_API_BASE_URL
+        base_url=config.LLM_API_BASE_URL,
+        timeout=build_timeout(config.LLM_READ_TIMEOUT),
+        max_retries=config.LLM_CLIENT_MAX_RETRIES,
+        http_client=build_async_http_client("llm", config.LLM_READ_TIMEOUT),
     )
 
+async def aclose_llm_client():
+    """关闭LLM客户端及其连接池。"""
+    if get_llm_client.cache_info().currsize:
+        await get_llm_client().close()
+        get_llm_client.cache_clear()
+
 # --- 提示词模板 ---
 PROMPT_TEMPLATE = """
 ### 系统指令
@@ -35,13 +56,104 @@ PROMPT_TEMPLATE = """
 ### 你的回答
 """
 
-def build_prompt(retrieved_path: str, retrieved_subtree: dict, user_question: str) -> str:
+# 提示词模板的哈希，模板变化时回答缓存随之失效
+PROMPT_TEMPLATE_HASH = hashlib.sha1(PROMPT_TEMPLATE.encode('utf-8')).hexdigest()
+
+# LLM调用失败时在流中返回的错误信息前缀（此类回答不会被缓存）
+LLM_ERROR_PREFIX = "Error: Could not connect to the language model."
+
+# --- 上下文序列化缓存 ---
+
+class SerializedContext(NamedTuple):
+    """序列化后的知识子树及其估算 token 数。"""
+    text: str
+    tokens: int
+
+_context_cache: "OrderedDict[str, SerializedContext]" = OrderedDict()
+_context_cache_lock = threading.Lock()
+# 缓存中序列化文本占用的内存（字节，sys.getsizeof）
+_context_cache_bytes = 0
+# 缓存的代数，每次清空时递增；缓存中只保存当前代的序列化结果
+_context_generation = 0
+
+def serialize_subtree(retrieved_path: str, retrieved_subtree, use_cache: bool = True,
+                      generation: Optional[int] = None) -> SerializedContext:
+    """
+    将知识子树序列化为提示词中使用的JSON字符串，并按知识路径缓存。
+
+    靠近根的节点子树很大，每次请求都重新 json.dumps 代价较高；同一路径的子树在知识库
+    重新加载之前不会变化，因此缓存序列化结果（LRU，容量为 PROMPT_CONTEXT_CACHE_SIZE 条，
+    总大小不超过 PROMPT_CONTEXT_CACHE_MAX_BYTES；单条超过 PROMPT_CONTEXT_CACHE_MAX_ENTRY_BYTES 的不缓存）。
+    已经是字符串的子树视为预先序列化好的内容，直接使用。
+    与查询相关的内容（如按预算裁剪后的子树）应传入 use_cache=False，既不读也不写缓存。
+
+    只有传入 generation（子树所属索引快照的缓存代数）时才会写入缓存；generation 已过期
+    （知识库在此期间重新加载）时既不读也不写，避免旧快照的子树被缓存到新快照下。
+    """
+    if generation is not None and generation != _context_generation:
+        use_cache = False
+    if use_cache:
+        with _context_cache_lock:
+            cached = _context_cache.get(retrieved_path)
+            if cached is not None:
+                _context_cache.move_to_end(retrieved_path)
+        if cached is not None:
+            CACHE_EVENTS.inc(cache="context", result="hit")
+            return cached
+        CACHE_EVENTS.inc(cache="context", result="miss")
+
+    if isinstance(retrieved_subtree, str):
+        text = retrieved_subtree
+    else:
+        # 将子树JSON对象格式化为美观的字符串
+        text = json.dumps(retrieved_subtree, indent=2, ensure_ascii=False)
+    serialized = SerializedContext(text, estimate_tokens(text))
+
+    if use_cache and generation is not None and config.PROMPT_CONTEXT_CACHE_SIZE > 0:
+        _cache_context(retrieved_path, serialized, generation)
+    return serialized
+
+def _cache_context(retrieved_path: str, serialized: SerializedContext, generation: int):
+    """按条目数和字节数上限写入序列化缓存，超出时淘汰最久未使用的条目。"""
+    global _context_cache_bytes
+    size = sys.getsizeof(serialized.text)
+    max_bytes = config.PROMPT_CONTEXT_CACHE_MAX_BYTES
+    max_entry_bytes = config.PROMPT_CONTEXT_CACHE_MAX_ENTRY_BYTES
+    if (max_entry_bytes > 0 and size > max_entry_bytes) or (max_bytes > 0 and size > max_bytes):
+        return
+    with _context_cache_lock:
+        if generation != _context_generation:
+            return
+        previous = _context_cache.pop(retrieved_path, None)
+        if previous is not None:
+            _context_cache_bytes -= sys.getsizeof(previous.text)
+        _context_cache[retrieved_path] = serialized
+        _context_cache_bytes += size
+        while len(_context_cache) > config.PROMPT_CONTEXT_CACHE_SIZE or (
+            max_bytes > 0 and _context_cache_bytes > max_bytes
+        ):
+            _, evicted = _context_cache.popitem(last=False)
+            _context_cache_bytes -= sys.getsizeof(evicted.text)
+
+def clear_context_cache() -> int:
+    """清空上下文序列化缓存，在知识库重新加载时调用。返回新的缓存代数。"""
+    global _context_generation, _context_cache_bytes
+    with _context_cache_lock:
+        _context_cache.clear()
+        _context_cache_bytes = 0
+        _context_generation += 1
+        return _context_generation
+
+def build_prompt(retrieved_path: str, retrieved_subtree, user_question: str) -> str:
     """
     根据检索到的上下文和用户问题，构建最终的提示词。
+    检索阶段已按知识路径缓存了子树的序列化结果（见 serialize_subtree），这里直接复用；
+    按预算裁剪过的子树（包括含有裁剪子树的多结果上下文）与查询相关，不查缓存。
     """
-    # 将子树JSON对象格式化为美观的字符串
-    retrieved_subtree_json_string = json.dumps(retrieved_subtree, indent=2, ensure_ascii=False)
-    
+    retrieved_subtree_json_string = serialize_subtree(
+        retrieved_path, retrieved_subtree, use_cache=not is_query_specific(retrieved_subtree)
+    ).text
+
     prompt = PROMPT_TEMPLATE.format(
         retrieved_path=retrieved_path,
         retrieved_subtree_json_string=retrieved_subtree_json_string,
@@ -49,7 +161,16 @@ def build_prompt(retrieved_path: str, retrieved_subtree: dict, user_question: st
     )
     return prompt
 
-from typing import Optional
+def get_max_output_tokens(prompt: str) -> int:
+    """
+    返回本次生成的 max_tokens：默认为 LLM_MAX_TOKENS；配置了 LLM_CONTEXT_WINDOW 时，
+    进一步限制为上下文窗口减去提示词的估算 token 数，避免请求超出模型上下文。
+    """
+    max_tokens = config.LLM_MAX_TOKENS
+    if config.LLM_CONTEXT_WINDOW > 0:
+        remaining = config.LLM_CONTEXT_WINDOW - estimate_tokens(prompt)
+        max_tokens = max(1, min(max_tokens, remaining))
+    return max_tokens
 
 async def get_llm_stream(prompt: str, model: Optional[str] = None):
     """
@@ -59,13 +180,14 @@ async def get_llm_stream(prompt: str, model: Optional[str] = None):
         str: 从LLM返回的响应内容块。
     """
     client = get_llm_client()
+    stream = None
     try:
         stream = await client.chat.completions.create(
             model=model or config.LLM_MODEL,
             messages=[{"role": "system", "content": prompt}],
             stream=True,
             temperature=0.7, # 可以根据需要调整
-            max_tokens=20000, # 限制最大输出长度
+            max_tokens=get_max_output_tokens(prompt), # 限制最大输出长度
             extra_body={
                 "chat_template_kwargs": {
                     "enable_thinking": False  # 启用思考模式
@@ -79,4 +201,8 @@ async def get_llm_stream(prompt: str, model: Optional[str] = None):
     except Exception as e:
         logging.error(f"调用LLM API失败: {e}")
         # 在流中产生一个错误信息，以便客户端可以优雅地处理
-        yield f"Error: Could not connect to the language model. Details: {e}"
+        yield f"{LLM_ERROR_PREFIX} Details: {e}"
+    finally:
+        # 调用方提前停止迭代（如客户端断开）时立即关闭上游流，vLLM 随之中止生成并释放连接
+        if stream is not None:
+            await stream.close()
@@ -0,0 +1,175 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Sequence, Tuple
+
+# 进程内指标，以 Prometheus 文本格式在 /metrics 暴露。
+# 只实现本服务用到的计数器和直方图，避免引入额外依赖；所有操作都是线程安全的，
+# 检索线程池和事件循环都可以直接记录。
+
+# 默认的耗时分桶（秒），覆盖从缓存命中（亚毫秒）到长回答（分钟级）的范围
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """单调递增的计数器。"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """固定分桶的直方图，输出 _bucket / _sum / _count 三组序列。"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签: [各分桶计数（非累积）..., 超出最大分桶的计数], 总和
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def count(self, **labels) -> int:
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            return sum(series[0]) if series else 0
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._series.items())
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class GaugeFunc:
+    """取值时才计算的仪表，callback 返回 {标签值元组: 数值}。"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str], callback):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for key, value in sorted(self.callback().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    """指标注册表，render() 返回 Prometheus 文本格式（text/plain; version=0.0.4）。"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    "rag_requests_total", "按响应方式和结果统计的聊天请求数。", ("mode", "status")))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "rag_request_duration_seconds", "聊天请求从收到到响应结束的耗时。", ("mode",)))
+FIRST_CHUNK_SECONDS = REGISTRY.register(Histogram(
+    "rag_time_to_first_chunk_seconds", "从收到请求到发出第一个回答块的耗时。", ("mode",)))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "rag_stage_duration_seconds",
+    "各处理阶段的耗时（embed、vector_search、lexical_search、find_node、serialize、prune、build_prompt、llm_first_token、llm_total）。",
+    ("stage",)))
+LLM_TOKENS_PER_SECOND = REGISTRY.register(Histogram(
+    "rag_llm_tokens_per_second", "LLM首个 token 之后的输出速度（按估算 token 数）。",
+    buckets=(1, 5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500)))
+LLM_OUTPUT_TOKENS = REGISTRY.register(Counter(
+    "rag_llm_output_tokens_total", "LLM输出的估算 token 总数。"))
+CACHE_EVENTS = REGISTRY.register(Counter(
+    "rag_cache_events_total", "缓存命中与未命中次数。", ("cache", "result")))
+RETRIEVALS = REGISTRY.register(Counter(
+    "rag_retrievals_total", "按检索方式统计的检索次数（exact_name、hybrid、vector、lexical、session）。", ("method",)))
+ERRORS = REGISTRY.register(Counter(
+    "rag_errors_total", "各处理阶段发生的错误数。", ("stage",)))
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """记录 with 块的耗时到 rag_stage_duration_seconds{stage=...}；块内抛出异常时同时计入错误数。"""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage)
+
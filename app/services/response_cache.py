@@ -0,0 +1,105 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Hashable, List, Optional
+
+from app.core import config
+from app.services.embedding_cache import normalize_query
+
+# 完整回答缓存（默认关闭）。
+# 很多请求会命中同一个知识路径、提出几乎相同的问题；命中时直接回放缓存的回答块，
+# 无需再次调用LLM。知识库重新索引后（索引版本变化）缓存整体失效。
+
+
+class ResponseCache:
+    """
+    按总字节数限制大小的 LRU 回答缓存。
+
+    Args:
+        max_bytes (int): 缓存回答的 UTF-8 总字节数上限，超出时淘汰最久未使用的条目。
+        ttl_seconds (float): 条目有效期（秒），0 表示不过期。
+    """
+
+    def __init__(self, max_bytes: int, ttl_seconds: float = 0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._version: Optional[Hashable] = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def make_key(retrieved_path: str, question: str, model: str, template_hash: str) -> str:
+        """由知识路径、规范化后的问题、模型名和提示词模板哈希生成缓存键。"""
+        raw = "\x00".join([retrieved_path, normalize_query(question), model, template_hash])
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _check_version(self, version: Hashable):
+        # 调用方需持有锁
+        if version != self._version:
+            if self._entries:
+                self._stats["invalidations"] += 1
+                logging.info("知识库索引已更新，清空回答缓存。")
+            self._entries.clear()
+            self._bytes = 0
+            self._version = version
+
+    def get(self, key: str, version: Hashable) -> Optional[List[str]]:
+        """返回缓存的回答块列表；未命中、已过期或索引版本已变化时返回 None。"""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, size, chunks = entry
+                if not self.ttl_seconds or time.time() - created <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return chunks
+                del self._entries[key]
+                self._bytes -= size
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, chunks: List[str], version: Hashable):
+        """写入一个完整的回答；超过总容量的单个回答不会被缓存。"""
+        size = sum(len(c.encode('utf-8')) for c in chunks)
+        if not chunks or size > self.max_bytes:
+            return
+        with self._lock:
+            self._check_version(version)
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (time.time(), size, list(chunks))
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            stats["bytes"] = self._bytes
+        return stats
+
+
+@lru_cache(maxsize=1)
+def get_response_cache() -> Optional[ResponseCache]:
+    """返回进程内的回答缓存；RESPONSE_CACHE_ENABLED 未开启时返回 None。"""
+    if not config.RESPONSE_CACHE_ENABLED:
+        return None
+    return ResponseCache(
+        max_bytes=config.RESPONSE_CACHE_MAX_BYTES,
+        ttl_seconds=config.RESPONSE_CACHE_TTL,
+    )
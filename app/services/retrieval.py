@@ -1,21 +1,62 @@
-import json
+import os
+import time
+import asyncio
+import contextvars
+import threading
 import chromadb
-from openai import OpenAI
+from concurrent.futures import ThreadPoolExecutor
+from openai import OpenAI, AsyncOpenAI
 from functools import lru_cache
 import logging
-from typing import List
+from typing import List, NamedTuple, Optional
 
 from app.core import config
+from app.core.log import LazyJson, Truncated, payload_enabled
+from app.services.embedding_batcher import EmbeddingBatcher
+from app.services.context_builder import (
+    MIN_RESULT_BUDGET_RATIO, MergedContext, collapse_paths, estimate_subtree_tokens, prune_subtree
+)
+from app.services.embedding_cache import EmbeddingCache
+from app.services.lexical_index import LexicalIndex, load_lexical_index, reciprocal_rank_fusion
+from app.services.http_clients import build_async_http_client, build_http_client, build_timeout
+from app.services.llm_handler import aclose_llm_client, clear_context_cache, serialize_subtree
+from app.services.metrics import CACHE_EVENTS, RETRIEVALS, stage_timer
+from app.services.response_cache import get_response_cache
+from app.services.session_cache import SessionContext, get_session_cache
+from app.services.tree_store import DictTree, load_tree
+from app.services.vector_store import ChromaBackend, NumpyBackend, VectorBackend
 
 # --- 缓存管理 ---
 
 def clear_caches():
     """清除所有缓存，用于开发和调试"""
+    global _snapshot
     get_embedding_client.cache_clear()
+    get_async_embedding_client.cache_clear()
+    get_embedding_batcher.cache_clear()
     get_chroma_collection.cache_clear()
-    get_knowledge_base.cache_clear()
+    with _snapshot_lock:
+        _snapshot = None
+    get_embedding_cache.cache_clear()
+    get_response_cache.cache_clear()
+    get_session_cache.cache_clear()
+    clear_context_cache()
     logging.info("已清除所有缓存")
 
+def get_index_version():
+    """
+    返回磁盘上知识库与索引的版本标识（知识库文件、索引清单、编译的知识库、向量矩阵和词法索引的修改时间）。
+    每次运行索引脚本后都会变化，用于判断是否需要重新加载索引快照。
+    """
+    version = []
+    for path in (config.KNOWLEDGE_BASE_FILE, config.INDEX_MANIFEST_FILE,
+                 config.KNOWLEDGE_BASE_TREE_FILE, config.VECTOR_MATRIX_FILE, config.LEXICAL_INDEX_FILE):
+        try:
+            version.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            version.append(None)
+    return tuple(version)
+
 # --- 客户端初始化 ---
 
 @lru_cache(maxsize=1)
@@ -23,9 +64,67 @@ def get_embedding_client():
     """根据配置初始化并返回用于Embedding的OpenAI客户端。"""
     return OpenAI(
         api_key=config.EMBEDDING_API_KEY,
-        base_url=config.EMBEDDING_API_BASE_URL
+        base_url=config.EMBEDDING_API_BASE_URL,
+        timeout=build_timeout(config.EMBEDDING_READ_TIMEOUT),
+        max_retries=config.EMBEDDING_CLIENT_MAX_RETRIES,
+        http_client=build_http_client("embedding_sync", config.EMBEDDING_READ_TIMEOUT),
+    )
+
+@lru_cache(maxsize=1)
+def get_async_embedding_client():
+    """
+    返回进程内共享的异步Embedding客户端。
+    所有请求复用同一个客户端及其 HTTP 连接池（按配置调优，见 http_clients），
+    而不是各自占用一个线程做同步请求。
+    """
+    return AsyncOpenAI(
+        api_key=config.EMBEDDING_API_KEY,
+        base_url=config.EMBEDDING_API_BASE_URL,
+        timeout=build_timeout(config.EMBEDDING_READ_TIMEOUT),
+        max_retries=config.EMBEDDING_CLIENT_MAX_RETRIES,
+        http_client=build_async_http_client("embedding", config.EMBEDDING_READ_TIMEOUT),
+    )
+
+@lru_cache(maxsize=1)
+def get_embedding_batcher():
+    """
+    返回查询向量的微批处理器；QUERY_BATCH_WINDOW_MS 为 0 时禁用并返回 None。
+    并发到达的查询会在窗口内合并为一次Embedding请求。
+    """
+    if config.QUERY_BATCH_WINDOW_MS <= 0:
+        return None
+    return EmbeddingBatcher(
+        client=get_async_embedding_client(),
+        model=config.EMBEDDING_MODEL,
+        window_ms=config.QUERY_BATCH_WINDOW_MS,
+        max_batch=config.QUERY_BATCH_MAX_SIZE,
+    )
+
+@lru_cache(maxsize=1)
+def get_retrieval_executor():
+    """
+    返回专用于 ChromaDB 查询和子树提取的线程池。
+    与事件循环的默认线程池隔离，大小由 RETRIEVAL_EXECUTOR_WORKERS 配置。
+    """
+    return ThreadPoolExecutor(
+        max_workers=config.RETRIEVAL_EXECUTOR_WORKERS,
+        thread_name_prefix="retrieval"
     )
 
+async def aclose_clients():
+    """关闭 Embedding / LLM 客户端（及其连接池）和专用线程池，在应用关闭时调用。"""
+    if get_async_embedding_client.cache_info().currsize:
+        await get_async_embedding_client().close()
+        get_async_embedding_client.cache_clear()
+        get_embedding_batcher.cache_clear()
+    if get_embedding_client.cache_info().currsize:
+        get_embedding_client().close()
+        get_embedding_client.cache_clear()
+    await aclose_llm_client()
+    if get_retrieval_executor.cache_info().currsize:
+        get_retrieval_executor().shutdown(wait=False)
+        get_retrieval_executor.cache_clear()
+
 @lru_cache(maxsize=1)
 def get_chroma_collection():
     """初始化并返回ChromaDB集合（带缓存）。若不存在则创建。"""
@@ -35,148 +134,621 @@ def get_chroma_collection():
         metadata={"hnsw:space": "cosine"}
     )
 
-@lru_cache(maxsize=1)
-def get_knowledge_base():
-    """加载并缓存JSON知识库文件。"""
+def _load_vector_backend(allow_chroma: bool = True) -> Optional[VectorBackend]:
+    """
+    根据 VECTOR_BACKEND 加载向量检索后端。
+
+    numpy 后端从索引脚本导出的矩阵文件加载；文件缺失或无法加载时回退到 ChromaDB。
+    allow_chroma 为 False 时不回退（也不打开 ChromaDB），返回 None。
+    """
+    fallback = "回退到 ChromaDB。" if allow_chroma else ""
+    if config.VECTOR_BACKEND == "numpy":
+        try:
+            backend = NumpyBackend.load(config.VECTOR_MATRIX_FILE, config.VECTOR_META_FILE)
+            logging.info(f"已加载 NumPy 向量索引，共 {backend.count()} 条。")
+            return backend
+        except FileNotFoundError:
+            logging.warning(f"NumPy 向量文件 {config.VECTOR_MATRIX_FILE} 不存在，请重新运行索引脚本。{fallback}")
+        except Exception as e:
+            logging.error(f"加载 NumPy 向量索引失败。{fallback}{e}", exc_info=True)
+    elif config.VECTOR_BACKEND != "chroma":
+        logging.warning(f"未知的向量后端 '{config.VECTOR_BACKEND}'，使用 ChromaDB。")
+    if not allow_chroma:
+        return None
+    return ChromaBackend(get_chroma_collection())
+
+def _load_knowledge_base(strict: bool = False):
+    """
+    加载知识库。
+
+    默认（KNOWLEDGE_BASE_LOADER=compact）以流式方式解析JSON，只保留紧凑的扁平表示；
+    设置为 json 时完整加载为嵌套 dict 并构建路径索引；设置为 mmap 时映射索引脚本
+    编译的二进制文件，只在查找命中时读取所需的子树。
+
+    加载失败时: strict 为 False（启动时的首次加载）返回空知识库，使服务仍能启动；
+    strict 为 True（重新加载）时抛出异常，由调用方保留当前快照。
+    """
     try:
-        with open(config.KNOWLEDGE_BASE_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            if not isinstance(data, list):
-                logging.error(f"知识库根节点期望为列表，但得到: {type(data).__name__}")
-            return data
+        tree = load_tree(
+            config.KNOWLEDGE_BASE_FILE,
+            config.KNOWLEDGE_BASE_LOADER,
+            compiled_path=config.KNOWLEDGE_BASE_TREE_FILE,
+        )
+        logging.info(f"知识库加载完成（{type(tree).__name__}），共 {len(tree)} 个节点。")
+        return tree
     except FileNotFoundError:
+        if strict:
+            raise
         logging.error(f"知识库文件未找到: {config.KNOWLEDGE_BASE_FILE}")
-        return []
+        return DictTree([])
     except Exception as e:
+        if strict:
+            raise
         logging.error(f"加载知识库失败: {e}", exc_info=True)
-        return []
+        return DictTree([])
+
+# --- 索引快照与热重载 ---
+
+class IndexSnapshot(NamedTuple):
+    """
+    某一版本的知识库与向量索引。
+
+    请求在检索开始时取得当前快照，之后的向量检索和子树查找都在同一快照上完成；
+    重新加载时新快照在后台构建完成后整体替换，进行中的请求仍使用旧快照直到结束。
+    """
+    version: tuple
+    generation: int
+    tree: object
+    backend: VectorBackend
+    loaded_at: float
+    # 词法索引；未启用混合检索或索引文件不存在时为 None
+    lexical: Optional[LexicalIndex] = None
+
+_snapshot: Optional[IndexSnapshot] = None
+# 串行化快照的构建；请求读取当前快照时不需要加锁
+_snapshot_lock = threading.Lock()
+
+def _reset_chroma_system_cache() -> bool:
+    """
+    清除 ChromaDB 进程内按路径共享的实例缓存（不会停止旧实例，旧快照仍可继续查询）。
+
+    这是 ChromaDB 的非公开 API，不同版本中可能移动或改名；不可用时记录警告并返回 False，
+    此时重新打开的集合仍复用旧实例，可能看不到其他进程（索引脚本）写入的新向量。
+    """
+    try:
+        from chromadb.api.shared_system_client import SharedSystemClient
+        SharedSystemClient.clear_system_cache()
+        return True
+    except Exception as e:
+        logging.warning(
+            f"无法清除 ChromaDB 实例缓存（当前 chromadb 版本可能不支持）: {e}。"
+            "重载后的 ChromaDB 检索结果可能仍是旧索引，建议使用 VECTOR_BACKEND=numpy 或重启服务。"
+        )
+        return False
+
+def _lexical_index_needed() -> bool:
+    # 词法索引除混合检索外，还用于名称精确匹配和会话缓存的 IDF 加权打分（没有时所有词权重相同，
+    # “系统”、“故障”等常见词会让追问轻易达到复用阈值）
+    return config.HYBRID_SEARCH_ENABLED or config.EXACT_NAME_FAST_PATH or config.SESSION_CACHE_ENABLED
+
+def _build_snapshot(fresh: bool, allow_chroma: bool = True) -> Optional[IndexSnapshot]:
+    # 调用方需持有 _snapshot_lock。先记录版本再加载，加载期间若文件再次变化会触发下一次重载。
+    # fresh（重新加载）时知识库加载失败直接抛出异常，此前不改动任何共享状态，当前快照不受影响。
+    # allow_chroma 为 False 时只接受 NumPy 向量后端，加载失败时返回 None（不打开 ChromaDB）
+    version = get_index_version()
+    tree = _load_knowledge_base(strict=fresh)
+    if fresh:
+        # ChromaDB 在进程内按路径共享同一个实例，其 HNSW 索引不会感知其他进程的写入，
+        # 因此清除共享实例缓存后重新打开集合。
+        _reset_chroma_system_cache()
+        get_chroma_collection.cache_clear()
+    backend = _load_vector_backend(allow_chroma)
+    if backend is None:
+        return None
+    lexical = load_lexical_index(config.LEXICAL_INDEX_FILE) if _lexical_index_needed() else None
+    return IndexSnapshot(version, clear_context_cache(), tree, backend, time.time(), lexical)
+
+def get_snapshot() -> IndexSnapshot:
+    """返回当前的索引快照，首次调用时加载。"""
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = _build_snapshot(fresh=False)
+            snapshot = _snapshot
+    return snapshot
+
+def preload_snapshot() -> bool:
+    """
+    在 fork 出多个 worker 之前（主进程中）加载索引快照。worker 继承快照后不再重复加载，
+    其中的 NumPy 数组和 mmap 映射在各进程间共享物理内存（写时复制）。
+
+    ChromaDB 客户端（SQLite 连接与后台线程）不能跨 fork 使用，因此只在 NumPy 向量后端加载成功时
+    预加载；否则不打开 ChromaDB 并返回 False，由各 worker 启动时自行加载。
+    """
+    global _snapshot
+    if config.VECTOR_BACKEND != "numpy":
+        logging.warning("未使用 NumPy 向量后端，不在主进程中预加载索引，各 worker 将分别加载。")
+        return False
+    with _snapshot_lock:
+        if _snapshot is None:
+            _snapshot = _build_snapshot(fresh=False, allow_chroma=False)
+        if _snapshot is None:
+            logging.warning("NumPy 向量索引加载失败，不在主进程中预加载索引，各 worker 将分别加载。")
+            return False
+    return True
+
+def reload_snapshot(force: bool = False) -> bool:
+    """
+    磁盘上的索引版本变化（或 force=True）时构建新的索引快照并原子替换当前快照。
+    构建过程可能较慢，应在后台线程中调用。
+
+    已有快照时，新知识库加载失败（如文件被截断、JSON 语法错误）会抛出异常并保留当前快照，
+    不会用空知识库替换正在服务的索引。
+
+    Returns:
+        bool: 是否替换了快照。
+    """
+    global _snapshot
+    with _snapshot_lock:
+        current = _snapshot
+        if not force and current is not None and get_index_version() == current.version:
+            return False
+        start = time.perf_counter()
+        snapshot = _build_snapshot(fresh=current is not None)
+        _snapshot = snapshot
+    logging.info(
+        f"索引快照已切换（第 {snapshot.generation} 代，{len(snapshot.tree)} 个节点，"
+        f"{snapshot.backend.count()} 条向量），耗时 {time.perf_counter() - start:.2f}s。"
+    )
+    return True
+
+def _index_complete(version: tuple) -> bool:
+    # 索引脚本最后写入索引清单；清单比知识库文件旧说明索引尚未完成
+    kb_mtime, manifest_mtime = version[0], version[1]
+    return kb_mtime is None or manifest_mtime is None or manifest_mtime >= kb_mtime
+
+async def watch_index(interval: float):
+    """
+    后台轮询磁盘上的索引版本。版本变化、索引已完成且在一个轮询周期内保持不变后，
+    在线程中构建新快照并切换，不阻塞事件循环。
+    """
+    pending = None
+    # 加载失败的版本不再重试，直到磁盘上的文件再次变化
+    failed = None
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            current = _snapshot
+            version = get_index_version()
+            if (current is None or version == current.version or version == failed
+                    or not _index_complete(version)):
+                pending = None
+                continue
+            if version != pending:
+                # 等待下一个轮询周期，确认文件已写完
+                pending = version
+                continue
+            pending = None
+            try:
+                await asyncio.to_thread(reload_snapshot)
+            except Exception:
+                failed = version
+                raise
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logging.error(f"重新加载索引快照失败，继续使用当前索引: {e}", exc_info=True)
+
+def get_vector_backend() -> VectorBackend:
+    """返回当前索引快照中的向量检索后端。"""
+    return get_snapshot().backend
+
+def get_knowledge_base():
+    """返回当前索引快照中的知识库。"""
+    return get_snapshot().tree
+
+@lru_cache(maxsize=1)
+def get_embedding_cache():
+    """初始化并返回查询向量缓存；EMBEDDING_CACHE_SIZE 为 0 时禁用并返回 None。"""
+    if config.EMBEDDING_CACHE_SIZE <= 0:
+        return None
+    return EmbeddingCache(
+        model=config.EMBEDDING_MODEL,
+        max_entries=config.EMBEDDING_CACHE_SIZE,
+        ttl_seconds=config.EMBEDDING_CACHE_TTL,
+        persist_path=config.EMBEDDING_CACHE_PATH or None,
+    )
 
 # --- 检索功能 ---
 
 def embed_query(query_text: str):
-    """将用户查询文本转换为向量。"""
+    """将用户查询文本转换为向量，优先使用查询向量缓存。"""
+    cache = get_embedding_cache()
+    vector = _cached_vector(cache, query_text)
+    if vector is not None:
+        return vector
+
     client = get_embedding_client()
     try:
-        response = client.embeddings.create(
-            input=[query_text],
-            model=config.EMBEDDING_MODEL
-        )
-        # 兼容不同 OpenAI 客户端返回结构
-        embedding_item = response.data[0]
-        vector = getattr(embedding_item, 'embedding', None)
-        if vector is None and isinstance(embedding_item, dict):
-            vector = embedding_item.get('embedding')
+        with stage_timer("embed"):
+            response = client.embeddings.create(
+                input=[query_text],
+                model=config.EMBEDDING_MODEL
+            )
+            vector = _extract_vector(response)
+        if cache is not None and vector:
+            cache.put(query_text, vector)
         return vector
     except Exception as e:
         logging.error(f"查询向量化失败: {e}")
         return None
 
-def search_knowledge_base(query_vector: List[float]):
-    """在ChromaDB中执行相似度搜索。"""
-    collection = get_chroma_collection()
+async def aembed_query(query_text: str):
+    """
+    embed_query 的异步版本，通过共享的 AsyncOpenAI 客户端请求Embedding服务；
+    启用微批处理时与同一窗口内的其他查询合并为一次请求。
+    """
+    cache = get_embedding_cache()
+    vector = await _acached_vector(cache, query_text)
+    if vector is not None:
+        return vector
+
     try:
-        results = collection.query(
-            query_embeddings=[query_vector],
-            n_results=config.TOP_K_RESULTS,
-            include=["ids", "documents", "metadatas", "distances"]
-        )
-        return results
+        with stage_timer("embed"):
+            batcher = get_embedding_batcher()
+            if batcher is not None:
+                vector = await batcher.embed(query_text)
+            else:
+                response = await get_async_embedding_client().embeddings.create(
+                    input=[query_text],
+                    model=config.EMBEDDING_MODEL
+                )
+                vector = _extract_vector(response)
+        if cache is not None and vector:
+            cache.put_memory(query_text, vector)
+            if cache.has_disk:
+                # 磁盘层写入不等待完成，不影响本次请求的延迟
+                get_retrieval_executor().submit(cache.put_disk, query_text, vector)
+        return vector
+    except Exception as e:
+        logging.error(f"查询向量化失败: {e}")
+        return None
+
+def _cached_vector(cache, query_text: str):
+    """查询向量缓存（未启用时返回 None），并记录命中情况。"""
+    if cache is None:
+        return None
+    return _record_cache_lookup(cache.get(query_text))
+
+async def _acached_vector(cache, query_text: str):
+    """
+    _cached_vector 的异步版本: 内存层在事件循环中直接查询，
+    磁盘层（SQLite）查询放到专用线程池中执行，避免阻塞事件循环。
+    """
+    if cache is None:
+        return None
+    vector = cache.get_memory(query_text)
+    if vector is None and cache.has_disk:
+        loop = asyncio.get_running_loop()
+        vector = await loop.run_in_executor(get_retrieval_executor(), cache.get_disk, query_text)
+    return _record_cache_lookup(vector)
+
+def _record_cache_lookup(vector):
+    if vector is not None:
+        logging.debug("查询向量缓存命中。")
+        CACHE_EVENTS.inc(cache="embedding", result="hit")
+    else:
+        CACHE_EVENTS.inc(cache="embedding", result="miss")
+    return vector
+
+def _extract_vector(response):
+    """从Embedding响应中取出第一个向量，兼容不同 OpenAI 客户端返回结构。"""
+    embedding_item = response.data[0]
+    vector = getattr(embedding_item, 'embedding', None)
+    if vector is None and isinstance(embedding_item, dict):
+        vector = embedding_item.get('embedding')
+    return vector
+
+def search_knowledge_base(query_vector: List[float], backend: Optional[VectorBackend] = None,
+                          n_results: Optional[int] = None):
+    """
+    在配置的向量后端（ChromaDB 或 NumPy）中执行相似度搜索；backend 为空时使用当前快照，
+    n_results 为空时返回 TOP_K_RESULTS 个结果。
+    """
+    try:
+        if backend is None:
+            backend = get_vector_backend()
+        with stage_timer("vector_search"):
+            return backend.query(query_vector, n_results or config.TOP_K_RESULTS)
     except Exception as e:
         logging.error(f"知识库检索失败: {e}")
         return None
 
+def lexical_search(query: str, index: LexicalIndex, n_results: int) -> List[tuple]:
+    """在词法索引中按 BM25 检索，返回 [(路径ID, 得分), ...]。"""
+    try:
+        with stage_timer("lexical_search"):
+            return index.search(query, n_results)
+    except Exception as e:
+        logging.error(f"词法检索失败: {e}")
+        return []
+
+def hybrid_search(query: str, query_vector: Optional[List[float]], snapshot: IndexSnapshot):
+    """
+    执行向量检索与词法检索，并以 RRF 融合两路结果。
+
+    只有一路有结果时（如Embedding服务不可用、或查询中没有索引中的词）直接使用该路的结果；
+    未启用混合检索时等同于单纯的向量检索。
+
+    Returns:
+        tuple[str, list, list]: (检索方式 vector/lexical/hybrid, 路径ID列表, 得分列表)。
+        向量检索的得分为距离（越小越相关），其余为得分（越大越相关）。
+    """
+    # 词法索引也可能只为会话缓存或名称精确匹配而加载，是否参与融合只由 HYBRID_SEARCH_ENABLED 决定
+    lexical = snapshot.lexical if config.HYBRID_SEARCH_ENABLED else None
+    top_k = config.TOP_K_RESULTS
+    n_candidates = max(top_k, config.HYBRID_CANDIDATES) if lexical is not None else top_k
+
+    vector_ids, distances = [], []
+    if query_vector:
+        results = search_knowledge_base(query_vector, snapshot.backend, n_candidates)
+        if results and results.get('ids') and results['ids'][0]:
+            vector_ids = results['ids'][0]
+            distances = (results.get('distances') or [[]])[0]
+
+    lexical_hits = lexical_search(query, lexical, n_candidates) if lexical is not None else []
+    if not lexical_hits:
+        return "vector", vector_ids[:top_k], distances[:top_k]
+    if not vector_ids:
+        return "lexical", [p for p, _ in lexical_hits[:top_k]], [sc for _, sc in lexical_hits[:top_k]]
+    fused = reciprocal_rank_fusion([vector_ids, [p for p, _ in lexical_hits]], config.HYBRID_RRF_K)[:top_k]
+    return "hybrid", [p for p, _ in fused], [sc for _, sc in fused]
+
+def _exact_name_match(query: str, snapshot: IndexSnapshot) -> Optional[str]:
+    """查询与唯一一个节点的名称完全相同时返回该节点的路径ID（快速路径，无需向量化）。"""
+    if not config.EXACT_NAME_FAST_PATH or snapshot.lexical is None:
+        return None
+    matches = snapshot.lexical.match_name(query)
+    if len(matches) == 1:
+        return matches[0]
+    if len(matches) > 1:
+        logging.debug("名称 '%s' 对应 %d 个节点，使用混合检索。", query, len(matches))
+    return None
+
 # --- 上下文提取 ---
 
-def find_node_by_path(path_id: str):
+def find_node_by_path(path_id: str, tree=None):
     """
     根据路径ID在JSON知识库中查找并返回对应的节点。
-    此函数现在适配根为列表，子节点键为'child'且值为列表的结构。
+    查找基于知识库加载时构建的索引（见 tree_store），无需逐层扫描兄弟节点。
 
     Args:
         path_id (str): 形如 'A>B>C' 的路径ID。
+        tree: 在其中查找的知识库，为空时使用当前快照。
 
     Returns:
         dict: 找到的节点对象，如果未找到则返回None。
     """
-    logging.debug(f"开始查找路径: {path_id}")
-    path_parts = path_id.split('>')
-    # 知识库的根是一个列表
-    current_level = get_knowledge_base()
-    
-    for i, part in enumerate(path_parts):
-        found_node = None
-        # 确保 current_level 是一个列表
-        if not isinstance(current_level, list):
-            logging.warning(f"路径 '{path_id}' 在第{i}层 '{part}' 中断，因为当前层级不是一个列表。")
-            return None
-
-        # 迭代列表中的每个节点（字典）
-        for node in current_level:
-            if node.get('name') == part:
-                found_node = node
-                logging.debug(f"找到匹配节点: '{part}'")
-                # 子节点在 'child' 键下，并且是列表
-                if i < len(path_parts) - 1:
-                    current_level = node.get('child', [])
-                break
-        
-        if found_node is None:
-            current_level_names = [n.get('name', 'Unknown') for n in current_level if isinstance(n, dict)]
-            logging.warning(f"路径 '{path_id}' 在第{i+1}层 '{part}' 部分中断，未找到节点。当前层级可用节点: {current_level_names}")
-            return None
-            
-    # 循环结束后，found_node 应该是目标节点
-    if found_node:
-        logging.debug(f"成功找到目标节点: '{found_node.get('name')}'")
+    logging.debug("开始查找路径: %s", path_id)
+    with stage_timer("find_node"):
+        found_node = (tree if tree is not None else get_knowledge_base()).find(path_id)
+    if found_node is None:
+        logging.warning("路径 '%s' 在知识库索引中不存在。", path_id)
+        return None
+
+    logging.debug("成功找到目标节点: '%s'", found_node.get('name'))
     return found_node
 
 def get_context_from_retrieval(query: str):
     """
     完整的检索和上下文提取流程。
 
+    0.  查询与唯一一个节点名称完全相同时直接使用该节点（不调用Embedding服务）。
     1.  将查询向量化。
-    2.  在向量数据库中搜索。
-    3.  获取Top 1结果的路径ID。
+    2.  在向量数据库中搜索，并与词法索引的检索结果融合（启用混合检索时）。
+    3.  获取Top 1结果的路径ID（启用 CONTEXT_MULTI_RESULT 时使用全部 Top K 结果）。
     4.  根据路径ID在JSON中找到节点。
     5.  提取路径和子树作为上下文。
 
     Returns:
         tuple[str, dict] | tuple[None, None]: (知识路径, 知识子树) 或 (None, None)
     """
+    snapshot = get_snapshot()
+    path_id = _exact_name_match(query, snapshot)
+    if path_id is not None:
+        RETRIEVALS.inc(method="exact_name")
+        logging.info("名称精确匹配，跳过向量检索: %s", path_id)
+        return _extract_context(path_id, None, snapshot)
     query_vector = embed_query(query)
-    if not query_vector:
-        return None, None
+    return _search_and_extract(query, query_vector, snapshot)
 
-    search_results = search_knowledge_base(query_vector)
+async def aget_context_from_retrieval(query: str):
+    """
+    get_context_from_retrieval 的异步版本。
+
+    向量化通过异步客户端完成，不占用线程；ChromaDB 查询和子树提取是同步的 CPU/IO 操作，
+    在专用线程池（get_retrieval_executor）中执行，避免阻塞事件循环。
+    """
+    # 整个检索过程使用同一个快照，期间发生的重载不影响本次请求
+    snapshot = get_snapshot()
+    loop = asyncio.get_running_loop()
+    # 复制上下文，使检索线程中的日志仍带有当前请求的ID
+    context = contextvars.copy_context()
+    path_id = _exact_name_match(query, snapshot)
+    if path_id is not None:
+        RETRIEVALS.inc(method="exact_name")
+        logging.info("名称精确匹配，跳过向量检索: %s", path_id)
+        return await loop.run_in_executor(
+            get_retrieval_executor(), context.run, _extract_context, path_id, None, snapshot
+        )
+    query_vector = await aembed_query(query)
+    return await loop.run_in_executor(
+        get_retrieval_executor(), context.run, _search_and_extract, query, query_vector, snapshot
+    )
+
+async def aget_conversation_context(user_messages: List[str]):
+    """
+    多轮对话的检索: user_messages 为按顺序排列的全部用户消息，最后一条为本轮问题。
+
+    启用会话检索缓存时，先按之前的用户消息查找上一轮的检索结果；本轮问题与其子树的匹配得分
+    不低于 SESSION_CACHE_MIN_SCORE 时直接复用，否则（包括无法打分时）执行完整的检索。本轮的结果按截至本轮的
+    用户消息缓存，供下一轮使用。未启用时等同于 aget_context_from_retrieval(最后一条消息)。
+    """
+    question = user_messages[-1]
+    cache = get_session_cache()
+    if cache is None:
+        return await aget_context_from_retrieval(question)
+
+    snapshot = get_snapshot()
+    context = None
+    if len(user_messages) > 1:
+        previous = cache.get(cache.make_key(user_messages[:-1]), snapshot.version)
+        if previous is not None:
+            score = previous.score(question, snapshot.lexical)
+            if score is not None and score >= config.SESSION_CACHE_MIN_SCORE:
+                context = previous
+                cache.record("hits")
+                CACHE_EVENTS.inc(cache="session", result="hit")
+                RETRIEVALS.inc(method="session")
+                logging.info("追问与上一轮子树匹配（得分 %.3f），复用检索结果: %s", score, previous.retrieved_path)
+            else:
+                # 问题中没有任何知识库检索词时无法判断是否仍在上一轮的子树内（上一轮的子树也可能
+                # 是按上一个问题裁剪过的），同样重新检索
+                cache.record("rejected")
+                CACHE_EVENTS.inc(cache="session", result="rejected")
+                if score is None:
+                    logging.info("追问中没有知识库检索词，无法判断是否与上一轮相关，重新检索。")
+                else:
+                    logging.info("追问与上一轮子树匹配得分 %.3f 低于阈值，重新检索。", score)
+        else:
+            CACHE_EVENTS.inc(cache="session", result="miss")
+
+    if context is None:
+        retrieved_path, retrieved_subtree = await aget_context_from_retrieval(question)
+        if not retrieved_path or not retrieved_subtree:
+            return retrieved_path, retrieved_subtree
+        context = SessionContext(retrieved_path, retrieved_subtree)
+    cache.put(cache.make_key(user_messages), context, snapshot.version)
+    return context.retrieved_path, context.retrieved_subtree
+
+def _search_and_extract(query: str, query_vector: Optional[List[float]], snapshot: Optional[IndexSnapshot] = None):
+    """执行（混合）检索，并根据Top 1结果（或多结果模式下的 Top K 结果）提取 (知识路径, 知识子树)。"""
+    if snapshot is None:
+        snapshot = get_snapshot()
+    method, ids, scores = hybrid_search(query, query_vector, snapshot)
 
     # --- 增强的命中日志 ---
-    if search_results and search_results.get('ids') and search_results['ids'] and search_results['ids'][0]:
-        # 使用json.dumps美化输出，方便阅读
-        distances = search_results.get('distances', [[]])[0]
-        documents = search_results.get('documents', [[]])[0]
-        pretty_results = {
-            "ids": search_results['ids'][0],
-            "distances": [round(d, 4) for d in distances] if distances else [],
-            "documents": [doc.replace('\n', ' ') for doc in documents] if documents else []
-        }
-        logging.info(f"知识库命中! 查询: '{query}'. 检索结果: {json.dumps(pretty_results, ensure_ascii=False, indent=2)}")
+    if ids:
+        RETRIEVALS.inc(method=method)
+        if payload_enabled():
+            # 完整命中详情只在 DEBUG 级别或被抽样时记录，json.dumps 美化延迟到日志线程中执行
+            pretty_results = {"method": method, "ids": ids, "scores": [round(sc, 4) for sc in scores]}
+            logging.info("知识库命中! 查询: '%s'. 检索结果: %s", Truncated(query), Truncated(LazyJson(pretty_results, indent=2)))
+        else:
+            logging.info(
+                "知识库命中! 查询: '%s'. 命中 %d 条（%s），最佳得分 %s",
+                Truncated(query), len(ids), method, round(scores[0], 4) if scores else None
+            )
     else:
-        logging.info(f"在知识库中未找到与查询 '{query}' 相关的内容。")
+        logging.info("在知识库中未找到与查询 '%s' 相关的内容。", Truncated(query))
         return None, None
     # --- 日志结束 ---
 
     # 取最相关的结果
-    top_result_id = search_results['ids'][0][0]
-    logging.info(f"检索到的最相关路径ID: {top_result_id}")
+    top_result_id = ids[0]
+    logging.info("检索到的最相关路径ID: %s", top_result_id)
+    if config.CONTEXT_MULTI_RESULT and len(ids) > 1:
+        return _extract_multi_context(ids, query_vector, snapshot)
+    return _extract_context(top_result_id, query_vector, snapshot)
 
+def _extract_context(top_result_id: str, query_vector: Optional[List[float]], snapshot: IndexSnapshot):
+    """根据路径ID提取 (知识路径, 知识子树)，子树超出上下文预算时裁剪。"""
     # 格式化路径信息
     retrieved_path = top_result_id.replace('>', ' -> ')
 
     # 查找节点并获取子树
-    retrieved_subtree = find_node_by_path(top_result_id)
+    retrieved_subtree = find_node_by_path(top_result_id, snapshot.tree)
 
     if not retrieved_subtree:
         logging.error(f"根据ID '{top_result_id}' 未能从JSON文件中找到节点。")
         return None, None
 
+    # 子树超出上下文预算时，按与查询的相关性广度优先裁剪。是否超出由节点文本估算：
+    # 超出预算的大子树超过单条缓存上限，每次都序列化一遍只为计数的代价很高
+    budget = config.CONTEXT_TOKEN_BUDGET
+    if budget > 0 and estimate_subtree_tokens(retrieved_subtree, budget) > budget:
+        with stage_timer("prune"):
+            retrieved_subtree = prune_subtree(
+                top_result_id, retrieved_subtree, budget,
+                query_vector=query_vector, backend=snapshot.backend
+            )
+    else:
+        # 在检索线程中预先序列化子树（结果按路径缓存），构建提示词时无需在事件循环上重复 json.dumps
+        with stage_timer("serialize"):
+            serialize_subtree(retrieved_path, retrieved_subtree, generation=snapshot.generation)
+
     return retrieved_path, retrieved_subtree
+
+def _extract_multi_context(ids: List[str], query_vector: Optional[List[float]], snapshot: IndexSnapshot):
+    """
+    使用多个检索结果构建上下文。
+
+    互为祖先/后代的结果先合并为祖先路径；各子树在同一次检索线程调用中从知识库索引取出，
+    按名次依次纳入，总大小不超过 CONTEXT_TOKEN_BUDGET：放不下的结果按剩余预算裁剪，
+    剩余预算过少时跳过。合并后只剩一个结果时与单结果模式相同。
+
+    Returns:
+        tuple[str, MergedContext] | tuple[str, dict] | tuple[None, None]:
+        多个结果时知识路径为编号的多行文本，子树为按名次排列的 MergedContext。
+    """
+    path_ids = collapse_paths(ids)
+    if len(path_ids) == 1:
+        return _extract_context(path_ids[0], query_vector, snapshot)
+
+    with stage_timer("find_node"):
+        found = [(path_id, snapshot.tree.find(path_id)) for path_id in path_ids]
+
+    budget = config.CONTEXT_TOKEN_BUDGET
+    paths, subtrees = [], []
+    used = 0
+    pruned = False
+    for path_id, subtree in found:
+        if not subtree:
+            logging.warning("路径 '%s' 在知识库索引中不存在，跳过该检索结果。", path_id)
+            continue
+        retrieved_path = path_id.replace('>', ' -> ')
+        # 按节点文本估算大小，不为计数而序列化；超出剩余预算时提前停止遍历
+        tokens = estimate_subtree_tokens(subtree, budget - used if budget > 0 else None)
+        if budget > 0 and used + tokens > budget:
+            remaining = budget - used
+            if subtrees and remaining < budget * MIN_RESULT_BUDGET_RATIO:
+                logging.info("上下文预算已不足，跳过检索结果: %s", path_id)
+                continue
+            with stage_timer("prune"):
+                subtree = prune_subtree(
+                    path_id, subtree, remaining, query_vector=query_vector, backend=snapshot.backend
+                )
+            # 裁剪后的子树用满剩余预算，之后的结果不再纳入
+            tokens = remaining
+            pruned = True
+        used += tokens
+        paths.append(retrieved_path)
+        subtrees.append(subtree)
+
+    logging.info(
+        "多结果上下文: 检索到 %d 条，合并祖先/后代后 %d 条，纳入 %d 条（约 %d tokens）。",
+        len(ids), len(path_ids), len(subtrees), used
+    )
+    if not subtrees:
+        return None, None
+    if len(subtrees) == 1:
+        return paths[0], subtrees[0]
+    retrieved_path = "\n".join(f"{i}. {path}" for i, path in enumerate(paths, start=1))
+    merged = MergedContext(subtrees, pruned=pruned)
+    if not pruned:
+        # 与单结果模式一样在检索线程中预先序列化，结果按（合并后的）知识路径缓存
+        with stage_timer("serialize"):
+            serialize_subtree(retrieved_path, merged, generation=snapshot.generation)
+    return retrieved_path, merged
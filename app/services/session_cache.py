@@ -0,0 +1,143 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Hashable, Iterable, Optional
+
+from app.core import config
+from app.services.embedding_cache import normalize_query
+from app.services.lexical_index import LexicalIndex, tokenize
+
+# 多轮对话的检索结果缓存（默认关闭）。
+# 同一次诊断会话中的追问通常仍落在上一轮检索到的子树内。每轮检索的结果按“截至本轮的用户消息”
+# 的哈希缓存；下一轮请求携带相同的历史消息，用“本轮之前的用户消息”即可找到上一轮的结果。
+# 新问题与缓存子树的词法匹配得分不低于阈值时直接复用，省去Embedding请求和向量检索。
+
+
+class SessionContext:
+    """一轮检索的结果（知识路径与子树）。子树的检索词集合在第一次打分时才计算。"""
+
+    __slots__ = ("retrieved_path", "retrieved_subtree", "_tokens")
+
+    def __init__(self, retrieved_path: str, retrieved_subtree):
+        self.retrieved_path = retrieved_path
+        self.retrieved_subtree = retrieved_subtree
+        self._tokens = None
+
+    def _iter_texts(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, list):
+                stack.extend(node)
+            elif isinstance(node, dict):
+                yield node.get('name') or ''
+                yield node.get('desc') or ''
+                stack.extend(node.get('child') or [])
+
+    def tokens(self) -> frozenset:
+        if self._tokens is None:
+            tokens = set(tokenize(self.retrieved_path, unigrams=True))
+            for text in self._iter_texts(self.retrieved_subtree):
+                tokens.update(tokenize(text, unigrams=True))
+            self._tokens = frozenset(tokens)
+        return self._tokens
+
+    def score(self, question: str, lexical: Optional[LexicalIndex] = None) -> Optional[float]:
+        """
+        新问题与该子树的匹配得分: 问题中的检索词出现在子树中的比例（按词法索引中的 IDF 加权）。
+
+        词法索引中不存在的词（如“怎么”、“那第二步呢”）不参与计算；问题中没有任何索引中的词时返回 None，
+        表示无法判断问题是否仍在该子树内（调用方应重新检索）。没有词法索引时所有词权重相同。
+        """
+        weights = {}
+        for token in set(tokenize(question)):
+            weight = lexical.idf(token) if lexical is not None else 1.0
+            if weight > 0:
+                weights[token] = weight
+        total = sum(weights.values())
+        if not total:
+            return None
+        tokens = self.tokens()
+        return sum(w for t, w in weights.items() if t in tokens) / total
+
+
+class SessionCache:
+    """
+    会话检索结果缓存: 带 TTL 的 LRU，按条目数限制大小，知识库重新索引后整体失效。
+
+    Args:
+        max_entries (int): 最多保留的条目数，超出时淘汰最久未使用的条目。
+        ttl_seconds (float): 条目有效期（秒），0 表示不过期。
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float = 0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._version: Optional[Hashable] = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "rejected": 0, "evictions": 0, "expirations": 0}
+
+    @staticmethod
+    def make_key(user_messages: Iterable[str]) -> str:
+        """由规范化后的用户消息序列生成缓存键。"""
+        raw = "\x00".join(normalize_query(m) for m in user_messages)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _check_version(self, version: Hashable):
+        # 调用方需持有锁
+        if version != self._version:
+            if self._entries:
+                logging.info("知识库索引已更新，清空会话检索缓存。")
+            self._entries.clear()
+            self._version = version
+
+    def get(self, key: str, version: Hashable) -> Optional[SessionContext]:
+        """返回缓存的检索结果；未命中、已过期或索引版本已变化时返回 None。"""
+        with self._lock:
+            self._check_version(version)
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, context = entry
+                if not self.ttl_seconds or time.time() - created <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    return context
+                del self._entries[key]
+                self._stats["expirations"] += 1
+            self._stats["misses"] += 1
+            return None
+
+    def put(self, key: str, context: SessionContext, version: Hashable):
+        with self._lock:
+            self._check_version(version)
+            self._entries[key] = (time.time(), context)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def record(self, result: str):
+        """记录一次查找的结果（hits: 复用，rejected: 命中但得分低于阈值）。"""
+        with self._lock:
+            self._stats[result] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+        return stats
+
+
+@lru_cache(maxsize=1)
+def get_session_cache() -> Optional[SessionCache]:
+    """返回进程内的会话检索缓存；SESSION_CACHE_ENABLED 未开启时返回 None。"""
+    if not config.SESSION_CACHE_ENABLED or config.SESSION_CACHE_SIZE <= 0:
+        return None
+    return SessionCache(max_entries=config.SESSION_CACHE_SIZE, ttl_seconds=config.SESSION_CACHE_TTL)
@@ -0,0 +1,102 @@
+import asyncio
+import contextlib
+import json
+import time
+import uuid
+from typing import AsyncIterator, Optional
+
+# OpenAI 兼容的 SSE 数据块编码。
+# 每个 token 都构建一个 pydantic 模型再序列化的开销在高并发流式输出时很可观；
+# 同一个流中的 id / created / model 不变，这里把它们预先编码进字节模板，
+# 每个数据块只需对内容做一次 json.dumps。输出与 StreamingChatCompletion.model_dump_json() 逐字节一致。
+
+DONE_EVENT = b"data: [DONE]\n\n"
+
+
+class ChunkEncoder:
+    """
+    单个流的 chat.completion.chunk 编码器。
+
+    Args:
+        model (str): 响应中的模型名。
+        completion_id (str): 流的ID，默认生成 "chatcmpl-<uuid>"；同一个流的所有数据块共用。
+        created (int): 创建时间戳，默认当前时间。
+    """
+
+    __slots__ = ("completion_id", "created", "model", "_prefix", "_suffix", "_final")
+
+    def __init__(self, model: str, completion_id: Optional[str] = None, created: Optional[int] = None):
+        self.completion_id = completion_id or f"chatcmpl-{uuid.uuid4().hex}"
+        self.created = int(time.time()) if created is None else created
+        self.model = model
+        head = (
+            '{"id":' + json.dumps(self.completion_id, ensure_ascii=False)
+            + ',"object":"chat.completion.chunk","created":' + str(self.created)
+            + ',"model":' + json.dumps(model, ensure_ascii=False)
+            + ',"choices":[{"delta":{"content":'
+        )
+        self._prefix = ("data: " + head).encode("utf-8")
+        self._suffix = b'},"index":0,"finish_reason":null}]}\n\n'
+        self._final = ("data: " + head + 'null},"index":0,"finish_reason":"stop"}]}\n\n').encode("utf-8")
+
+    def content(self, text: str) -> bytes:
+        """编码一个内容增量数据块（含 "data: " 前缀和结尾空行）。"""
+        return self._prefix + json.dumps(text, ensure_ascii=False).encode("utf-8") + self._suffix
+
+    def stop(self) -> bytes:
+        """编码带 finish_reason="stop" 的最后一个数据块。"""
+        return self._final
+
+
+async def coalesce_chunks(chunks: AsyncIterator[str], window_ms: float, max_chars: int) -> AsyncIterator[str]:
+    """
+    合并短时间内到达的文本增量，减少网络写入次数。
+
+    第一个增量立即发出（不增加首字延迟）；之后的增量在 window_ms 内累积，窗口结束或累计
+    超过 max_chars 个字符时合并为一个增量发出。上游停顿时，窗口到期也会发出已累积的内容。
+    """
+    loop = asyncio.get_running_loop()
+    window = window_ms / 1000
+    iterator = chunks.__aiter__()
+    buffer = []
+    buffered_chars = 0
+    deadline = 0.0
+    first = True
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = max(0.0, deadline - loop.time()) if buffer else None
+            done, _ = await asyncio.wait((pending,), timeout=timeout)
+            if not done:
+                # 窗口到期，发出已累积的内容
+                yield "".join(buffer)
+                buffer, buffered_chars = [], 0
+                continue
+            task, pending = pending, None
+            try:
+                chunk = task.result()
+            except StopAsyncIteration:
+                break
+            if first:
+                first = False
+                yield chunk
+                continue
+            if not buffer:
+                deadline = loop.time() + window
+            buffer.append(chunk)
+            buffered_chars += len(chunk)
+            if buffered_chars >= max_chars:
+                yield "".join(buffer)
+                buffer, buffered_chars = [], 0
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            with contextlib.suppress(asyncio.CancelledError, StopAsyncIteration, Exception):
+                await pending
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
@@ -0,0 +1,527 @@
+import hashlib
+import itertools
+import json
+import logging
+import mmap
+import os
+import struct
+import sys
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+import ijson
+
+# 知识库的树形存储。
+# 服务只需要按路径ID取出某个节点的子树，因此这里提供三种实现：
+#   - DictTree:    json.load 整个文件，保留嵌套 dict，并构建路径哈希索引；
+#   - CompactTree: 流式解析文件，只保留扁平数组（名称驻留），按需物化子树；
+#   - MmapTree:    读取离线编译的二进制文件（compile_tree），通过 mmap 按需读取节点，
+#                  多个 worker 进程共享同一份页缓存，加载几乎不耗时。
+
+
+class TreeNode(NamedTuple):
+    """流式解析产出的节点记录（前序遍历顺序）。"""
+    depth: int
+    name: str
+    desc: str
+
+
+def build_path_index(data) -> Dict[str, dict]:
+    """
+    遍历知识库树，构建 'A>B>C' 形式的路径ID到节点对象的哈希索引。
+
+    与原先的逐层扫描保持一致：同一层级存在重名节点时，以第一个出现的节点为准。
+    """
+    index: Dict[str, dict] = {}
+    if not isinstance(data, list):
+        return index
+
+    # 使用显式栈代替递归，避免深层树触发递归深度限制
+    stack = [(data, '')]
+    while stack:
+        nodes, prefix = stack.pop()
+        for node in nodes:
+            if not isinstance(node, dict):
+                continue
+            name = node.get('name')
+            if not name:
+                continue
+            path_id = f"{prefix}>{name}" if prefix else name
+            if path_id in index:
+                continue
+            index[path_id] = node
+            children = node.get('child')
+            if isinstance(children, list) and children:
+                stack.append((children, path_id))
+    return index
+
+
+def iter_tree_nodes(file_path) -> Iterator[TreeNode]:
+    """
+    流式解析知识库JSON文件，按前序遍历顺序逐个产出节点，不在内存中构建整棵树。
+
+    节点的 'name'、'desc' 都出现在 'child' 之前时（combined_output.json 即为此顺序），
+    节点在其 'child' 列表开始时即产出，子树照常流式处理；键顺序不同时（如 'child' 在 'name'
+    或 'desc' 之前，或节点没有 'desc'），该节点的子树先缓存在内存中，到节点对象结束时再按前序产出，
+    结果与键顺序无关。
+    缺少 'name' 的节点及其子树会被跳过。
+    """
+    # 容器栈中的帧: [kind, ...]
+    #   ('list', depth)                 节点列表（根列表或某节点的 child 列表）
+    #   ('node', depth, state)          节点对象，state = [key, name, desc, has_desc, emitted, buffer]
+    #                                   buffer 不为 None 时，子树中完成的节点先缓存到这里
+    #   ('skip',)                       与节点结构无关的容器，其内容全部忽略
+    stack: list = []
+    with open(file_path, 'rb') as f:
+        for event, value in ijson.basic_parse(f, use_float=True):
+            top = stack[-1] if stack else None
+
+            if event == 'map_key':
+                if top[0] == 'node':
+                    top[2][0] = value
+                continue
+
+            if event in ('string', 'number', 'boolean', 'null'):
+                if top is not None and top[0] == 'node':
+                    state = top[2]
+                    if state[0] == 'name' and isinstance(value, str):
+                        state[1] = value
+                    elif state[0] == 'desc' and isinstance(value, str):
+                        state[2] = value
+                        state[3] = True
+                elif top is None:
+                    logging.error("知识库根节点期望为列表，但得到标量值。")
+                continue
+
+            if event == 'start_array':
+                if top is None:
+                    stack.append(('list', 0))
+                elif top[0] == 'node' and top[2][0] == 'child':
+                    state = top[2]
+                    if not state[4]:
+                        if state[1] and state[3] and state[5] is None:
+                            state[4] = True
+                            yield from _route(stack, [TreeNode(top[1], state[1], state[2])])
+                        elif state[5] is None:
+                            state[5] = []
+                    stack.append(('list', top[1] + 1))
+                else:
+                    stack.append(('skip',))
+            elif event == 'start_map':
+                if top is None:
+                    logging.error("知识库根节点期望为列表，但得到: dict")
+                    stack.append(('skip',))
+                elif top[0] == 'list':
+                    stack.append(('node', top[1], [None, None, '', False, False, None]))
+                else:
+                    stack.append(('skip',))
+            elif event == 'end_map':
+                frame = stack.pop()
+                if frame[0] == 'node' and not frame[2][4]:
+                    state = frame[2]
+                    if state[1]:
+                        yield from _route(stack, [TreeNode(frame[1], state[1], state[2])] + (state[5] or []))
+                    else:
+                        # 缺少 name 的节点连同其（已缓存的）子树一并跳过
+                        logging.warning("跳过缺少 'name' 的节点")
+            elif event == 'end_array':
+                stack.pop()
+
+
+def _route(stack, nodes: List[TreeNode]) -> List[TreeNode]:
+    """把完成的节点交给最近的正在缓存子树的祖先节点；没有这样的祖先时原样返回，由调用方产出。"""
+    for frame in reversed(stack):
+        if frame[0] == 'node' and frame[2][5] is not None:
+            frame[2][5].extend(nodes)
+            return []
+    return nodes
+
+
+def iter_path_records(file_path) -> Iterator[tuple]:
+    """在 iter_tree_nodes 的基础上为每个节点附加 'A>B>C' 形式的路径ID。"""
+    path_parts: List[str] = []
+    for node in iter_tree_nodes(file_path):
+        del path_parts[node.depth:]
+        path_parts.append(node.name)
+        yield '>'.join(path_parts), node.name, node.desc
+
+
+class DictTree:
+    """完整加载的嵌套 dict 知识库，附带路径哈希索引。"""
+
+    def __init__(self, data):
+        self.data = data if isinstance(data, list) else []
+        self._index = build_path_index(self.data)
+
+    @classmethod
+    def load(cls, file_path) -> "DictTree":
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if not isinstance(data, list):
+            logging.error(f"知识库根节点期望为列表，但得到: {type(data).__name__}")
+        return cls(data)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def __contains__(self, path_id: str) -> bool:
+        return path_id in self._index
+
+    def find(self, path_id: str) -> Optional[dict]:
+        """按路径ID返回节点对象（知识库中的原始 dict），不存在时返回 None。"""
+        return self._index.get(path_id)
+
+
+class CompactTree:
+    """
+    紧凑的知识库表示：节点以扁平数组存储，名称通过 sys.intern 驻留，
+    子节点以元组记录下标。查找按路径逐层进行，子节点较多的层级使用名称字典，
+    代价为 O(深度)；子树只在查找命中时才物化为 dict。
+
+    只保留 name / desc / child 三个字段。
+    """
+
+    # 子节点数超过该阈值时为其构建名称 -> 下标字典，否则线性比较即可
+    CHILD_MAP_THRESHOLD = 8
+
+    __slots__ = ('names', 'descs', 'children', 'roots', '_child_maps')
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.descs: List[str] = []
+        self.children: List[tuple] = []
+        self.roots: tuple = ()
+        self._child_maps: Dict[int, Dict[str, int]] = {}
+
+    @classmethod
+    def from_nodes(cls, nodes) -> "CompactTree":
+        """由前序遍历的 TreeNode 序列构建紧凑树。"""
+        tree = cls()
+        names, descs = tree.names, tree.descs
+        child_lists: List[list] = []
+        roots: list = []
+        # ancestors[d] 为当前路径上深度为 d 的节点下标
+        ancestors: List[int] = []
+        for depth, name, desc in nodes:
+            idx = len(names)
+            names.append(sys.intern(name))
+            descs.append(desc)
+            child_lists.append([])
+            del ancestors[depth:]
+            if depth == 0:
+                roots.append(idx)
+            else:
+                child_lists[ancestors[depth - 1]].append(idx)
+            ancestors.append(idx)
+
+        empty = ()
+        tree.children = [tuple(c) if c else empty for c in child_lists]
+        tree.roots = tuple(roots)
+        tree._build_child_maps()
+        return tree
+
+    @classmethod
+    def load(cls, file_path) -> "CompactTree":
+        return cls.from_nodes(iter_tree_nodes(file_path))
+
+    def _build_child_maps(self):
+        threshold = self.CHILD_MAP_THRESHOLD
+        names = self.names
+        maps: Dict[int, Dict[str, int]] = {}
+        for parent, kids in itertools.chain([(-1, self.roots)], enumerate(self.children)):
+            if len(kids) > threshold:
+                mapping: Dict[str, int] = {}
+                for idx in kids:
+                    mapping.setdefault(names[idx], idx)
+                maps[parent] = mapping
+        self._child_maps = maps
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, path_id: str) -> bool:
+        return self.locate(path_id) is not None
+
+    def _child(self, parent: int, kids: tuple, name: str) -> Optional[int]:
+        mapping = self._child_maps.get(parent)
+        if mapping is not None:
+            return mapping.get(name)
+        names = self.names
+        for idx in kids:
+            if names[idx] == name:
+                return idx
+        return None
+
+    def locate(self, path_id: str) -> Optional[int]:
+        """返回路径ID对应的节点下标，不存在时返回 None。"""
+        parent, kids = -1, self.roots
+        idx = None
+        for part in path_id.split('>'):
+            idx = self._child(parent, kids, part)
+            if idx is None:
+                return None
+            parent, kids = idx, self.children[idx]
+        return idx
+
+    def materialize(self, idx: int) -> dict:
+        """将下标为 idx 的节点及其子树物化为嵌套 dict。"""
+        names, descs, children = self.names, self.descs, self.children
+        root = {'name': names[idx], 'desc': descs[idx], 'child': []}
+        stack = [(root, children[idx])]
+        while stack:
+            node, kids = stack.pop()
+            out = node['child']
+            for k in kids:
+                child = {'name': names[k], 'desc': descs[k], 'child': []}
+                out.append(child)
+                if children[k]:
+                    stack.append((child, children[k]))
+        return root
+
+    def find(self, path_id: str) -> Optional[dict]:
+        """按路径ID查找节点并物化其子树，不存在时返回 None。"""
+        idx = self.locate(path_id)
+        return None if idx is None else self.materialize(idx)
+
+
+# --- 二进制树文件格式 ---
+#
+# 所有整数均为小端序。
+#   header      见 _HEADER，包含各段的偏移量以及源 JSON 文件的 mtime/size
+#   strings     (string_count + 1) 个 uint64 偏移量 + UTF-8 字节串（name/desc 去重驻留）
+#   nodes       node_count 个 _NODE 记录: name_sid, desc_sid, parent, child_start, child_count
+#   children    uint32 节点下标数组；根节点位于 [0, root_count)，其余节点的子节点连续存放
+#   path index  hash_slots 个 _SLOT 记录: 路径ID的 64 位哈希, 节点下标 + 1（0 表示空槽）
+_MAGIC = b'JTRTREE1'
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('<8sIIIIIQQQQQQQ')
+_NODE = struct.Struct('<IIIII')
+_SLOT = struct.Struct('<QI')
+_U32 = struct.Struct('<I')
+_U64 = struct.Struct('<Q')
+_NO_PARENT = 0xFFFFFFFF
+
+
+def _path_hash(path_id: str) -> int:
+    return int.from_bytes(hashlib.blake2b(path_id.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def compile_tree(tree: CompactTree, out_path, source_path=None) -> Path:
+    """
+    将 CompactTree 编译为可 mmap 的二进制文件（先写临时文件再原子替换）。
+
+    Args:
+        tree: 已加载的紧凑树。
+        out_path: 输出文件路径。
+        source_path: 源 JSON 文件，其 mtime/size 会写入文件头，用于判断编译结果是否过期。
+    """
+    out_path = Path(out_path)
+    names, descs, children = tree.names, tree.descs, tree.children
+    node_count = len(names)
+
+    # 字符串去重
+    string_ids: Dict[str, int] = {}
+    strings: List[bytes] = []
+
+    def _sid(text: str) -> int:
+        sid = string_ids.get(text)
+        if sid is None:
+            sid = string_ids[text] = len(strings)
+            strings.append(text.encode('utf-8'))
+        return sid
+
+    parents = [_NO_PARENT] * node_count
+    child_array = list(tree.roots)
+    child_starts = [0] * node_count
+    for idx, kids in enumerate(children):
+        child_starts[idx] = len(child_array)
+        child_array.extend(kids)
+        for k in kids:
+            parents[k] = idx
+    node_records = bytearray(_NODE.size * node_count)
+    for idx in range(node_count):
+        _NODE.pack_into(
+            node_records, idx * _NODE.size,
+            _sid(names[idx]), _sid(descs[idx]), parents[idx], child_starts[idx], len(children[idx]),
+        )
+
+    # 路径哈希表（开放寻址，线性探测）；与 CompactTree.locate 一致，重复路径以先出现的节点为准
+    hash_slots = 1
+    while hash_slots < node_count * 2:
+        hash_slots <<= 1
+    slots = bytearray(_SLOT.size * hash_slots)
+    mask = hash_slots - 1
+    seen = set()
+    stack = [(idx, '') for idx in reversed(tree.roots)]
+    while stack:
+        idx, prefix = stack.pop()
+        path_id = f"{prefix}>{names[idx]}" if prefix else names[idx]
+        if path_id in seen:
+            continue
+        seen.add(path_id)
+        h = _path_hash(path_id)
+        slot = h & mask
+        while _SLOT.unpack_from(slots, slot * _SLOT.size)[1]:
+            slot = (slot + 1) & mask
+        _SLOT.pack_into(slots, slot * _SLOT.size, h, idx + 1)
+        stack.extend((k, path_id) for k in reversed(children[idx]))
+
+    string_offsets = bytearray(_U64.size * (len(strings) + 1))
+    offset = 0
+    for i, data in enumerate(strings):
+        _U64.pack_into(string_offsets, i * _U64.size, offset)
+        offset += len(data)
+    _U64.pack_into(string_offsets, len(strings) * _U64.size, offset)
+
+    src_mtime_ns = src_size = 0
+    if source_path is not None:
+        st = os.stat(source_path)
+        src_mtime_ns, src_size = st.st_mtime_ns, st.st_size
+
+    str_off_off = _HEADER.size
+    str_blob_off = str_off_off + len(string_offsets)
+    nodes_off = str_blob_off + offset
+    children_off = nodes_off + len(node_records)
+    hash_off = children_off + _U32.size * len(child_array)
+    header = _HEADER.pack(
+        _MAGIC, _FORMAT_VERSION, node_count, len(tree.roots), len(strings), hash_slots,
+        src_mtime_ns, src_size, str_off_off, str_blob_off, nodes_off, children_off, hash_off,
+    )
+
+    tmp_path = out_path.with_suffix(out_path.suffix + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        f.write(string_offsets)
+        for data in strings:
+            f.write(data)
+        f.write(node_records)
+        f.write(struct.pack(f'<{len(child_array)}I', *child_array))
+        f.write(slots)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+class MmapTree:
+    """
+    基于 mmap 的只读知识库，文件由 compile_tree 生成。
+
+    节点、字符串和路径索引都直接从映射的页中读取，打开文件时不解析任何节点；
+    查找为一次哈希探测加上沿父节点链的路径校验，子树只在命中时物化为 dict。
+    """
+
+    def __init__(self, file_path):
+        self.file_path = Path(file_path)
+        with open(self.file_path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, self.node_count, self.root_count, self.string_count, self.hash_slots,
+         self.source_mtime_ns, self.source_size, self._str_off_off, self._str_blob_off,
+         self._nodes_off, self._children_off, self._hash_off) = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or version != _FORMAT_VERSION:
+            self._mm.close()
+            raise ValueError(f"不是有效的知识库树文件或版本不兼容: {self.file_path}")
+
+    @classmethod
+    def load(cls, file_path) -> "MmapTree":
+        return cls(file_path)
+
+    def close(self):
+        self._mm.close()
+
+    def is_stale(self, source_path) -> bool:
+        """源 JSON 文件在编译之后是否发生过变化。"""
+        try:
+            st = os.stat(source_path)
+        except FileNotFoundError:
+            return False
+        return (st.st_mtime_ns, st.st_size) != (self.source_mtime_ns, self.source_size)
+
+    def __len__(self) -> int:
+        return self.node_count
+
+    def __contains__(self, path_id: str) -> bool:
+        return self.locate(path_id) is not None
+
+    def _string(self, sid: int) -> str:
+        start, end = struct.unpack_from('<QQ', self._mm, self._str_off_off + sid * _U64.size)
+        base = self._str_blob_off
+        return self._mm[base + start:base + end].decode('utf-8')
+
+    def _node(self, idx: int) -> tuple:
+        return _NODE.unpack_from(self._mm, self._nodes_off + idx * _NODE.size)
+
+    def _children(self, child_start: int, child_count: int) -> tuple:
+        if not child_count:
+            return ()
+        return struct.unpack_from(f'<{child_count}I', self._mm, self._children_off + child_start * _U32.size)
+
+    def _matches(self, idx: int, parts: List[str]) -> bool:
+        """沿父节点链校验节点的完整路径是否与 parts 一致（排除哈希碰撞）。"""
+        for part in reversed(parts):
+            if idx == _NO_PARENT:
+                return False
+            name_sid, _, parent, _, _ = self._node(idx)
+            if self._string(name_sid) != part:
+                return False
+            idx = parent
+        return idx == _NO_PARENT
+
+    def locate(self, path_id: str) -> Optional[int]:
+        """返回路径ID对应的节点下标，不存在时返回 None。"""
+        if not self.hash_slots:
+            return None
+        h = _path_hash(path_id)
+        mask = self.hash_slots - 1
+        slot = h & mask
+        parts = path_id.split('>')
+        while True:
+            slot_hash, ref = _SLOT.unpack_from(self._mm, self._hash_off + slot * _SLOT.size)
+            if not ref:
+                return None
+            if slot_hash == h and self._matches(ref - 1, parts):
+                return ref - 1
+            slot = (slot + 1) & mask
+
+    def materialize(self, idx: int) -> dict:
+        """将下标为 idx 的节点及其子树物化为嵌套 dict。"""
+        name_sid, desc_sid, _, child_start, child_count = self._node(idx)
+        root = {'name': self._string(name_sid), 'desc': self._string(desc_sid), 'child': []}
+        stack = [(root, child_start, child_count)]
+        while stack:
+            node, child_start, child_count = stack.pop()
+            out = node['child']
+            for k in self._children(child_start, child_count):
+                name_sid, desc_sid, _, k_start, k_count = self._node(k)
+                child = {'name': self._string(name_sid), 'desc': self._string(desc_sid), 'child': []}
+                out.append(child)
+                if k_count:
+                    stack.append((child, k_start, k_count))
+        return root
+
+    def find(self, path_id: str) -> Optional[dict]:
+        """按路径ID查找节点并物化其子树，不存在时返回 None。"""
+        idx = self.locate(path_id)
+        return None if idx is None else self.materialize(idx)
+
+
+def load_tree(file_path, mode: str = 'compact', compiled_path=None):
+    """
+    按配置的模式加载知识库:
+      - 'compact'（默认）: 流式解析为 CompactTree；
+      - 'json': 完整加载为 DictTree；
+      - 'mmap': 映射 compiled_path 处的二进制文件；文件缺失或已过期时回退到 'compact'。
+    """
+    if mode == 'json':
+        return DictTree.load(file_path)
+    if mode == 'mmap':
+        if compiled_path is not None and Path(compiled_path).exists():
+            tree = MmapTree.load(compiled_path)
+            if not tree.is_stale(file_path):
+                return tree
+            tree.close()
+            logging.warning(f"二进制知识库 {compiled_path} 早于 {file_path}，请重新运行索引脚本。回退到 compact 模式。")
+        else:
+            logging.warning(f"二进制知识库 {compiled_path} 不存在，回退到 compact 模式。")
+        return CompactTree.load(file_path)
+    if mode != 'compact':
+        logging.warning(f"未知的知识库加载模式 '{mode}'，使用 'compact'。")
+    return CompactTree.load(file_path)
@@ -0,0 +1,198 @@
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# 向量检索后端。
+# 检索流程只依赖 query() 返回的 ChromaDB 风格结果（ids/distances/documents/metadatas，
+# 每个字段外层是按查询划分的列表），因此可以在 ChromaDB 与进程内 NumPy 暴力检索之间切换。
+
+
+class VectorBackend:
+    """向量检索后端的公共接口。"""
+
+    def query(self, query_vector: List[float], n_results: int) -> dict:
+        """返回与 query_vector 最相近的 n_results 个条目（ChromaDB query 的结果格式）。"""
+        raise NotImplementedError
+
+    def get_embeddings(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """按ID取回已存储的向量（按行归一化），不存在的ID不出现在结果中。"""
+        raise NotImplementedError
+
+    def count(self) -> int:
+        raise NotImplementedError
+
+
+class ChromaBackend(VectorBackend):
+    """基于 ChromaDB 集合的检索后端。"""
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def query(self, query_vector: List[float], n_results: int) -> dict:
+        return self.collection.query(
+            query_embeddings=[query_vector],
+            n_results=n_results,
+            # ids 总是会返回，不能出现在 include 中
+            include=["documents", "metadatas", "distances"]
+        )
+
+    def get_embeddings(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        if not ids:
+            return {}
+        result = self.collection.get(ids=list(ids), include=["embeddings"])
+        if not result['ids']:
+            return {}
+        return dict(zip(result['ids'], normalize_rows(result['embeddings'])))
+
+    def count(self) -> int:
+        return self.collection.count()
+
+
+class NumpyBackend(VectorBackend):
+    """
+    进程内的精确余弦检索：向量矩阵为按行归一化的 float32，以 memmap 方式打开，
+    查询时做一次矩阵-向量乘法，再用 argpartition 取 top-k。
+
+    文件由索引脚本（export_vectors）生成：
+      - matrix_path: (M, dim) float32 .npy 文件，内容相同的节点共用一行（M <= N）；
+      - meta_path:   JSON，包含 N 个条目的 ids、documents，以及每个条目对应的矩阵行号 rows
+                     （缺省时条目与矩阵行一一对应）。
+    查询时只对 M 个不同的向量打分，再把命中的行展开为对应的全部路径ID。
+    """
+
+    def __init__(self, matrix: np.ndarray, ids: List[str], documents: List[str],
+                 rows: Optional[List[int]] = None):
+        if rows is None:
+            rows = range(len(ids))
+        elif len(rows) != len(ids):
+            raise ValueError(f"行号数量 {len(rows)} 与 ID 数量 {len(ids)} 不匹配")
+        row_array = np.asarray(rows, dtype=np.int64)
+        if matrix.ndim != 2 or (len(row_array) and (row_array.min() < 0 or row_array.max() >= matrix.shape[0])):
+            raise ValueError(f"向量矩阵形状 {matrix.shape} 与 ID 数量 {len(ids)} 不匹配")
+        self.matrix = matrix
+        self.ids = ids
+        self.documents = documents
+        self._rows = dict(zip(ids, row_array.tolist()))
+        # 矩阵行 -> 条目下标（CSR 形式），矩阵行与条目一一对应时不需要展开
+        self._shared = matrix.shape[0] != len(ids)
+        if self._shared:
+            self._entries = np.argsort(row_array, kind='stable')
+            self._offsets = np.zeros(matrix.shape[0] + 1, dtype=np.int64)
+            np.cumsum(np.bincount(row_array, minlength=matrix.shape[0]), out=self._offsets[1:])
+
+    @classmethod
+    def load(cls, matrix_path, meta_path, mmap: bool = True) -> "NumpyBackend":
+        matrix = np.load(matrix_path, mmap_mode='r' if mmap else None)
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+        return cls(matrix, meta['ids'], meta['documents'], meta.get('rows'))
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def get_embeddings(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        rows = self._rows
+        return {path_id: self.matrix[rows[path_id]] for path_id in ids if path_id in rows}
+
+    def query(self, query_vector: List[float], n_results: int) -> dict:
+        total = self.matrix.shape[0]
+        k = min(n_results, total)
+        if k <= 0 or not self.ids:
+            return {"ids": [[]], "distances": [[]], "documents": [[]], "metadatas": [[]]}
+        q = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm:
+            q = q / norm
+        scores = self.matrix @ q
+        if k < total:
+            top = np.argpartition(-scores, k - 1)[:k]
+        else:
+            top = np.arange(total)
+        top = top[np.argsort(-scores[top], kind='stable')]
+        if self._shared:
+            # 每个矩阵行至少对应一个条目，展开前 k 行后截取前 n_results 个条目
+            entries = [int(e) for row in top for e in self._entries[self._offsets[row]:self._offsets[row + 1]]]
+            entries = entries[:n_results]
+            distances = [float(1.0 - scores[self._rows[self.ids[e]]]) for e in entries]
+        else:
+            entries = top
+            distances = [float(1.0 - scores[i]) for i in top]
+        ids = [self.ids[i] for i in entries]
+        return {
+            "ids": [ids],
+            # 与 ChromaDB 的 cosine 空间一致：distance = 1 - cosine similarity
+            "distances": [distances],
+            "documents": [[self.documents[i] for i in entries]],
+            "metadatas": [[{"path_id": path_id} for path_id in ids]],
+        }
+
+
+# 判定两个归一化向量相同的最大分量差
+_SAME_VECTOR_ATOL = 1e-6
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """按行 L2 归一化（零向量保持不变）。"""
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def export_vectors(collection, matrix_path, meta_path, page_size: int = 5000) -> dict:
+    """
+    将 ChromaDB 集合中的全部向量导出为 NumpyBackend 使用的文件（先写临时文件再原子替换）。
+    内容相同且向量相同的节点（索引器为相同内容复用同一个Embedding）只在矩阵中保存一行。
+
+    Returns:
+        dict: entries（导出的条目数）、rows（矩阵行数）和 bytes_saved（去重节省的矩阵字节数）。
+    """
+    ids: List[str] = []
+    documents: List[str] = []
+    rows: List[int] = []
+    unique_rows: Dict[str, int] = {}
+    row_vectors: List[np.ndarray] = []
+    chunks = []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents"], limit=page_size, offset=offset)
+        page_ids = page['ids']
+        if not page_ids:
+            break
+        ids.extend(page_ids)
+        documents.extend(page['documents'])
+        page_matrix = normalize_rows(page['embeddings'])
+        keep = []
+        for i, (document, vector) in enumerate(zip(page['documents'], page_matrix)):
+            row = unique_rows.get(document)
+            # 经过 ChromaDB 存取后同一向量可能有 float32 舍入级别的差异，按容差判断是否相同
+            if row is None or not np.allclose(row_vectors[row], vector, rtol=0, atol=_SAME_VECTOR_ATOL):
+                row = len(row_vectors)
+                row_vectors.append(vector)
+                unique_rows.setdefault(document, row)
+                keep.append(i)
+            rows.append(row)
+        chunks.append(page_matrix[keep])
+        offset += len(page_ids)
+
+    matrix = np.concatenate(chunks) if chunks else np.zeros((0, 0), dtype=np.float32)
+    matrix_path, meta_path = Path(matrix_path), Path(meta_path)
+    tmp_matrix = matrix_path.with_suffix(matrix_path.suffix + '.tmp')
+    tmp_meta = meta_path.with_suffix(meta_path.suffix + '.tmp')
+    with open(tmp_matrix, 'wb') as f:
+        np.save(f, matrix)
+    with open(tmp_meta, 'w', encoding='utf-8') as f:
+        meta = {'ids': ids, 'documents': documents}
+        if len(matrix) != len(ids):
+            meta['rows'] = rows
+        json.dump(meta, f, ensure_ascii=False)
+    # 先替换元数据再替换矩阵；加载时会校验两者的行数是否一致
+    os.replace(tmp_meta, meta_path)
+    os.replace(tmp_matrix, matrix_path)
+    bytes_saved = (len(ids) - len(matrix)) * (matrix.shape[1] if matrix.ndim == 2 else 0) * matrix.itemsize
+    logging.info(f"已导出 {len(ids)} 条向量到 {matrix_path}（去重后 {len(matrix)} 行，节省 {bytes_saved} 字节）")
+    return {"entries": len(ids), "rows": len(matrix), "bytes_saved": bytes_saved}
@@ -0,0 +1,17 @@
+import re
+
+# 中日韩统一表意文字及常用全角标点
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数，不依赖具体模型的分词器。
+
+    中文字符按每字 1 个 token 计（Qwen/BGE 等分词器对常见汉字约为 1~1.5 字/token），
+    其余字符按每 4 个字符 1 个 token 计。用于上下文预算控制，偏保守即可。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
@@ -0,0 +1,145 @@
+# 批量问答脚本：读取 JSONL 格式的问题，在进程内执行检索 + 生成，并把结果写入 JSONL 文件。
+# 用于回归评测等需要一次跑完成千上万个问题的场景，无需启动 API 服务、也无需消费 SSE 流。
+#
+# 输入文件每行一个 JSON 对象，问题取自 "question" 字段，或 "messages" 中最后一条用户消息；
+# 其余字段（如 "id"）原样保留到输出中。输出按输入顺序写入，每行增加:
+#   retrieved_path, answer, latency_ms, error
+#
+# 用法:
+#   python scripts/batch_answer.py questions.jsonl -o answers.jsonl --concurrency 16
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core import config  # noqa: E402
+from app.services.answer import answer_question  # noqa: E402
+from app.services.llm_handler import LLM_ERROR_PREFIX  # noqa: E402
+from app.services.retrieval import aclose_clients  # noqa: E402
+
+
+def extract_question(item: dict):
+    """从输入记录中取出问题文本：优先 "question" 字段，否则取 "messages" 中最后一条用户消息。"""
+    question = item.get("question")
+    if question:
+        return question
+    for message in reversed(item.get("messages") or []):
+        if message.get("role") == "user" and message.get("content"):
+            return message["content"]
+    return None
+
+
+async def _answer(item: dict, model_name: str) -> dict:
+    result = dict(item)
+    question = extract_question(item)
+    start = time.perf_counter()
+    try:
+        if not question:
+            raise ValueError("记录中没有问题（question 字段或用户消息）")
+        retrieved_path, answer = await answer_question(question, model_name)
+        # LLM 调用失败时回答中含错误信息（可能在已输出部分内容之后），计为失败
+        error = answer if LLM_ERROR_PREFIX in answer else None
+        result.update(retrieved_path=retrieved_path, answer=answer, error=error)
+    except Exception as e:
+        logging.error(f"回答问题失败: {e}")
+        result.update(retrieved_path=None, answer=None, error=str(e))
+    result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+
+async def run_batch(input_path, output_path, concurrency: int, model_name: str) -> dict:
+    """
+    以有限并发回答输入文件中的全部问题，按输入顺序逐行写出结果。
+
+    输入按需读取，同时进行中的问题不超过 concurrency 个；前面的问题完成后即写出，
+    不会等全部问题结束，中途中断时已写出的结果仍然有效。
+
+    Returns:
+        dict: 统计信息（总数、失败数、未检索到上下文的数量、耗时）。
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    # 按输入顺序排队的任务，None 表示输入结束
+    pending: asyncio.Queue = asyncio.Queue()
+    stats = {"total": 0, "errors": 0, "not_found": 0}
+    start = time.perf_counter()
+
+    async def _run(item):
+        try:
+            return await _answer(item, model_name)
+        finally:
+            semaphore.release()
+
+    async def _writer(out):
+        # 逐个等待排在最前面的任务，先完成的后续任务会在轮到它时立即写出
+        written = 0
+        while True:
+            task = await pending.get()
+            if task is None:
+                return
+            result = await task
+            written += 1
+            if result["error"]:
+                stats["errors"] += 1
+            elif result["retrieved_path"] is None:
+                stats["not_found"] += 1
+            out.write(json.dumps(result, ensure_ascii=False) + "\n")
+            if written % 100 == 0:
+                out.flush()
+                print(f"已完成 {written} 个问题，耗时 {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    with open(input_path, "r", encoding="utf-8") as f, open(output_path, "w", encoding="utf-8") as out:
+        writer = asyncio.create_task(_writer(out))
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                # 保留原始内容，结果中记为没有问题的记录
+                item = {"line": line_no, "raw": line}
+            if not isinstance(item, dict):
+                item = {"question": str(item)}
+            await semaphore.acquire()
+            stats["total"] += 1
+            pending.put_nowait(asyncio.create_task(_run(item)))
+        pending.put_nowait(None)
+        await writer
+
+    stats["elapsed_s"] = round(time.perf_counter() - start, 2)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="JsonTreeRAG 批量问答脚本")
+    parser.add_argument("input", help="输入 JSONL 文件，每行包含 question 或 messages 字段")
+    parser.add_argument("-o", "--output", required=True, help="输出 JSONL 文件")
+    parser.add_argument("--concurrency", type=int, default=16, help="同时进行的问题数（默认 16）")
+    parser.add_argument("--model", default=None, help="LLM 模型名，默认使用 LLM_MODEL 配置")
+    parser.add_argument("--verbose", action="store_true", help="输出每个请求的详细日志（包括完整提示词）")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    async def _main():
+        try:
+            return await run_batch(args.input, args.output, max(1, args.concurrency), args.model or config.LLM_MODEL)
+        finally:
+            await aclose_clients()
+
+    stats = asyncio.run(_main())
+    print(json.dumps(stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# 对比两种检索调用方式在并发下的吞吐与延迟:
+#   sync:  loop.run_in_executor(None, get_context_from_retrieval)（默认线程池 + 同步客户端）
+#   async: aget_context_from_retrieval（AsyncOpenAI + 专用检索线程池）
+#
+# 用法:
+#   python scripts/benchmarks/bench_async_retrieval.py --requests 400 --concurrency 64 --latency 0.05
+
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core import config  # noqa: E402
+from app.services import retrieval  # noqa: E402
+from scripts.benchmarks.fixtures import prepare_index  # noqa: E402
+from scripts.benchmarks.stub_servers import start_embedding_server  # noqa: E402
+
+
+async def _drive(call, queries, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def _one(q):
+        async with semaphore:
+            start = time.perf_counter()
+            path, _ = await call(q)
+            latencies.append(time.perf_counter() - start)
+            return path
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(_one(q) for q in queries))
+    elapsed = time.perf_counter() - start
+    assert all(results), "部分请求未检索到结果"
+    latencies.sort()
+    return {
+        "rps": len(queries) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1e3,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1e3,
+    }
+
+
+async def _sync_path(q):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, retrieval.get_context_from_retrieval, q)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="同步/异步检索路径并发基准测试")
+    parser.add_argument("--requests", type=int, default=400, help="请求总数")
+    parser.add_argument("--concurrency", type=int, default=64, help="并发请求数")
+    parser.add_argument("--latency", type=float, default=0.05, help="桩Embedding服务器的延迟（秒）")
+    parser.add_argument("--width", type=int, default=10)
+    parser.add_argument("--depth", type=int, default=3)
+    args = parser.parse_args()
+
+    server = start_embedding_server(latency=args.latency, parallelism=1024)
+    with tempfile.TemporaryDirectory() as tmp:
+        ids, documents = prepare_index(tmp, args.width, args.depth)
+        logging.getLogger().setLevel(logging.WARNING)
+        config.EMBEDDING_API_BASE_URL = server.base_url
+        # 每个请求都使用不同的文本并禁用缓存，确保每次都访问Embedding服务
+        config.EMBEDDING_CACHE_SIZE = 0
+        retrieval.clear_caches()
+        retrieval.get_knowledge_base()
+
+        print(f"节点数={len(ids)} 请求数={args.requests} 并发={args.concurrency} Embedding延迟={args.latency * 1e3:.0f}ms")
+        for name, call in [("sync", _sync_path), ("async", retrieval.aget_context_from_retrieval)]:
+            queries = [f"{documents[i % len(documents)]} #{name}{i}" for i in range(args.requests)]
+            r = asyncio.run(_drive(call, queries, args.concurrency))
+            print(f"{name:>6}: {r['rps']:8.1f} req/s  p50={r['p50_ms']:7.1f}ms  p95={r['p95_ms']:7.1f}ms")
+            retrieval.clear_caches()
+            retrieval.get_knowledge_base()
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+# 端到端压测：在本地启动 OpenAI 兼容的桩 Embedding / LLM 服务器，生成合成知识库并用索引脚本建立索引，
+# 再以独立进程启动服务端，按给定并发度压测 /v1/chat/completions，
+# 统计首个 token 耗时（TTFT）、总耗时的 p50/p95/p99 和每秒完成的请求数。
+#
+# 桩服务器和服务端都运行在独立进程中，压测客户端的开销不会计入服务端。结果以 JSON 保存，
+# 可用 --baseline 与之前的结果比较，p95 变差超过 --tolerance 时以非零状态退出，便于发现性能回退。
+#
+# 用法:
+#   python scripts/benchmarks/bench_e2e_load.py --width 8 --depth 4 --concurrency 1,16,64 --requests 300 \
+#       --ttft 0.2 --token-rate 50 --tokens 100 --output e2e.json
+#   python scripts/benchmarks/bench_e2e_load.py --concurrency 16 --env VECTOR_BACKEND=numpy \
+#       --baseline e2e.json --output e2e_numpy.json
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core import config  # noqa: E402
+from scripts import data_indexer  # noqa: E402
+from scripts.benchmarks.fixtures import use_data_dir  # noqa: E402
+from scripts.benchmarks.synthetic import make_tree, write_tree  # noqa: E402
+
+BENCH_DIR = Path(__file__).resolve().parent
+# 与基线比较的指标（越小越好）
+COMPARED_METRICS = (("ttft_ms", "p95"), ("latency_ms", "p95"))
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port: int, process, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"进程提前退出（返回码 {process.returncode}）: {process.args}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise TimeoutError(f"等待端口 {port} 超时: {process.args}")
+
+
+def _spawn(args, port: int, log_file: Path, env=None):
+    """启动子进程并等待其监听端口；输出写入 log_file。"""
+    with open(log_file, "ab") as log:
+        process = subprocess.Popen(args, stdout=log, stderr=subprocess.STDOUT, env=env, cwd=project_root)
+    try:
+        _wait_for_port(port, process)
+    except Exception:
+        process.kill()
+        raise
+    return process
+
+
+def _stop(process):
+    if process.poll() is None:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def percentiles(values) -> dict:
+    """返回 p50/p95/p99/平均值（毫秒，按最近秩取分位数）；values 为空时返回空字典。"""
+    if not values:
+        return {}
+    values = sorted(values)
+
+    def _rank(p):
+        return values[min(len(values) - 1, max(0, int(round(p * len(values))) - 1))]
+
+    return {
+        "p50": round(_rank(0.50) * 1e3, 2),
+        "p95": round(_rank(0.95) * 1e3, 2),
+        "p99": round(_rank(0.99) * 1e3, 2),
+        "mean": round(sum(values) / len(values) * 1e3, 2),
+    }
+
+
+async def _one_request(client: httpx.AsyncClient, url: str, question: str, stream: bool):
+    """发送一个问答请求，返回 (状态, 首个 token 耗时, 总耗时)；状态为 HTTP 状态码或异常类型名。"""
+    payload = {"messages": [{"role": "user", "content": question}], "stream": stream}
+    start = time.perf_counter()
+    ttft = None
+    try:
+        if not stream:
+            response = await client.post(url, json=payload)
+            elapsed = time.perf_counter() - start
+            return response.status_code, elapsed, elapsed
+        async with client.stream("POST", url, json=payload) as response:
+            if response.status_code != 200:
+                await response.aread()
+                return response.status_code, None, time.perf_counter() - start
+            async for line in response.aiter_lines():
+                if ttft is None and line.startswith("data: {"):
+                    delta = json.loads(line[6:])["choices"][0].get("delta") or {}
+                    if delta.get("content"):
+                        ttft = time.perf_counter() - start
+        return 200, ttft, time.perf_counter() - start
+    except Exception as e:
+        return type(e).__name__, None, time.perf_counter() - start
+
+
+async def run_level(base_url: str, questions, concurrency: int, total: int, warmup: int, stream: bool) -> dict:
+    """以 concurrency 个闭环客户端发送 total 个请求（先发送 warmup 个不计入统计的请求）。"""
+    url = f"{base_url}/v1/chat/completions"
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=httpx.Timeout(120.0), limits=limits) as client:
+        for i in range(warmup):
+            await _one_request(client, url, questions[i % len(questions)], stream)
+
+        ttfts, latencies = [], []
+        statuses = {}
+        next_index = 0
+
+        async def _worker():
+            nonlocal next_index
+            while next_index < total:
+                i = next_index
+                next_index += 1
+                status, ttft, elapsed = await _one_request(client, url, questions[i % len(questions)], stream)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                if status == 200:
+                    latencies.append(elapsed)
+                    if ttft is not None:
+                        ttfts.append(ttft)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(_worker() for _ in range(concurrency)))
+        duration = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "ok": len(latencies),
+        "errors": total - len(latencies),
+        "statuses": statuses,
+        "duration_s": round(duration, 3),
+        "rps": round(len(latencies) / duration, 2) if duration else 0.0,
+        "ttft_ms": percentiles(ttfts),
+        "latency_ms": percentiles(latencies),
+    }
+
+
+def compare(results, baseline, tolerance: float):
+    """与基线结果按并发度逐项比较，返回回退的指标描述列表。"""
+    base_levels = {level["concurrency"]: level for level in baseline.get("results", [])}
+    regressions = []
+    for level in results:
+        base = base_levels.get(level["concurrency"])
+        if base is None:
+            continue
+        for metric, stat in COMPARED_METRICS:
+            old, new = base.get(metric, {}).get(stat), level.get(metric, {}).get(stat)
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(f"concurrency={level['concurrency']} {metric}.{stat}: {old} -> {new}")
+        if base.get("rps") and level["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"concurrency={level['concurrency']} rps: {base['rps']} -> {level['rps']}")
+    return regressions
+
+
+def _build_questions(records, kind: str, count: int, seed: int):
+    rng = random.Random(seed)
+    if kind == "name":
+        # 根节点名称唯一，模拟直接输入故障码的查询（走名称精确匹配快速路径）
+        pool = [path_id for _, _, path_id in records if '>' not in path_id]
+    else:
+        pool = [document for document, _, _ in records]
+    return [rng.choice(pool) for _ in range(count)]
+
+
+def start_stub_servers(log_file: Path, dim: int, embedding_latency: float, ttft: float, tokens: int,
+                       token_interval: float):
+    """以独立进程启动桩 Embedding / LLM 服务器，返回 (进程列表, embedding_url, llm_url)。"""
+    stub = [sys.executable, str(BENCH_DIR / "stub_servers.py")]
+    embedding_port, llm_port = _free_port(), _free_port()
+    processes = [_spawn(stub + [
+        "embedding", "--port", str(embedding_port), "--dim", str(dim),
+        "--latency", str(embedding_latency), "--parallelism", "64",
+    ], embedding_port, log_file)]
+    try:
+        processes.append(_spawn(stub + [
+            "llm", "--port", str(llm_port), "--ttft", str(ttft),
+            "--tokens", str(tokens), "--token-interval", str(token_interval),
+        ], llm_port, log_file))
+    except Exception:
+        _stop(processes[0])
+        raise
+    return processes, f"http://127.0.0.1:{embedding_port}/v1", f"http://127.0.0.1:{llm_port}/v1"
+
+
+def build_index(data_dir: Path, embedding_url: str, tree):
+    """在 data_dir 中写入知识库并用索引脚本建立全部索引，返回 (索引记录列表, 索引耗时)。"""
+    use_data_dir(data_dir)
+    config.EMBEDDING_API_BASE_URL = embedding_url
+    write_tree(config.KNOWLEDGE_BASE_FILE, tree)
+    records = list(data_indexer.iter_index_records())
+    start = time.perf_counter()
+    data_indexer.main(["--full"])
+    return records, time.perf_counter() - start
+
+
+def start_app(data_dir: Path, embedding_url: str, llm_url: str, log_file: Path, server_env=None,
+              workers: int = 1, preload: bool = True):
+    """以独立进程启动服务端（见 serve_app.py），返回 (进程, 端口)。"""
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        "BENCH_DATA_DIR": str(data_dir),
+        "EMBEDDING_API_BASE_URL": embedding_url,
+        "LLM_API_BASE_URL": llm_url,
+        "INDEX_RELOAD_INTERVAL": "0",
+    })
+    env.update(server_env or {})
+    args = [sys.executable, str(BENCH_DIR / "serve_app.py"), "--port", str(port), "--workers", str(workers)]
+    if not preload:
+        args.append("--no-preload")
+    return _spawn(args, port, log_file, env=env), port
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="端到端压测 /v1/chat/completions")
+    # 合成知识库
+    parser.add_argument("--width", type=int, default=8, help="每个节点的子节点数")
+    parser.add_argument("--depth", type=int, default=4, help="树的层数")
+    parser.add_argument("--roots", type=int, default=None, help="根节点数，默认与 width 相同")
+    parser.add_argument("--dim", type=int, default=64, help="桩Embedding服务器的向量维度")
+    # 桩服务器
+    parser.add_argument("--embedding-latency", type=float, default=0.02, help="Embedding 每个请求的延迟（秒）")
+    parser.add_argument("--ttft", type=float, default=0.2, help="LLM 首个 token 的延迟（秒）")
+    parser.add_argument("--tokens", type=int, default=100, help="LLM 每个回答的 token 数")
+    parser.add_argument("--token-rate", type=float, default=50.0, help="LLM 每秒生成的 token 数，0 表示不限速")
+    # 压测
+    parser.add_argument("--concurrency", default="1,8,32", help="并发度，逗号分隔时依次压测每个并发度")
+    parser.add_argument("--requests", type=int, default=200, help="每个并发度发送的请求数")
+    parser.add_argument("--warmup", type=int, default=5, help="每个并发度开始前的预热请求数")
+    parser.add_argument("--no-stream", action="store_true", help="使用非流式请求（TTFT 等于总耗时）")
+    parser.add_argument("--query-kind", choices=["doc", "name"], default="doc",
+                        help="doc: 以节点的索引文本提问；name: 以唯一的根节点名称提问"
+                             "（配合 --env HYBRID_SEARCH_ENABLED=true --env EXACT_NAME_FAST_PATH=true 测试名称快速路径）")
+    parser.add_argument("--seed", type=int, default=0)
+    # 服务端
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="传给服务端进程的环境变量（可重复），如 VECTOR_BACKEND=numpy")
+    parser.add_argument("--workers", type=int, default=1, help="服务端 worker 进程数（见 app.server）")
+    parser.add_argument("--data-dir", type=Path, help="数据目录（默认使用临时目录，运行结束后删除）")
+    # 结果
+    parser.add_argument("--output", type=Path, help="将结果写入该 JSON 文件")
+    parser.add_argument("--baseline", type=Path, help="与之前保存的结果比较")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="判定为回退的相对变化（默认 20%%）")
+    args = parser.parse_args(argv)
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    server_env = dict(item.split("=", 1) for item in args.env)
+    token_interval = 1.0 / args.token_rate if args.token_rate > 0 else 0.0
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or Path(tmp)
+        data_dir.mkdir(parents=True, exist_ok=True)
+        log_file = data_dir / "bench_e2e_load.log"
+        processes = []
+        try:
+            # 1. 桩服务器（独立进程）
+            stubs, embedding_url, llm_url = start_stub_servers(
+                log_file, args.dim, args.embedding_latency, args.ttft, args.tokens, token_interval
+            )
+            processes.extend(stubs)
+
+            # 2. 生成合成知识库并用索引脚本建立索引
+            records, index_seconds = build_index(
+                data_dir, embedding_url, make_tree(args.width, args.depth, roots=args.roots)
+            )
+            questions = _build_questions(records, args.query_kind, max(levels) * 4 + args.requests, args.seed)
+            print(f"节点数={len(records)} 索引耗时={index_seconds:.1f}s", file=sys.stderr)
+
+            # 3. 服务端（独立进程）
+            app_process, app_port = start_app(
+                data_dir, embedding_url, llm_url, log_file, server_env, workers=args.workers
+            )
+            processes.append(app_process)
+
+            # 4. 按并发度依次压测
+            results = []
+            for concurrency in levels:
+                result = asyncio.run(run_level(
+                    f"http://127.0.0.1:{app_port}", questions, concurrency, args.requests,
+                    args.warmup, not args.no_stream,
+                ))
+                print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+                results.append(result)
+        finally:
+            for process in reversed(processes):
+                _stop(process)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "nodes": len(records),
+            "index_seconds": round(index_seconds, 2),
+            "params": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+            "server_env": server_env,
+        },
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["regressions"] = compare(results, json.load(f), args.tolerance)
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(output, encoding="utf-8")
+    print(output)
+    if report.get("regressions"):
+        print("性能回退:\n  " + "\n  ".join(report["regressions"]), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
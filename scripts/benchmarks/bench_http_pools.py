@@ -0,0 +1,135 @@
+# 对比 OpenAI SDK 默认 HTTP 客户端与按配置调优的共享连接池（使用本地桩Embedding服务器）:
+#   default: AsyncOpenAI 自带的 httpx 客户端（默认连接上限、10 分钟读超时、2 次重试）
+#   tuned:   app.services.http_clients 构建的客户端（HTTP_* / EMBEDDING_* 配置）
+# 以多轮突发并发请求压测，统计服务端新建的 TCP 连接数和延迟分位；
+# 再让桩服务器的延迟超过读超时，观察请求失败前的耗时（超时 + 重试）。
+#
+# 用法:
+#   python scripts/benchmarks/bench_http_pools.py --bursts 5 --burst-size 100 --max-connections 32
+#   python scripts/benchmarks/bench_http_pools.py --slow-latency 3 --read-timeout 1
+
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+
+from openai import AsyncOpenAI
+
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core import config  # noqa: E402
+from app.services.http_clients import build_async_http_client, build_timeout, pool_stats  # noqa: E402
+from scripts.benchmarks.stub_servers import start_embedding_server  # noqa: E402
+
+
+def _make_client(mode: str, base_url: str) -> AsyncOpenAI:
+    if mode == "default":
+        return AsyncOpenAI(api_key="stub", base_url=base_url)
+    return AsyncOpenAI(
+        api_key="stub",
+        base_url=base_url,
+        timeout=build_timeout(config.EMBEDDING_READ_TIMEOUT),
+        max_retries=config.EMBEDDING_CLIENT_MAX_RETRIES,
+        http_client=build_async_http_client(f"bench_{mode}", config.EMBEDDING_READ_TIMEOUT),
+    )
+
+
+async def _burst_run(mode: str, server, bursts: int, burst_size: int, pause: float) -> dict:
+    client = _make_client(mode, server.base_url)
+    latencies = []
+    errors = 0
+
+    async def _one(i):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            await client.embeddings.create(model="stub", input=[f"查询 {i}"])
+        except Exception:
+            errors += 1
+            return
+        latencies.append(time.perf_counter() - start)
+
+    connections_before = server.stats["connections"]
+    start = time.perf_counter()
+    for b in range(bursts):
+        await asyncio.gather(*(_one(b * burst_size + i) for i in range(burst_size)))
+        await asyncio.sleep(pause)
+    elapsed = time.perf_counter() - start - pause * bursts
+    pools = pool_stats(f"bench_{mode}")
+    await client.close()
+    latencies.sort()
+    return {
+        "mode": mode,
+        "requests": bursts * burst_size,
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1e3, 1) if latencies else None,
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1e3, 1) if latencies else None,
+        "server_connections": server.stats["connections"] - connections_before,
+        "idle_after_run": pools.get(f"bench_{mode}", {}).get("idle"),
+    }
+
+
+async def _timeout_run(mode: str, server) -> dict:
+    client = _make_client(mode, server.base_url)
+    requests_before = server.stats["requests"]
+    start = time.perf_counter()
+    try:
+        # default 模式下读超时为 10 分钟，这里设置总超时上限避免基准卡住
+        await asyncio.wait_for(client.embeddings.create(model="stub", input=["慢请求"]), timeout=60)
+        outcome = "ok"
+    except asyncio.TimeoutError:
+        outcome = "still_waiting_after_60s"
+    except Exception as e:
+        outcome = type(e).__name__
+    elapsed = time.perf_counter() - start
+    await client.close()
+    return {
+        "mode": mode,
+        "outcome": outcome,
+        "seconds_until_result": round(elapsed, 2),
+        "upstream_attempts": server.stats["requests"] - requests_before,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="上游 HTTP 连接池基准测试")
+    parser.add_argument("--bursts", type=int, default=5)
+    parser.add_argument("--burst-size", type=int, default=100)
+    parser.add_argument("--pause", type=float, default=0.5, help="突发之间的间隔（秒）")
+    parser.add_argument("--latency", type=float, default=0.05, help="桩服务器每个请求的固定延迟（秒）")
+    parser.add_argument("--parallelism", type=int, default=128, help="桩服务器同时处理的请求数")
+    parser.add_argument("--max-connections", type=int, default=config.HTTP_MAX_CONNECTIONS)
+    parser.add_argument("--max-keepalive", type=int, default=config.HTTP_MAX_KEEPALIVE_CONNECTIONS)
+    parser.add_argument("--slow-latency", type=float, default=3.0, help="超时测试中桩服务器的延迟（秒），0 表示跳过")
+    parser.add_argument("--read-timeout", type=float, default=1.0, help="超时测试中 tuned 客户端的读超时（秒）")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.ERROR)
+    config.HTTP_MAX_CONNECTIONS = args.max_connections
+    config.HTTP_MAX_KEEPALIVE_CONNECTIONS = args.max_keepalive
+
+    server = start_embedding_server(latency=args.latency, parallelism=args.parallelism)
+    try:
+        for mode in ("default", "tuned"):
+            print(json.dumps(asyncio.run(_burst_run(mode, server, args.bursts, args.burst_size, args.pause)),
+                             ensure_ascii=False))
+    finally:
+        server.stop()
+
+    if args.slow_latency > 0:
+        config.EMBEDDING_READ_TIMEOUT = args.read_timeout
+        slow = start_embedding_server(latency=args.slow_latency)
+        try:
+            for mode in ("default", "tuned"):
+                print(json.dumps(asyncio.run(_timeout_run(mode, slow)), ensure_ascii=False))
+        finally:
+            slow.stop()
+
+
+if __name__ == "__main__":
+    main()
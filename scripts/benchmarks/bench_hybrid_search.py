@@ -0,0 +1,113 @@
+# 对比三种检索配置的延迟和Embedding调用次数（使用本地桩Embedding服务器）:
+#   vector:     HYBRID_SEARCH_ENABLED=false，仅向量检索
+#   hybrid:     向量检索 + BM25 词法检索，RRF 融合
+#   hybrid+exact: 在 hybrid 基础上启用名称精确匹配快速路径
+# 查询分两组: name（唯一的节点名称，模拟直接输入零件名/故障码）和 doc（节点的完整索引文本）。
+# 另外单独测量词法检索本身的耗时。
+#
+# 用法:
+#   python scripts/benchmarks/bench_hybrid_search.py --width 10 --depth 3 --roots 200 --latency 0.03
+
+import argparse
+import asyncio
+import json
+import logging
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core import config  # noqa: E402
+from app.services import retrieval  # noqa: E402
+from scripts.benchmarks.fixtures import prepare_index  # noqa: E402
+from scripts.benchmarks.stub_servers import start_embedding_server  # noqa: E402
+
+MODES = {
+    "vector": {"HYBRID_SEARCH_ENABLED": False, "EXACT_NAME_FAST_PATH": False},
+    "hybrid": {"HYBRID_SEARCH_ENABLED": True, "EXACT_NAME_FAST_PATH": False},
+    "hybrid+exact": {"HYBRID_SEARCH_ENABLED": True, "EXACT_NAME_FAST_PATH": True},
+}
+
+
+async def _run_queries(queries, expected, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    correct = 0
+
+    async def _one(query, target):
+        nonlocal correct
+        async with semaphore:
+            start = time.perf_counter()
+            path, _ = await retrieval.aget_context_from_retrieval(query)
+            latencies.append(time.perf_counter() - start)
+            if path == target.replace('>', ' -> '):
+                correct += 1
+
+    await asyncio.gather(*(_one(q, t) for q, t in zip(queries, expected)))
+    # 客户端绑定在当前事件循环上，结束前关闭
+    await retrieval.aclose_clients()
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1e3, 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1e3, 2),
+        "top1_accuracy": round(correct / len(queries), 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="混合检索与名称快速路径基准测试")
+    parser.add_argument("--width", type=int, default=10)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--roots", type=int, default=200, help="根节点数（根节点名称唯一，用作 name 查询）")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.03, help="桩Embedding服务器的延迟（秒）")
+    args = parser.parse_args(argv)
+
+    server = start_embedding_server(latency=args.latency, parallelism=1024)
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        ids, documents = prepare_index(tmp, args.width, args.depth, roots=args.roots)
+        logging.getLogger().setLevel(logging.WARNING)
+        config.EMBEDDING_API_BASE_URL = server.base_url
+        # 禁用查询向量缓存，确保每次非快速路径的查询都访问Embedding服务
+        config.EMBEDDING_CACHE_SIZE = 0
+
+        root_ids = [i for i in ids if '>' not in i]
+        picks = [rng.choice(root_ids) for _ in range(args.queries)]
+        doc_picks = [rng.randrange(len(ids)) for _ in range(args.queries)]
+        query_sets = {
+            "name": (picks, picks),
+            "doc": ([documents[i] for i in doc_picks], [ids[i] for i in doc_picks]),
+        }
+        print(f"节点数={len(ids)} 查询数={args.queries} 并发={args.concurrency} Embedding延迟={args.latency * 1e3:.0f}ms")
+
+        for mode, overrides in MODES.items():
+            for key, value in overrides.items():
+                setattr(config, key, value)
+            retrieval.clear_caches()
+            retrieval.get_snapshot()
+            for set_name, (queries, expected) in query_sets.items():
+                before = server.stats["requests"]
+                result = asyncio.run(_run_queries(queries, expected, args.concurrency))
+                result.update({"mode": mode, "queries": set_name,
+                               "embedding_calls": server.stats["requests"] - before})
+                print(json.dumps(result, ensure_ascii=False))
+
+        lexical = retrieval.get_snapshot().lexical
+        samples = [documents[i] for i in doc_picks]
+        start = time.perf_counter()
+        for q in samples:
+            lexical.search(q, config.HYBRID_CANDIDATES)
+        per_query = (time.perf_counter() - start) / len(samples)
+        print(json.dumps({"lexical_search_us": round(per_query * 1e6, 1), "vocab": len(lexical.vocab)}))
+    server.stop()
+
+
+if __name__ == "__main__":
+    main()
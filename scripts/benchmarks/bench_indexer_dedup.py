@@ -0,0 +1,77 @@
+# 对比索引器开启/关闭内容去重时的Embedding请求量、耗时和 NumPy 向量索引大小（使用本地桩Embedding服务器）。
+# 合成知识库的每个根节点（模拟顶层故障码 "02"、"03" …）下挂完全相同的子树。
+#
+# 用法:
+#   python scripts/benchmarks/bench_indexer_dedup.py --width 6 --depth 3 --roots 50 --latency 0.02
+
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core import config  # noqa: E402
+from scripts import data_indexer  # noqa: E402
+from scripts.benchmarks.stub_servers import start_embedding_server  # noqa: E402
+from scripts.benchmarks.synthetic import count_nodes, make_tree, write_tree  # noqa: E402
+
+
+def _run(tmp_dir: Path, dedup: bool, server) -> dict:
+    config.CHROMADB_PATH = tmp_dir / "chromadb"
+    config.INDEX_MANIFEST_FILE = tmp_dir / "index_manifest.json"
+    config.KNOWLEDGE_BASE_TREE_FILE = tmp_dir / "knowledge_base.tree"
+    config.VECTOR_MATRIX_FILE = tmp_dir / "vectors.npy"
+    config.VECTOR_META_FILE = tmp_dir / "vectors_meta.json"
+    config.LEXICAL_INDEX_FILE = tmp_dir / "lexical_index.npz"
+    config.INDEX_DEDUP_CONTENT = dedup
+    report_file = tmp_dir / "report.json"
+
+    before_requests, before_inputs = server.stats["requests"], server.stats["inputs"]
+    start = time.perf_counter()
+    data_indexer.main(["--full", "--report", str(report_file)])
+    elapsed = time.perf_counter() - start
+    with open(report_file, 'r', encoding='utf-8') as f:
+        report = json.load(f)
+    return {
+        "dedup": dedup,
+        "seconds": round(elapsed, 2),
+        "embedding_requests": server.stats["requests"] - before_requests,
+        "embedding_inputs": server.stats["inputs"] - before_inputs,
+        "written": report["written"],
+        "vector_rows": report.get("vector_rows"),
+        "matrix_bytes": config.VECTOR_MATRIX_FILE.stat().st_size,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="索引器内容去重基准测试")
+    parser.add_argument("--width", type=int, default=6)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--roots", type=int, default=50, help="根节点数，每个根节点下的子树完全相同")
+    parser.add_argument("--latency", type=float, default=0.02, help="桩Embedding服务器每个请求的延迟（秒）")
+    parser.add_argument("--per-item-latency", type=float, default=0.0005, help="桩服务器每条输入的延迟（秒）")
+    args = parser.parse_args(argv)
+
+    server = start_embedding_server(latency=args.latency, per_item_latency=args.per_item_latency, parallelism=8)
+    config.EMBEDDING_API_BASE_URL = server.base_url
+    logging.getLogger().setLevel(logging.WARNING)
+    tree = make_tree(args.width, args.depth, roots=args.roots, shared_subtrees=True)
+    print(f"节点数={count_nodes(tree)} 根节点数={args.roots}")
+    try:
+        for dedup in (False, True):
+            with tempfile.TemporaryDirectory() as tmp:
+                tmp_dir = Path(tmp)
+                config.KNOWLEDGE_BASE_FILE = tmp_dir / "combined_output.json"
+                write_tree(config.KNOWLEDGE_BASE_FILE, tree)
+                print(json.dumps(_run(tmp_dir, dedup, server), ensure_ascii=False))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# 对比索引器 embed_documents 在不同批大小/并发度下的耗时（使用本地桩服务器）
+#
+# 用法:
+#   python scripts/benchmarks/bench_indexer_embedding.py --documents 5000 --max-batch 256
+
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from openai import OpenAI  # noqa: E402
+
+from scripts.data_indexer import embed_documents  # noqa: E402
+from scripts.benchmarks.stub_servers import start_embedding_server  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="索引器 Embedding 批处理基准测试")
+    parser.add_argument("--documents", type=int, default=4000, help="文档数量")
+    parser.add_argument("--latency", type=float, default=0.02, help="桩服务器每个请求的固定延迟（秒）")
+    parser.add_argument("--per-item-latency", type=float, default=0.0005, help="桩服务器每条输入的延迟（秒）")
+    parser.add_argument("--max-batch", type=int, default=0, help="桩服务器允许的最大批大小，0 表示不限制")
+    parser.add_argument("--failure-rate", type=float, default=0.05, help="桩服务器随机失败概率")
+    parser.add_argument("--parallelism", type=int, default=8, help="桩服务器并行处理能力")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.CRITICAL)
+    server = start_embedding_server(
+        latency=args.latency, per_item_latency=args.per_item_latency,
+        max_batch=args.max_batch, failure_rate=args.failure_rate, parallelism=args.parallelism,
+    )
+    client = OpenAI(api_key="stub", base_url=server.base_url, max_retries=0)
+    documents = [f"节点{i}\n排查方法、排查依据: 检查外观 {i}" for i in range(args.documents)]
+
+    # 单个大请求（相当于原先的行为）与若干批处理配置
+    configs = [(len(documents), 1), (64, 1), (64, 4), (64, 8), (256, 8)]
+    print(f"文档数={len(documents)} 桩服务器并行度={args.parallelism} 失败率={args.failure_rate}")
+    print(f"{'batch_size':>10} {'concurrency':>11} {'耗时(s)':>8} {'成功向量':>8} {'请求数':>6}")
+    try:
+        for batch_size, concurrency in configs:
+            before = server.stats["requests"]
+            start = time.perf_counter()
+            embeddings = embed_documents(
+                documents, client, batch_size=batch_size, concurrency=concurrency, backoff=0.05
+            )
+            elapsed = time.perf_counter() - start
+            ok = sum(1 for e in embeddings if e is not None) if embeddings else 0
+            print(f"{batch_size:>10} {concurrency:>11} {elapsed:>8.2f} {ok:>8} {server.stats['requests'] - before:>6}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
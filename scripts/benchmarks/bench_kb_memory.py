@@ -0,0 +1,106 @@
+# 比较知识库加载方式的内存占用：json.load / DictTree / CompactTree / MmapTree / 索引器流式遍历
+#
+# 每种方式在独立子进程中运行，以得到互不干扰的峰值 RSS。
+# 规模以 --base-roots 个根节点（每个根节点下 width^0 + ... + width^(depth-1) 个节点）为 1x。
+#
+# 用法:
+#   python scripts/benchmarks/bench_kb_memory.py --scales 1 10 100
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+MODES = ["json_load", "dict_tree", "compact_tree", "mmap_tree", "index_stream"]
+
+
+def _measure(mode: str, file_path: str):
+    """在当前进程中按指定方式加载文件，输出 JSON 格式的测量结果。"""
+    from app.services.tree_store import CompactTree, DictTree, MmapTree
+    from scripts.data_indexer import iter_index_records, content_hash
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    tracemalloc.start()
+    start = time.perf_counter()
+    if mode == "json_load":
+        with open(file_path, "r", encoding="utf-8") as f:
+            obj = json.load(f)
+        nodes = None
+    elif mode == "dict_tree":
+        obj = DictTree.load(file_path)
+        nodes = len(obj)
+    elif mode == "compact_tree":
+        obj = CompactTree.load(file_path)
+        nodes = len(obj)
+    elif mode == "mmap_tree":
+        # 二进制文件由父进程预先编译；这里只计打开映射的开销
+        obj = MmapTree.load(file_path + ".tree")
+        nodes = len(obj)
+    else:
+        # 索引器只需要保留 path_id -> 哈希，文档逐个产出后即可丢弃
+        obj = {path_id: content_hash(doc) for doc, _, path_id in iter_index_records(file_path)}
+        nodes = len(obj)
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        "mode": mode,
+        "nodes": nodes,
+        "seconds": round(elapsed, 3),
+        "retained_mb": round(current / 2**20, 1),
+        "peak_alloc_mb": round(peak / 2**20, 1),
+        "peak_rss_delta_mb": round((rss_after - rss_before) / 1024, 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="知识库加载内存基准测试")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100], help="数据规模倍数")
+    parser.add_argument("--base-roots", type=int, default=10, help="1x 规模的根节点数")
+    parser.add_argument("--width", type=int, default=10, help="每个节点的子节点数")
+    parser.add_argument("--depth", type=int, default=4, help="树的层数")
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--measure", nargs=2, metavar=("MODE", "FILE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        _measure(*args.measure)
+        return
+
+    from app.services.tree_store import CompactTree, compile_tree
+    from scripts.benchmarks.synthetic import make_tree, write_tree
+
+    print(f"{'规模':>5} {'文件MB':>7} {'方式':>13} {'节点数':>9} {'耗时s':>7} {'常驻MB':>8} {'分配峰值MB':>10} {'RSS增量MB':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in args.scales:
+            file_path = os.path.join(tmp, f"kb_{scale}x.json")
+            data = make_tree(args.width, args.depth, roots=args.base_roots * scale)
+            write_tree(file_path, data)
+            del data
+            if "mmap_tree" in args.modes:
+                compile_tree(CompactTree.load(file_path), file_path + ".tree", source_path=file_path)
+            size_mb = os.path.getsize(file_path) / 2**20
+            for mode in args.modes:
+                out = subprocess.run(
+                    [sys.executable, __file__, "--measure", mode, file_path],
+                    capture_output=True, text=True, check=True,
+                )
+                r = json.loads(out.stdout.strip().splitlines()[-1])
+                print(
+                    f"{scale:>4}x {size_mb:>7.1f} {mode:>13} {str(r['nodes'] or '-'):>9} {r['seconds']:>7.2f} "
+                    f"{r['retained_mb']:>8.1f} {r['peak_alloc_mb']:>10.1f} {r['peak_rss_delta_mb']:>9.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
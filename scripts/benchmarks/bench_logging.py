@@ -0,0 +1,128 @@
+# 对比每个请求在请求线程上的日志开销:
+#   legacy:        旧实现，f-string 记录完整提示词 + json.dumps(indent=2) 的命中详情，同步写文件
+#   sync:          新实现，同步写出；大体积内容默认不记录，只记录摘要
+#   async:         新实现，日志记录入队，格式化与写出在后台线程完成
+#   async-payload: 新实现 + LOG_PAYLOAD_SAMPLE_RATE=1（每个请求都记录截断后的提示词和命中详情）
+#
+# 用法:
+#   python scripts/benchmarks/bench_logging.py --requests 500 --width 6 --depth 4
+
+import argparse
+import json
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core import config  # noqa: E402
+from app.core.log import LazyJson, Truncated, payload_enabled, setup_logging, shutdown_logging  # noqa: E402
+from scripts.benchmarks.synthetic import make_tree  # noqa: E402
+
+
+def _make_request_data(width: int, depth: int):
+    subtree = make_tree(width, depth, desc_len=64)[0]
+    prompt = "### 知识子树\n" + json.dumps(subtree, indent=2, ensure_ascii=False) + "\n### 用户问题\n点火线圈失效怎么排查？"
+    results = {
+        "ids": [["00", "00>节点1-2", "01>节点1-0>节点2-3"]],
+        "distances": [[0.1234567, 0.2345678, 0.3456789]],
+        "documents": [[f"名称: 节点{i}\n描述: " + "排查方法" * 200 for i in range(3)]],
+    }
+    return "点火线圈失效怎么排查？", results, prompt
+
+
+def _legacy_request(query, search_results, prompt):
+    # 与旧版 retrieval / main 中的日志语句相同
+    logging.info(f"收到问题: {query}")
+    distances = search_results.get('distances', [[]])[0]
+    documents = search_results.get('documents', [[]])[0]
+    pretty_results = {
+        "ids": search_results['ids'][0],
+        "distances": [round(d, 4) for d in distances] if distances else [],
+        "documents": [doc.replace('\n', ' ') for doc in documents] if documents else []
+    }
+    logging.info(f"知识库命中! 查询: '{query}'. 检索结果: {json.dumps(pretty_results, ensure_ascii=False, indent=2)}")
+    top_result_id = search_results['ids'][0][0]
+    logging.info(f"检索到的最相关路径ID: {top_result_id}")
+    logging.info(f"成功检索到上下文路径: {top_result_id}")
+    logging.info(f"构建的提示: \n{prompt}")
+
+
+def _new_request(query, search_results, prompt):
+    # 与当前 retrieval / answer / main 中的日志语句相同
+    logging.info("收到问题: %s", Truncated(query))
+    method, ids, scores = "vector", search_results['ids'][0], search_results.get('distances', [[]])[0]
+    if payload_enabled():
+        pretty_results = {"method": method, "ids": ids, "scores": [round(sc, 4) for sc in scores]}
+        logging.info("知识库命中! 查询: '%s'. 检索结果: %s", Truncated(query), Truncated(LazyJson(pretty_results, indent=2)))
+    else:
+        logging.info(
+            "知识库命中! 查询: '%s'. 命中 %d 条（%s），最佳得分 %s",
+            Truncated(query), len(ids), method, round(scores[0], 4) if scores else None
+        )
+    top_result_id = search_results['ids'][0][0]
+    logging.info("检索到的最相关路径ID: %s", top_result_id)
+    logging.info("成功检索到上下文路径: %s", top_result_id)
+    if payload_enabled():
+        logging.info("构建的提示（%d 字符）: \n%s", len(prompt), Truncated(prompt))
+
+
+def _run(mode: str, requests: int, data, log_path: Path) -> dict:
+    config.LOG_ASYNC = mode.startswith("async")
+    config.LOG_PAYLOAD_SAMPLE_RATE = 1.0 if mode == "async-payload" else 0.0
+    with open(log_path, "w", encoding="utf-8") as stream:
+        if mode == "legacy":
+            root = logging.getLogger()
+            for h in list(root.handlers):
+                root.removeHandler(h)
+            handler = logging.StreamHandler(stream)
+            handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            root.addHandler(handler)
+            root.setLevel(logging.INFO)
+            call = _legacy_request
+        else:
+            setup_logging(stream=stream)
+            call = _new_request
+
+        latencies = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            call(*data)
+            latencies.append(time.perf_counter() - start)
+        # 异步模式下等待后台线程写完，单独统计
+        flush_start = time.perf_counter()
+        shutdown_logging()
+        flush = time.perf_counter() - flush_start
+        stream.flush()
+
+    latencies.sort()
+    return {
+        "mode": mode,
+        "mean_us": round(statistics.mean(latencies) * 1e6, 1),
+        "p99_us": round(latencies[int(len(latencies) * 0.99) - 1] * 1e6, 1),
+        "background_flush_s": round(flush, 3),
+        "log_bytes": log_path.stat().st_size,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="请求日志开销基准测试")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--width", type=int, default=6)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--modes", default="legacy,sync,async,async-payload")
+    args = parser.parse_args(argv)
+
+    data = _make_request_data(args.width, args.depth)
+    print(f"提示词大小: {len(data[2]) / 1024:.0f} KB，请求数: {args.requests}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in args.modes.split(","):
+            print(json.dumps(_run(mode, args.requests, data, Path(tmp) / f"{mode}.log"), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+# 对比 find_node_by_path 的逐层线性扫描与路径哈希索引的查找耗时
+#
+# 用法:
+#   python scripts/benchmarks/bench_path_index.py --width 2000 --depth 2
+#   python scripts/benchmarks/bench_path_index.py --width 10 --depth 5
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.services.tree_store import build_path_index  # noqa: E402
+from scripts.benchmarks.synthetic import make_tree, count_nodes, iter_path_ids  # noqa: E402
+
+
+def scan_node_by_path(data, path_id: str):
+    """原 find_node_by_path 的逐层扫描实现，作为对照组。"""
+    path_parts = path_id.split('>')
+    current_level = data
+    found_node = None
+    for i, part in enumerate(path_parts):
+        found_node = None
+        if not isinstance(current_level, list):
+            return None
+        for node in current_level:
+            if node.get('name') == part:
+                found_node = node
+                if i < len(path_parts) - 1:
+                    current_level = node.get('child', [])
+                break
+        if found_node is None:
+            return None
+    return found_node
+
+
+def _time_lookups(lookup, queries, repeat: int) -> float:
+    """返回每次查找的平均耗时（微秒）。"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for q in queries:
+            lookup(q)
+        best = min(best, time.perf_counter() - start)
+    return best / len(queries) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="路径查找基准测试：线性扫描 vs 路径索引")
+    parser.add_argument("--width", type=int, default=1000, help="每个节点的子节点数")
+    parser.add_argument("--depth", type=int, default=2, help="树的层数")
+    parser.add_argument("--queries", type=int, default=2000, help="随机查询的路径数")
+    parser.add_argument("--repeat", type=int, default=5, help="重复次数，取最快一次")
+    args = parser.parse_args()
+
+    data = make_tree(args.width, args.depth)
+    all_paths = list(iter_path_ids(data))
+    rng = random.Random(42)
+    queries = [rng.choice(all_paths) for _ in range(args.queries)]
+
+    start = time.perf_counter()
+    index = build_path_index(data)
+    build_ms = (time.perf_counter() - start) * 1e3
+
+    # 校验两种实现返回同一节点
+    for q in queries[:200]:
+        assert scan_node_by_path(data, q) is index.get(q), q
+
+    scan_us = _time_lookups(lambda q: scan_node_by_path(data, q), queries, args.repeat)
+    index_us = _time_lookups(index.get, queries, args.repeat)
+
+    print(f"树规模: width={args.width} depth={args.depth} 节点数={count_nodes(data)}")
+    print(f"索引构建耗时: {build_ms:.1f} ms")
+    print(f"线性扫描: {scan_us:10.2f} us/次")
+    print(f"路径索引: {index_us:10.2f} us/次")
+    print(f"加速比:   {scan_us / index_us:10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# 比较查询向量微批处理在不同窗口下的延迟/吞吐权衡（使用本地桩Embedding服务器）
+#
+# 桩服务器模拟 GPU 推理服务：每个请求有固定开销，服务端同时只能处理 --parallelism 个请求，
+# 因此合并请求可以显著提升吞吐；窗口越大，单个请求的排队延迟越高。
+#
+# 用法:
+#   python scripts/benchmarks/bench_query_batching.py --requests 1000 --concurrency 128 --windows 0 2 5 10
+
+import argparse
+import asyncio
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core import config  # noqa: E402
+from app.services import retrieval  # noqa: E402
+from scripts.benchmarks.stub_servers import start_embedding_server  # noqa: E402
+
+
+async def _run(requests: int, concurrency: int, tag: str):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def _one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            vector = await retrieval.aembed_query(f"点火线圈失效 {tag} {i}")
+            latencies.append(time.perf_counter() - start)
+            return vector is not None
+
+    start = time.perf_counter()
+    ok = await asyncio.gather(*(_one(i) for i in range(requests)))
+    elapsed = time.perf_counter() - start
+    batcher = retrieval.get_embedding_batcher()
+    await retrieval.aclose_clients()
+    latencies.sort()
+    return {
+        "ok": sum(ok),
+        "rps": requests / elapsed,
+        "p50_ms": statistics.median(latencies) * 1e3,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1e3,
+        "avg_batch": batcher.stats()["avg_batch_size"] if batcher else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查询向量微批处理基准测试")
+    parser.add_argument("--requests", type=int, default=1000, help="请求总数")
+    parser.add_argument("--concurrency", type=int, default=128, help="并发请求数")
+    parser.add_argument("--windows", type=float, nargs="+", default=[0, 2, 5, 10], help="要比较的窗口（毫秒）")
+    parser.add_argument("--max-batch", type=int, default=32, help="单个批次最多合并的查询数")
+    parser.add_argument("--latency", type=float, default=0.02, help="桩服务器每个请求的固定开销（秒）")
+    parser.add_argument("--per-item-latency", type=float, default=0.0005, help="桩服务器每条输入的耗时（秒）")
+    parser.add_argument("--parallelism", type=int, default=4, help="桩服务器同时处理的请求数")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    server = start_embedding_server(
+        latency=args.latency, per_item_latency=args.per_item_latency, parallelism=args.parallelism
+    )
+    config.EMBEDDING_API_BASE_URL = server.base_url
+    config.EMBEDDING_CACHE_SIZE = 0
+    config.QUERY_BATCH_MAX_SIZE = args.max_batch
+
+    print(f"请求数={args.requests} 并发={args.concurrency} 服务端并行度={args.parallelism} "
+          f"开销={args.latency * 1e3:.0f}ms+{args.per_item_latency * 1e3:.1f}ms/条")
+    print(f"{'窗口ms':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'平均批大小':>10} {'服务端请求数':>12}")
+    try:
+        for window in args.windows:
+            config.QUERY_BATCH_WINDOW_MS = window
+            retrieval.clear_caches()
+            before = server.stats["requests"]
+            r = asyncio.run(_run(args.requests, args.concurrency, f"w{window}"))
+            assert r["ok"] == args.requests
+            print(f"{window:>7g} {r['rps']:>8.1f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+                  f"{r['avg_batch']:>10.1f} {server.stats['requests'] - before:>12}")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# SSE 数据块编码的吞吐对比，以及增量合并对写入次数的影响:
+#   pydantic: 旧实现，每个 token 构建 StreamingChatCompletion（新 uuid 与时间戳）后 model_dump_json
+#   encoder:  ChunkEncoder，固定 id/created/model 的预编码模板
+# 运行前会先用随机文本（含引号、反斜杠、控制字符、中文、emoji）校验两者输出逐字节一致。
+#
+# 用法:
+#   python scripts/benchmarks/bench_sse_encoding.py --chunks 200000
+#   python scripts/benchmarks/bench_sse_encoding.py --coalesce-ms 20 --tokens 500 --token-interval 0.002
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.main import ChoiceDelta, Delta, StreamingChatCompletion  # noqa: E402
+from app.services.sse import ChunkEncoder, coalesce_chunks  # noqa: E402
+
+_ALPHABET = 'ab 中文词　"\\/\n\r\t\b\f\x00\x01\x1f\x7f \U0001F600'
+
+
+def _random_text(rng: random.Random) -> str:
+    return "".join(rng.choice(_ALPHABET) for _ in range(rng.randint(0, 12)))
+
+
+def _pydantic_chunk(model_name: str, text) -> bytes:
+    # 旧版 stream_generator 中的写法
+    response_chunk = StreamingChatCompletion(
+        model=model_name,
+        choices=[ChoiceDelta(delta=Delta(content=text))]
+    )
+    json_str = response_chunk.model_dump_json() if hasattr(response_chunk, 'model_dump_json') else response_chunk.json()
+    return f"data: {json_str}\n\n".encode("utf-8")
+
+
+def check_compatibility(samples: int = 20000):
+    """以相同的 id/created 对比两种实现的输出。"""
+    rng = random.Random(0)
+    for i in range(samples):
+        model_name = _random_text(rng) or "m"
+        encoder = ChunkEncoder(model_name)
+        text = _random_text(rng)
+        expected = StreamingChatCompletion(
+            id=encoder.completion_id, created=encoder.created, model=model_name,
+            choices=[ChoiceDelta(delta=Delta(content=text))]
+        ).model_dump_json()
+        assert encoder.content(text) == f"data: {expected}\n\n".encode("utf-8"), (model_name, text)
+        final = StreamingChatCompletion(
+            id=encoder.completion_id, created=encoder.created, model=model_name,
+            choices=[ChoiceDelta(delta=Delta(), finish_reason="stop")]
+        ).model_dump_json()
+        assert encoder.stop() == f"data: {final}\n\n".encode("utf-8"), model_name
+    print(f"兼容性校验通过（{samples} 组随机样本）")
+
+
+def bench_encoding(chunks: int):
+    rng = random.Random(1)
+    tokens = [_random_text(rng) for _ in range(1000)]
+    model_name = "Qwen1.5-14B-Chat"
+
+    start = time.perf_counter()
+    for i in range(chunks):
+        _pydantic_chunk(model_name, tokens[i % 1000])
+    legacy = time.perf_counter() - start
+
+    start = time.perf_counter()
+    encoder = ChunkEncoder(model_name)
+    for i in range(chunks):
+        encoder.content(tokens[i % 1000])
+    fast = time.perf_counter() - start
+
+    print(json.dumps({
+        "chunks": chunks,
+        "pydantic_chunks_per_s": round(chunks / legacy),
+        "encoder_chunks_per_s": round(chunks / fast),
+        "speedup": round(legacy / fast, 1),
+    }))
+
+
+async def _fake_llm(tokens: int, interval: float):
+    for i in range(tokens):
+        await asyncio.sleep(interval)
+        yield f"词{i} "
+
+
+async def bench_coalescing(tokens: int, interval: float, window_ms: float, max_chars: int):
+    for label, window in (("off", 0), (f"{window_ms}ms", window_ms)):
+        stream = _fake_llm(tokens, interval)
+        if window:
+            stream = coalesce_chunks(stream, window, max_chars)
+        start = time.perf_counter()
+        writes = 0
+        first = None
+        text = []
+        async for chunk in stream:
+            if first is None:
+                first = time.perf_counter() - start
+            writes += 1
+            text.append(chunk)
+        total = time.perf_counter() - start
+        assert "".join(text) == "".join(f"词{i} " for i in range(tokens))
+        print(json.dumps({
+            "coalesce": label, "tokens": tokens, "writes": writes,
+            "first_chunk_ms": round(first * 1000, 1), "total_s": round(total, 3),
+        }))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="SSE 编码吞吐基准测试")
+    parser.add_argument("--chunks", type=int, default=200000)
+    parser.add_argument("--tokens", type=int, default=500, help="合并测试中模拟的 token 数")
+    parser.add_argument("--token-interval", type=float, default=0.002, help="模拟的 token 间隔（秒）")
+    parser.add_argument("--coalesce-ms", type=float, default=20)
+    parser.add_argument("--coalesce-max-chars", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    check_compatibility()
+    bench_encoding(args.chunks)
+    asyncio.run(bench_coalescing(args.tokens, args.token_interval, args.coalesce_ms, args.coalesce_max_chars))
+
+
+if __name__ == "__main__":
+    main()
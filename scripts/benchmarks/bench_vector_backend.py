@@ -0,0 +1,89 @@
+# 比较 ChromaDB 与进程内 NumPy 暴力检索的查询延迟和召回率
+#
+# NumPy 后端为精确检索，作为召回率的基准；ChromaDB（HNSW）为近似检索。
+#
+# 用法:
+#   python scripts/benchmarks/bench_vector_backend.py --width 30 --depth 3 --queries 500 --k 10
+
+import argparse
+import logging
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core import config  # noqa: E402
+from app.services import retrieval  # noqa: E402
+from app.services.vector_store import ChromaBackend, NumpyBackend, export_vectors  # noqa: E402
+from scripts.benchmarks.fixtures import prepare_index  # noqa: E402
+from scripts.benchmarks.stub_servers import fake_embedding  # noqa: E402
+
+
+def _latencies(backend, queries, k):
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        r = backend.query(q, k)
+        latencies.append(time.perf_counter() - start)
+        results.append(r["ids"][0])
+    latencies.sort()
+    return latencies, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="向量检索后端基准测试")
+    parser.add_argument("--width", type=int, default=30)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--dim", type=int, default=256, help="向量维度")
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.05, help="查询向量相对文档向量的噪声幅度")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        start = time.perf_counter()
+        ids, documents = prepare_index(tmp, args.width, args.depth, dim=args.dim)
+        logging.getLogger().setLevel(logging.WARNING)
+        print(f"节点数={len(ids)} 维度={args.dim} 准备耗时={time.perf_counter() - start:.1f}s")
+
+        collection = retrieval.get_chroma_collection()
+        export_vectors(collection, config.VECTOR_MATRIX_FILE, config.VECTOR_META_FILE)
+
+        rng = np.random.default_rng(0)
+        queries = []
+        for i in rng.choice(len(documents), size=args.queries):
+            v = np.asarray(fake_embedding(documents[i], args.dim)) + rng.normal(0, args.noise, args.dim)
+            queries.append(v.tolist())
+
+        backends = {
+            "chroma": ChromaBackend(collection),
+            "numpy(memmap)": NumpyBackend.load(config.VECTOR_MATRIX_FILE, config.VECTOR_META_FILE),
+            "numpy(ram)": NumpyBackend.load(config.VECTOR_MATRIX_FILE, config.VECTOR_META_FILE, mmap=False),
+        }
+        # 预热
+        for backend in backends.values():
+            _latencies(backend, queries[:10], args.k)
+
+        exact = None
+        rows = []
+        for name, backend in backends.items():
+            latencies, results = _latencies(backend, queries, args.k)
+            if name.startswith("numpy") and exact is None:
+                exact = results
+            rows.append((name, latencies, results))
+
+        print(f"{'后端':>14} {'p50 ms':>8} {'p95 ms':>8} {'recall@' + str(args.k):>10}")
+        for name, latencies, results in rows:
+            recall = statistics.mean(len(set(r) & set(e)) / len(e) for r, e in zip(results, exact))
+            p95 = latencies[int(len(latencies) * 0.95) - 1]
+            print(f"{name:>14} {statistics.median(latencies) * 1e3:>8.3f} {p95 * 1e3:>8.3f} {recall:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+# 多进程服务基准：按不同 worker 数、是否在主进程中预加载索引启动服务端（python -m app.server 的方式），
+# 统计启动耗时（到 GET / 首次返回 200）、各进程内存（RSS / PSS / 私有内存）和 /v1/chat/completions 的吞吐与延迟。
+#
+# PSS 把共享页按共享进程数均摊，预加载时 NumPy 向量矩阵、mmap 知识库等只读数据在 worker 间共享，
+# 总 PSS 应明显低于不预加载时（每个 worker 各自加载一份）。内存数据读取自 /proc/<pid>/smaps_rollup，仅 Linux 可用。
+#
+# 用法:
+#   python scripts/benchmarks/bench_workers.py --width 8 --depth 4 --workers 1,2,4 --concurrency 32 --requests 400
+#   python scripts/benchmarks/bench_workers.py --workers 4 --env KNOWLEDGE_BASE_LOADER=mmap --output workers.json
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from scripts.benchmarks.bench_e2e_load import (  # noqa: E402
+    _build_questions, _stop, build_index, run_level, start_app, start_stub_servers,
+)
+from scripts.benchmarks.synthetic import make_tree  # noqa: E402
+
+_MEMORY_FIELDS = {"Rss": "rss", "Pss": "pss", "Private_Clean": "private", "Private_Dirty": "private"}
+
+
+def _memory(pid: int) -> dict:
+    """读取进程的 RSS / PSS / 私有内存（MB）。"""
+    usage = {"rss": 0, "pss": 0, "private": 0}
+    with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+        for line in f:
+            name, _, rest = line.partition(":")
+            if name in _MEMORY_FIELDS:
+                usage[_MEMORY_FIELDS[name]] += int(rest.split()[0])
+    return {key: round(value / 1024, 1) for key, value in usage.items()}
+
+
+def _children(pid: int):
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", 'r') as f:
+            return [int(child) for child in f.read().split()]
+    except FileNotFoundError:
+        return []
+
+
+def _start_server(base: dict, workers: int, preload: bool, timeout: float = 120.0):
+    """启动服务端并等待 GET / 返回 200，返回 (进程, 端口, 启动耗时)。"""
+    start = time.perf_counter()
+    process, port = start_app(
+        base["data_dir"], base["embedding_url"], base["llm_url"], base["log_file"], base["server_env"],
+        workers=workers, preload=preload,
+    )
+    # 多 worker 时主进程先绑定端口再加载索引，端口可连接不代表已能处理请求
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1.0).status_code == 200:
+                return process, port, time.perf_counter() - start
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.05)
+    _stop(process)
+    raise TimeoutError(f"等待服务端启动超时，见 {base['log_file']}")
+
+
+def _wait_for_workers(pid: int, workers: int, timeout: float = 60.0):
+    """等待所有 worker 都能接受请求（多 worker 时 GET / 成功只说明至少一个 worker 已就绪）。"""
+    if workers <= 1:
+        return
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if len(_children(pid)) >= workers:
+            break
+        time.sleep(0.1)
+
+
+def run_case(base: dict, workers: int, preload: bool, questions, args) -> dict:
+    process, port, startup = _start_server(base, workers, preload)
+    try:
+        _wait_for_workers(process.pid, workers)
+        load = asyncio.run(run_level(
+            f"http://127.0.0.1:{port}", questions, args.concurrency, args.requests, args.warmup, True,
+        ))
+        # 压测后读取内存：此时各 worker 已实际访问过索引数据
+        pids = [process.pid] + _children(process.pid)
+        processes = [{"pid": pid, **_memory(pid)} for pid in pids]
+    finally:
+        _stop(process)
+
+    serving = processes[1:] if workers > 1 else processes
+    return {
+        "workers": workers,
+        "preload": preload,
+        "startup_s": round(startup, 3),
+        "memory_mb": {
+            "rss": round(sum(p["rss"] for p in processes), 1),
+            "pss": round(sum(p["pss"] for p in processes), 1),
+            "private": round(sum(p["private"] for p in processes), 1),
+            "per_worker_private": round(sum(p["private"] for p in serving) / len(serving), 1),
+        },
+        "processes": processes,
+        **{key: load[key] for key in ("ok", "errors", "rps", "ttft_ms", "latency_ms")},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="多进程服务基准测试")
+    parser.add_argument("--width", type=int, default=8)
+    parser.add_argument("--depth", type=int, default=4)
+    parser.add_argument("--roots", type=int, default=1)
+    parser.add_argument("--dim", type=int, default=256, help="桩 Embedding 服务器返回的向量维度")
+    parser.add_argument("--workers", default="1,2,4", help="逗号分隔的 worker 数")
+    parser.add_argument("--no-preload-only", action="store_true", help="只测试不预加载的情况")
+    parser.add_argument("--preload-only", action="store_true", help="只测试预加载的情况")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--embedding-latency", type=float, default=0.02)
+    parser.add_argument("--ttft", type=float, default=0.05)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--token-rate", type=float, default=200.0)
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="传给服务端的环境变量，可重复；默认 VECTOR_BACKEND=numpy")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="将结果以 JSON 写入该文件")
+    args = parser.parse_args(argv)
+
+    worker_counts = [int(n) for n in args.workers.split(",") if n.strip()]
+    preload_modes = [True, False]
+    if args.preload_only:
+        preload_modes = [True]
+    elif args.no_preload_only:
+        preload_modes = [False]
+    server_env = {"VECTOR_BACKEND": "numpy"}
+    server_env.update(dict(item.split("=", 1) for item in args.env))
+    token_interval = 1.0 / args.token_rate if args.token_rate > 0 else 0.0
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = Path(tmp)
+        log_file = data_dir / "bench_workers.log"
+        stubs, embedding_url, llm_url = start_stub_servers(
+            log_file, args.dim, args.embedding_latency, args.ttft, args.tokens, token_interval
+        )
+        try:
+            records, index_seconds = build_index(
+                data_dir, embedding_url, make_tree(args.width, args.depth, roots=args.roots)
+            )
+            questions = _build_questions(records, "doc", args.requests + args.warmup, args.seed)
+            print(f"节点数={len(records)} 索引耗时={index_seconds:.1f}s", file=sys.stderr)
+            base = {
+                "data_dir": data_dir, "embedding_url": embedding_url, "llm_url": llm_url,
+                "log_file": log_file, "server_env": server_env,
+            }
+            for workers in worker_counts:
+                # 单 worker 时不 fork，是否预加载没有区别
+                for preload in (preload_modes if workers > 1 else preload_modes[:1]):
+                    result = run_case(base, workers, preload, questions, args)
+                    summary = {k: v for k, v in result.items() if k != "processes"}
+                    print(json.dumps(summary, ensure_ascii=False), file=sys.stderr)
+                    results.append(result)
+        finally:
+            for process in reversed(stubs):
+                _stop(process)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "nodes": len(records),
+            "cpu_count": os.cpu_count(),
+            "params": {k: (str(v) if isinstance(v, Path) else v) for k, v in vars(args).items()},
+            "server_env": server_env,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        args.output.write_text(text, encoding="utf-8")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
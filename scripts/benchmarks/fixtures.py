@@ -0,0 +1,57 @@
+# 基准测试共用的准备工作：在临时目录中生成合成知识库并写入向量索引
+
+from pathlib import Path
+
+from app.core import config
+from scripts.benchmarks.stub_servers import fake_embedding
+from scripts.benchmarks.synthetic import make_tree, write_tree
+
+
+def use_data_dir(data_dir):
+    """就地修改 app.core.config 中的知识库与索引文件路径，全部指向 data_dir。"""
+    data_dir = Path(data_dir)
+    config.DB_DIR = data_dir
+    config.KNOWLEDGE_BASE_FILE = data_dir / "combined_output.json"
+    config.CHROMADB_PATH = data_dir / "chromadb"
+    config.INDEX_MANIFEST_FILE = data_dir / "index_manifest.json"
+    config.KNOWLEDGE_BASE_TREE_FILE = data_dir / "knowledge_base.tree"
+    config.VECTOR_MATRIX_FILE = data_dir / "vectors.npy"
+    config.VECTOR_META_FILE = data_dir / "vectors_meta.json"
+    config.LEXICAL_INDEX_FILE = data_dir / "lexical_index.npz"
+
+
+def prepare_index(tmp_dir, width: int, depth: int, dim: int = 64, roots: int = None):
+    """
+    在 tmp_dir 中生成合成知识库，并以桩服务器相同的确定性向量写入 ChromaDB。
+
+    会就地修改 app.core.config 中的文件路径，使服务端代码读取临时目录中的数据。
+
+    Returns:
+        tuple[list, list]: (路径ID列表, 对应的索引文档列表)
+    """
+    import chromadb
+    from scripts.data_indexer import build_lexical_index_file, iter_index_records
+
+    use_data_dir(tmp_dir)
+    write_tree(config.KNOWLEDGE_BASE_FILE, make_tree(width, depth, roots=roots))
+
+    records = list(iter_index_records(config.KNOWLEDGE_BASE_FILE))
+    documents = [r[0] for r in records]
+    ids = [r[2] for r in records]
+
+    client = chromadb.PersistentClient(path=str(config.CHROMADB_PATH))
+    collection = client.get_or_create_collection(
+        name=config.CHROMA_COLLECTION_NAME,
+        metadata={"hnsw:space": "cosine"}
+    )
+    batch = 2000
+    for start in range(0, len(records), batch):
+        chunk = records[start:start + batch]
+        collection.upsert(
+            ids=[r[2] for r in chunk],
+            documents=[r[0] for r in chunk],
+            metadatas=[r[1] for r in chunk],
+            embeddings=[fake_embedding(r[0], dim) for r in chunk],
+        )
+    build_lexical_index_file()
+    return ids, documents
@@ -0,0 +1,39 @@
+# 以指定的数据目录启动服务端，供端到端压测在独立进程中运行被测服务。
+#
+# 数据目录由环境变量 BENCH_DATA_DIR 指定（目录结构见 fixtures.use_data_dir），
+# 其余配置（EMBEDDING_API_BASE_URL、LLM_API_BASE_URL、VECTOR_BACKEND 等）照常通过环境变量传入。
+#
+# 用法:
+#   BENCH_DATA_DIR=/tmp/bench python scripts/benchmarks/serve_app.py --port 8000 [--workers 4]
+#   BENCH_DATA_DIR=/tmp/bench uvicorn scripts.benchmarks.serve_app:app --port 8000
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+project_root = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from scripts.benchmarks.fixtures import use_data_dir  # noqa: E402
+
+if os.getenv("BENCH_DATA_DIR"):
+    use_data_dir(os.environ["BENCH_DATA_DIR"])
+
+from app.main import app  # noqa: E402,F401
+
+
+def main():
+    from app.server import serve
+
+    parser = argparse.ArgumentParser(description="以压测数据目录启动服务端")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1, help="worker 进程数（见 app.server）")
+    parser.add_argument("--no-preload", action="store_true", help="多 worker 时不在主进程中预加载索引")
+    args = parser.parse_args()
+    sys.exit(serve(app, args.host, args.port, args.workers, False if args.no_preload else None, log_level="warning"))
+
+
+if __name__ == "__main__":
+    main()
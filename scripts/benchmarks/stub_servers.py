@@ -0,0 +1,241 @@
+# 本地 OpenAI 兼容的桩服务器，用于在没有真实模型服务时测试和压测
+#
+# 同一个服务器同时提供 /v1/embeddings 和 /v1/chat/completions（支持流式）。
+#
+# 用法:
+#   python scripts/benchmarks/stub_servers.py embedding --port 8001 --latency 0.05
+#   python scripts/benchmarks/stub_servers.py llm --port 8002 --ttft 0.2 --tokens 200 --token-interval 0.01
+#
+# 也可以在基准脚本中以线程方式启动:
+#   server = start_embedding_server(latency=0.05)
+#   base_url = server.base_url
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def fake_embedding(text: str, dim: int):
+    """根据文本哈希生成确定性的单位向量，相同文本总是得到相同向量。"""
+    values = []
+    counter = 0
+    while len(values) < dim:
+        digest = hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+        values.extend(v / 2**31 - 1.0 for v in struct.unpack("<8I", digest))
+        counter += 1
+    values = values[:dim]
+    norm = math.sqrt(sum(v * v for v in values)) or 1.0
+    return [v / norm for v in values]
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # 响应头和响应体分两次写出，长连接上 Nagle 算法与延迟确认叠加会给每个请求增加约 40ms
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        # 压测时不输出访问日志
+        pass
+
+    def _send_json(self, status: int, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_POST(self):
+        stats = self.server.stats
+        with self.server.lock:
+            stats["requests"] += 1
+        payload = self._read_json()
+        if self.path.rstrip("/").endswith("/embeddings"):
+            self._handle_embeddings(payload)
+        elif self.path.rstrip("/").endswith("/chat/completions"):
+            self._handle_chat(payload)
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+    def _handle_embeddings(self, payload):
+        server = self.server
+        inputs = payload.get("input") or []
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        with server.lock:
+            server.stats["inputs"] += len(inputs)
+            server.stats["batch_sizes"].append(len(inputs))
+        if server.max_batch and len(inputs) > server.max_batch:
+            self._send_json(413, {"error": {"message": f"batch too large: {len(inputs)} > {server.max_batch}"}})
+            return
+        if server.failure_rate and random.random() < server.failure_rate:
+            with server.lock:
+                server.stats["failures"] += 1
+            self._send_json(503, {"error": {"message": "injected failure"}})
+            return
+        # 模拟服务端吞吐：固定开销 + 按条目计的耗时，并发请求数受 slots 限制
+        with server.slots:
+            time.sleep(server.latency + server.per_item_latency * len(inputs))
+        data = [
+            {"object": "embedding", "index": i, "embedding": fake_embedding(text, server.dim)}
+            for i, text in enumerate(inputs)
+        ]
+        self._send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": payload.get("model", "stub"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _handle_chat(self, payload):
+        server = self.server
+        with server.lock:
+            server.stats["chats"] += 1
+        if server.failure_rate and random.random() < server.failure_rate:
+            with server.lock:
+                server.stats["failures"] += 1
+            self._send_json(503, {"error": {"message": "injected failure"}})
+            return
+        model = payload.get("model", "stub")
+        completion_id = f"chatcmpl-stub{int(time.time() * 1000)}"
+        created = int(time.time())
+        tokens = [f"词{i} " for i in range(server.tokens)]
+        time.sleep(server.ttft)
+        if not payload.get("stream"):
+            time.sleep(server.token_interval * len(tokens))
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                             "finish_reason": "stop"}],
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(server.token_interval)
+                chunk = {
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+                }
+                self._write_chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            final = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            }
+            self._write_chunk(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前断开
+            with server.lock:
+                server.stats["disconnects"] += 1
+            self.close_connection = True
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 压测时会有大量并发连接，默认的 backlog(5) 会导致 SYN 重传带来秒级延迟
+    request_queue_size = 1024
+
+    def __init__(self, host="127.0.0.1", port=0, dim=64, latency=0.0, per_item_latency=0.0,
+                 max_batch=0, failure_rate=0.0, parallelism=8, ttft=0.0, tokens=50, token_interval=0.0):
+        super().__init__((host, port), _StubHandler)
+        self.dim = dim
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.max_batch = max_batch
+        self.failure_rate = failure_rate
+        self.ttft = ttft
+        self.tokens = tokens
+        self.token_interval = token_interval
+        self.slots = threading.BoundedSemaphore(max(1, parallelism))
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "inputs": 0, "failures": 0, "batch_sizes": [], "chats": 0, "disconnects": 0,
+                      "connections": 0}
+        self._thread = None
+
+    def process_request(self, request, client_address):
+        # 统计新建的 TCP 连接数，用于观察客户端连接池的复用情况
+        with self.lock:
+            self.stats["connections"] += 1
+        super().process_request(request, client_address)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def start_embedding_server(**kwargs) -> StubServer:
+    """在后台线程中启动一个 Embedding 桩服务器。"""
+    return StubServer(**kwargs).start()
+
+
+def start_llm_server(**kwargs) -> StubServer:
+    """在后台线程中启动一个 LLM 桩服务器（ttft/tokens/token_interval 控制生成速度）。"""
+    return StubServer(**kwargs).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容桩服务器")
+    parser.add_argument("kind", choices=["embedding", "llm"], help="服务器类型（两者提供相同的接口，仅用于提示）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--dim", type=int, default=64, help="向量维度")
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的固定延迟（秒）")
+    parser.add_argument("--per-item-latency", type=float, default=0.0, help="每条输入的额外延迟（秒）")
+    parser.add_argument("--max-batch", type=int, default=0, help="单次请求允许的最大条目数，0 表示不限制")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="随机返回 503 的概率")
+    parser.add_argument("--parallelism", type=int, default=8, help="服务端同时处理的Embedding请求数")
+    parser.add_argument("--ttft", type=float, default=0.0, help="LLM 首个 token 的延迟（秒）")
+    parser.add_argument("--tokens", type=int, default=50, help="LLM 每个回答生成的 token 数")
+    parser.add_argument("--token-interval", type=float, default=0.0, help="LLM 相邻 token 之间的间隔（秒）")
+    args = parser.parse_args()
+
+    server = StubServer(
+        host=args.host, port=args.port, dim=args.dim, latency=args.latency,
+        per_item_latency=args.per_item_latency, max_batch=args.max_batch,
+        failure_rate=args.failure_rate, parallelism=args.parallelism,
+        ttft=args.ttft, tokens=args.tokens, token_interval=args.token_interval,
+    )
+    print(f"{args.kind} stub server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
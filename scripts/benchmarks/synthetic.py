@@ -0,0 +1,72 @@
+# 生成与 combined_output.json 结构一致的合成知识库，供基准测试使用
+
+import json
+import random
+
+
+def make_tree(width: int, depth: int, desc_len: int = 24, seed: int = 0, roots: int = None,
+              shared_subtrees: bool = False):
+    """
+    生成一棵满树：根为列表，每个节点形如 {"name", "desc", "child"}。
+
+    Args:
+        width (int): 每个节点的子节点数（根层同样为 width 个节点）。
+        depth (int): 树的层数。
+        desc_len (int): 叶子节点 desc 的近似长度。
+        seed (int): 随机种子，保证多次运行生成的数据一致。
+        roots (int): 根层节点数，默认与 width 相同；用于按倍数放大数据规模。
+        shared_subtrees (bool): 所有根节点下挂完全相同的子树（模拟同一分支在每个故障码下重复出现）。
+    """
+    rng = random.Random(seed)
+    alphabet = "点火线圈失效现象排查方法依据检查外观树脂表面裂纹气泡发黄电压传感器"
+
+    def _desc():
+        return "排查方法、排查依据: " + "".join(rng.choice(alphabet) for _ in range(desc_len))
+
+    def _build(level: int, prefix: str):
+        nodes = []
+        shared = None
+        for i in range(roots if level == 0 else width):
+            name = f"{prefix}{i:02d}" if level == 0 else f"节点{level}-{i}"
+            is_leaf = level == depth - 1
+            if is_leaf:
+                children = []
+            elif level == 0 and shared_subtrees:
+                shared = shared or _build(level + 1, prefix)
+                children = shared
+            else:
+                children = _build(level + 1, prefix)
+            nodes.append({"name": name, "desc": _desc() if is_leaf else "", "child": children})
+        return nodes
+
+    roots = width if roots is None else roots
+    return _build(0, "")
+
+
+def count_nodes(nodes) -> int:
+    """统计树中的节点总数。"""
+    total = 0
+    stack = [nodes]
+    while stack:
+        for node in stack.pop():
+            total += 1
+            children = node.get("child")
+            if children:
+                stack.append(children)
+    return total
+
+
+def iter_path_ids(nodes, prefix: str = ""):
+    """按深度优先顺序产出所有节点的路径ID。"""
+    for node in nodes:
+        path_id = f"{prefix}>{node['name']}" if prefix else node["name"]
+        yield path_id
+        children = node.get("child")
+        if children:
+            yield from iter_path_ids(children, path_id)
+
+
+def write_tree(path, nodes):
+    """将合成树写入 JSON 文件。"""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(nodes, f, ensure_ascii=False)
@@ -1,8 +1,17 @@
 # 用于执行一次性数据索引的脚本
 
+import argparse
+import hashlib
 import json
+import math
+import os
 import chromadb
 import sys
+import time
+import random
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import logging
 
@@ -33,6 +42,10 @@ except ImportError:
     sys.path.insert(0, str(project_root))
     from app.core import config
 
+from app.services.lexical_index import LexicalIndex
+from app.services.tree_store import CompactTree, compile_tree, iter_path_records
+from app.services.vector_store import export_vectors
+
 # --- 关键改动 ---
 # 在配置加载（补丁已生效）之后，再导入OpenAI客户端
 from openai import OpenAI
@@ -55,102 +68,401 @@ def get_chroma_client():
     )
     return collection
 
-def load_knowledge_base():
-    """加载JSON知识库文件。"""
-    if not config.KNOWLEDGE_BASE_FILE.exists():
-        logging.error(f"知识库文件未找到: {config.KNOWLEDGE_BASE_FILE}")
-        return None
-    with open(config.KNOWLEDGE_BASE_FILE, 'r', encoding='utf-8') as f:
-        return json.load(f)
+def build_document(name, desc):
+    """组合 name 和 desc 作为节点的索引内容。"""
+    return f"{name}\n{desc}".strip()
+
+def iter_index_records(file_path=None):
+    """
+    以流式方式解析知识库文件，逐个产出 (document, metadata, id)，不在内存中构建整棵树。
+
+    缺少 'name' 的节点及其子树会被跳过；重复的路径ID只保留第一次出现的节点，
+    与服务端按路径查找节点的行为保持一致。
+    """
+    seen = set()
+    for path_id, name, desc in iter_path_records(file_path or config.KNOWLEDGE_BASE_FILE):
+        if path_id in seen:
+            logging.warning(f"跳过重复的路径ID: {path_id}")
+            continue
+        seen.add(path_id)
+        yield build_document(name, desc), {'path_id': path_id}, path_id
 
-def traverse_and_prepare_data(data):
+def _embed_batch(batch, openai_client, max_retries, backoff):
     """
-    递归遍历JSON树，为每个节点准备要索引的数据。
+    为单个批次生成Embeddings，失败时按指数退避（带随机抖动）重试。
 
     返回:
-        - documents (list): 用于Embedding的文本文档列表。
-        - metadatas (list): 每个文档对应的元数据列表，包含路径ID。
-        - ids (list): 每个文档的唯一ID列表（这里也使用路径ID）。
-    """
-    documents = []
-    metadatas = []
-    
-    def _traverse(nodes, path_parts):
-        if not isinstance(nodes, list):
-            logging.warning(f"期望节点列表，但得到: {type(nodes).__name__}")
-            return
-        for node in nodes:
-            if not isinstance(node, dict):
-                logging.warning("跳过非字典节点")
-                continue
-            name = node.get('name')
-            if not name:
-                logging.warning("跳过缺少 'name' 的节点")
-                continue
-            current_path_parts = path_parts + [name]
-            path_id = '>'.join(current_path_parts)
-            
-            # 组合 name 和 desc 作为索引内容
-            desc = node.get('desc', '')
-            content = f"{name}\n{desc}".strip()
-            
-            documents.append(content)
-            metadatas.append({'path_id': path_id})
-            
-            children = node.get('child')
-            if isinstance(children, list) and children:
-                _traverse(children, current_path_parts)
-
-    _traverse(data, [])
-    
-    # 使用 path_id 作为 ChromaDB 的唯一 ID
-    ids = [meta['path_id'] for meta in metadatas]
-    
-    return documents, metadatas, ids
-
-def embed_documents(documents, openai_client):
-    """使用OpenAI API为文档批量生成Embeddings。"""
+        list: 与 batch 一一对应的向量列表；重试耗尽后抛出最后一次的异常。
+    """
+    attempt = 0
+    while True:
+        try:
+            response = openai_client.embeddings.create(
+                model=config.EMBEDDING_MODEL,
+                input=batch
+            )
+            embeddings = []
+            for item in response.data:
+                vector = getattr(item, 'embedding', None)
+                if vector is None and isinstance(item, dict):
+                    vector = item.get('embedding')
+                embeddings.append(vector)
+            if len(embeddings) != len(batch):
+                raise ValueError(f"返回向量数({len(embeddings)})与批次文档数({len(batch)})不一致")
+            return embeddings
+        except Exception as e:
+            if attempt >= max_retries:
+                raise
+            delay = backoff * (2 ** attempt) * (0.5 + random.random())
+            attempt += 1
+            logging.warning(
+                f"[Embedding] 批次请求失败({e})，{delay:.2f}s 后进行第 {attempt}/{max_retries} 次重试。"
+            )
+            time.sleep(delay)
+
+
+def embed_documents(documents, openai_client, batch_size=None, concurrency=None,
+                    max_retries=None, backoff=None):
+    """
+    使用OpenAI API为文档分批、并发地生成Embeddings。
+
+    文档按 batch_size 切分，最多 concurrency 个批次同时请求；每个批次独立重试，
+    重试耗尽的批次对应位置填充 None（由调用方过滤），不会影响其他批次的结果。
+
+    返回:
+        list | None: 与 documents 一一对应的向量列表；所有批次均失败时返回 None。
+    """
     if not documents:
         return []
+    batch_size = max(1, batch_size or config.EMBEDDING_BATCH_SIZE)
+    concurrency = max(1, concurrency or config.EMBEDDING_CONCURRENCY)
+    max_retries = config.EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+    backoff = config.EMBEDDING_RETRY_BACKOFF if backoff is None else backoff
+
+    batches = [
+        (start, documents[start:start + batch_size])
+        for start in range(0, len(documents), batch_size)
+    ]
+    logging.info(
+        f"[Embedding] Sending {len(documents)} document(s) in {len(batches)} batch(es) "
+        f"(batch_size={batch_size}, concurrency={concurrency})."
+    )
+    logging.info(f"[Embedding] Model: {config.EMBEDDING_MODEL}")
+
+    embeddings = [None] * len(documents)
+    failed_batches = 0
+    completed = 0
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {
+            executor.submit(_embed_batch, batch, openai_client, max_retries, backoff): (start, len(batch))
+            for start, batch in batches
+        }
+        for future in as_completed(futures):
+            start, size = futures[future]
+            completed += 1
+            try:
+                embeddings[start:start + size] = future.result()
+            except Exception as e:
+                failed_batches += 1
+                logging.error(f"[Embedding] 批次 [{start}, {start + size}) 在重试后仍然失败: {e}")
+                # 打印更详细的请求信息，如果可能的话
+                if hasattr(e, 'request'):
+                    logging.error(f"[Embedding] Request URL: {e.request.url}")
+                    logging.error(f"[Embedding] Request Method: {e.request.method}")
+            elapsed = time.perf_counter() - started_at
+            logging.info(
+                f"[Embedding] 进度: {completed}/{len(batches)} 批次 "
+                f"({min(completed * batch_size, len(documents))}/{len(documents)} 文档, {elapsed:.1f}s)"
+            )
+
+    if failed_batches == len(batches):
+        return None
+    if failed_batches:
+        logging.warning(f"[Embedding] {failed_batches}/{len(batches)} 个批次失败，对应文档将被跳过。")
+    received = sum(1 for e in embeddings if e is not None)
+    logging.info(f"[Embedding] Received {received} embedding(s) in {time.perf_counter() - started_at:.1f}s.")
+    return embeddings
+
+
+def content_hash(document: str) -> str:
+    """计算节点索引内容（name + desc）的哈希，用于判断节点是否发生变化。"""
+    return hashlib.sha1(document.encode('utf-8')).hexdigest()
+
+def load_manifest():
+    """
+    读取上一次索引生成的清单（path_id -> 内容哈希）。
+
+    清单不存在、无法解析，或与当前 Embedding 模型/集合不匹配时返回 None，
+    此时调用方应执行全量重建。
+    """
+    manifest_file = config.INDEX_MANIFEST_FILE
+    if not manifest_file.exists():
+        return None
     try:
-        logging.info(f"[Embedding] Sending {len(documents)} document(s) to embedding service.")
-        logging.info(f"[Embedding] Model: {config.EMBEDDING_MODEL}")
-        
-        response = openai_client.embeddings.create(
-            model=config.EMBEDDING_MODEL,
-            input=documents
-        )
-        
-        logging.info(f"[Embedding] Received {len(response.data)} embedding(s).")
-        embeddings = []
-        for item in response.data:
-            vector = getattr(item, 'embedding', None)
-            if vector is None and isinstance(item, dict):
-                vector = item.get('embedding')
-            embeddings.append(vector)
-        return embeddings
-    
+        with open(manifest_file, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
     except Exception as e:
-        logging.error(f"[Embedding] An error occurred: {e}", exc_info=True)
-        # 打印更详细的请求信息，如果可能的话
-        if hasattr(e, 'request'):
-            logging.error(f"[Embedding] Request URL: {e.request.url}")
-            logging.error(f"[Embedding] Request Method: {e.request.method}")
-            # logging.error(f"[Embedding] Request Headers: {e.request.headers}")
-            # content = e.request.content.decode('utf-8') if e.request.content else ''
-            # logging.error(f"[Embedding] Request Content: {content[:500]}...") # 打印前500个字符
+        logging.warning(f"索引清单读取失败，将执行全量重建: {e}")
+        return None
+    if (manifest.get('embedding_model') != config.EMBEDDING_MODEL
+            or manifest.get('collection') != config.CHROMA_COLLECTION_NAME):
+        logging.info("Embedding 模型或集合名称已变化，将执行全量重建。")
         return None
+    return manifest.get('entries', {})
+
+def save_manifest(entries):
+    """原子地写入索引清单，避免中途失败留下半个文件。"""
+    manifest_file = config.INDEX_MANIFEST_FILE
+    tmp_file = manifest_file.with_suffix(manifest_file.suffix + '.tmp')
+    manifest = {
+        'embedding_model': config.EMBEDDING_MODEL,
+        'collection': config.CHROMA_COLLECTION_NAME,
+        'entries': entries,
+    }
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp_file, manifest_file)
+
+def touch_manifest():
+    """
+    只刷新索引清单的修改时间、不改动内容（--tree-only 模式）。服务端以清单比知识库文件新作为
+    索引完成的标志，刷新后才会热重载重新编译的二进制知识库和词法索引。
+    """
+    manifest_file = config.INDEX_MANIFEST_FILE
+    if manifest_file.exists():
+        os.utime(manifest_file)
+
+
+class EmbeddingReuse:
+    """
+    让内容（name + desc）相同的节点共用一个Embedding，只请求一次Embedding服务。
+
+    同一个分支常在多个顶层节点下重复出现（如每个故障码下都有 "点火线圈失效 > 现象1"），
+    这些节点的路径不同、索引内容完全相同。第一遍扫描统计每个内容哈希在待更新节点中出现的次数，
+    索引时只缓存之后还会再出现的内容的向量，最后一次使用后立即释放，内存占用与重复内容的数量相关，
+    与节点总数无关。existing 为上一次索引中内容未变化的节点（内容哈希 -> 路径ID），
+    待更新节点与之内容相同时直接从 ChromaDB 取回已有的向量。
+    """
+
+    def __init__(self, counts, existing=None):
+        self._remaining = {h: c for h, c in counts.items() if c > 1}
+        self._vectors = {}
+        self.existing = existing or {}
+        self.stats = {"embedded": 0, "reused": 0, "from_index": 0}
+
+    def lookup(self, h):
+        """返回本次运行中已生成的向量；没有时返回 None。"""
+        return self._vectors.get(h)
+
+    def record(self, h, vector, uses):
+        """记录内容 h 被使用了 uses 次；之后还会出现时缓存其向量，否则释放。"""
+        remaining = self._remaining.get(h)
+        if remaining is None:
+            return
+        remaining -= uses
+        if remaining > 0 and vector is not None:
+            self._remaining[h] = remaining
+            self._vectors[h] = vector
+        else:
+            self._remaining.pop(h, None)
+            self._vectors.pop(h, None)
+
+
+def count_contents(previous):
+    """
+    第一遍流式扫描：统计待更新节点中每个内容哈希的出现次数，
+    并记录与之内容相同、且未变化的已有节点（内容哈希 -> 路径ID）。
+    """
+    counts = Counter()
+    existing = {}
+    for document, _, path_id in iter_index_records():
+        h = content_hash(document)
+        if previous.get(path_id) == h:
+            existing.setdefault(h, path_id)
+        else:
+            counts[h] += 1
+    return counts, {h: path_id for h, path_id in existing.items() if h in counts}
+
+
+class ChunkWriter:
+    """
+    分批、并行地将条目 upsert 到 ChromaDB。
+
+    每个请求最多 batch_size 个条目，同时进行的请求不超过 concurrency 个；达到上限时 write() 阻塞，
+    写入与下一组节点的Embedding请求重叠进行。写入失败的批次只记录日志，其路径ID不会进入清单，下次运行时重试。
+    """
+
+    def __init__(self, collection, batch_size=None, concurrency=None):
+        self.collection = collection
+        self.batch_size = max(1, batch_size or config.INDEX_WRITE_BATCH_SIZE)
+        concurrency = max(1, concurrency or config.INDEX_WRITE_CONCURRENCY)
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="chroma-writer")
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self.written = []
+        self.failed = 0
 
+    def write(self, embeddings, documents, metadatas, ids):
+        for start in range(0, len(ids), self.batch_size):
+            end = start + self.batch_size
+            self._slots.acquire()
+            future = self._executor.submit(
+                self._upsert, embeddings[start:end], documents[start:end], metadatas[start:end], ids[start:end]
+            )
+            future.add_done_callback(lambda _: self._slots.release())
 
-def main():
+    def _upsert(self, embeddings, documents, metadatas, ids):
+        try:
+            # 使用 upsert：内容变化的节点需要覆盖已有的同ID条目
+            self.collection.upsert(embeddings=embeddings, documents=documents, metadatas=metadatas, ids=ids)
+        except Exception as e:
+            logging.error(f"存入ChromaDB时出错（{len(ids)} 条，下次运行时重试）: {e}")
+            with self._lock:
+                self.failed += len(ids)
+            return
+        with self._lock:
+            self.written.extend(ids)
+
+    def close(self):
+        """等待全部写入完成，返回成功写入的路径ID。"""
+        self._executor.shutdown(wait=True)
+        return self.written
+
+
+def _fetch_existing(chroma_collection, path_ids):
+    """从 ChromaDB 取回已有节点的向量（路径ID -> 向量），失败时返回空字典。"""
+    try:
+        result = chroma_collection.get(ids=path_ids, include=["embeddings"])
+    except Exception as e:
+        logging.warning(f"读取已有向量失败，将重新生成Embeddings: {e}")
+        return {}
+    return {path_id: vector for path_id, vector in zip(result['ids'], result['embeddings'])}
+
+
+def index_chunk(records, embedding_client, chroma_collection, reuse=None, writer=None):
+    """
+    为一组 (document, metadata, id) 生成Embeddings并写入ChromaDB。
+
+    提供 reuse 时，内容相同的节点只生成一次Embedding：依次使用本次运行中已生成的向量、
+    上一次索引中内容相同的节点的向量，剩余的内容去重后再请求Embedding服务。
+    提供 writer 时条目交给 writer 异步写入，返回值只表示已提交写入；否则同步写入。
+
+    返回:
+        list: 成功写入（或已提交写入）的路径ID；向量无效或写入失败的条目不包含在内，下次运行时会重试。
+    """
+    # 按内容分组：组内的节点共用一个向量（未启用去重时每个节点单独成组）
+    groups = {}
+    for i, (document, _, _) in enumerate(records):
+        key = content_hash(document) if reuse is not None else i
+        groups.setdefault(key, []).append(i)
+
+    vectors = {}
+    if reuse is not None:
+        # 1. 本次运行中已生成的向量
+        for key, members in groups.items():
+            vector = reuse.lookup(key)
+            if vector is not None:
+                vectors[key] = vector
+                reuse.stats["reused"] += len(members)
+        # 2. 上一次索引中内容相同、且未变化的节点的向量
+        wanted = {reuse.existing[key]: key for key in groups if key not in vectors and key in reuse.existing}
+        if wanted:
+            for path_id, vector in _fetch_existing(chroma_collection, list(wanted)).items():
+                key = wanted[path_id]
+                vectors[key] = vector
+                reuse.stats["from_index"] += len(groups[key])
+
+    # 3. 其余内容每组只请求一次
+    missing = [key for key in groups if key not in vectors]
+    if missing:
+        embeddings = embed_documents([records[groups[key][0]][0] for key in missing], embedding_client)
+        if embeddings is None:
+            logging.error(f"无法为本组 {len(missing)} 个不同内容生成Embeddings。")
+            embeddings = []
+        for key, vector in zip(missing, embeddings):
+            if vector is not None:
+                vectors[key] = vector
+                if reuse is not None:
+                    reuse.stats["embedded"] += 1
+                    reuse.stats["reused"] += len(groups[key]) - 1
+    if reuse is not None:
+        for key, members in groups.items():
+            reuse.record(key, vectors.get(key), len(members))
+
+    # 过滤没有有效向量的条目，保持与文档/元数据/ID一一对应
+    embeddings, documents, metadatas, ids = [], [], [], []
+    for key, members in groups.items():
+        vector = vectors.get(key)
+        if vector is None:
+            continue
+        for i in members:
+            document, metadata, path_id = records[i]
+            embeddings.append(vector)
+            documents.append(document)
+            metadatas.append(metadata)
+            ids.append(path_id)
+    dropped_count = len(records) - len(ids)
+    if dropped_count:
+        logging.warning(f"因无效向量被丢弃的条目数: {dropped_count}（下次运行时会重试）")
+    if not ids:
+        logging.error("本组所有向量均无效，无法写入 ChromaDB。")
+        return []
+
+    if writer is not None:
+        writer.write(embeddings, documents, metadatas, ids)
+        return ids
+    writer = ChunkWriter(chroma_collection)
+    writer.write(embeddings, documents, metadatas, ids)
+    written = writer.close()
+    logging.info(f"成功将 {len(written)} 条数据存入ChromaDB。")
+    return written
+
+
+def compile_tree_file():
+    """将知识库编译为服务端 mmap 模式使用的二进制树文件。"""
+    try:
+        tree = CompactTree.load(config.KNOWLEDGE_BASE_FILE)
+        compile_tree(tree, config.KNOWLEDGE_BASE_TREE_FILE, source_path=config.KNOWLEDGE_BASE_FILE)
+        logging.info(f"已编译二进制知识库: {config.KNOWLEDGE_BASE_TREE_FILE}（{len(tree)} 个节点）")
+    except Exception as e:
+        logging.error(f"编译二进制知识库失败: {e}", exc_info=True)
+
+
+def build_lexical_index_file():
+    """以流式方式解析知识库，构建服务端混合检索使用的 BM25 词法索引（name / desc 倒排索引）。"""
+    try:
+        start = time.perf_counter()
+        index = LexicalIndex.build(iter_path_records(config.KNOWLEDGE_BASE_FILE))
+        index.save(config.LEXICAL_INDEX_FILE)
+        logging.info(
+            f"已构建词法索引: {config.LEXICAL_INDEX_FILE}（{len(index)} 个节点，{len(index.vocab)} 个检索词，"
+            f"{time.perf_counter() - start:.1f}s）"
+        )
+    except Exception as e:
+        logging.error(f"构建词法索引失败: {e}", exc_info=True)
+
+
+def main(argv=None):
     """主函数，执行整个索引流程。"""
+    parser = argparse.ArgumentParser(description="JsonTreeRAG 知识库索引脚本")
+    parser.add_argument("--full", action="store_true", help="忽略索引清单，重新生成所有节点的Embeddings")
+    parser.add_argument("--tree-only", action="store_true", help="只编译二进制知识库和词法索引，不更新向量索引")
+    parser.add_argument("--report", type=Path, help="将本次索引的统计报告（Embedding调用与索引大小的节省）写入该 JSON 文件")
+    args = parser.parse_args(argv)
+
     logging.info("开始执行数据索引流程...")
 
-    # 1. 加载知识库
-    knowledge_data = load_knowledge_base()
-    if knowledge_data is None:
+    # 1. 检查知识库文件（随后以流式方式解析，不一次性加载）
+    if not config.KNOWLEDGE_BASE_FILE.exists():
+        logging.error(f"知识库文件未找到: {config.KNOWLEDGE_BASE_FILE}")
+        return
+
+    if args.tree_only:
+        compile_tree_file()
+        build_lexical_index_file()
+        touch_manifest()
         return
-    logging.info(f"成功加载知识库: {config.KNOWLEDGE_BASE_FILE}")
 
     # 2. 初始化客户端
     try:
@@ -161,60 +473,136 @@ def main():
         logging.error(f"初始化客户端时失败: {e}")
         return
 
-    # 3. 遍历和准备数据
-    documents, metadatas, ids = traverse_and_prepare_data(knowledge_data)
-    logging.info(f"数据准备完成，共找到 {len(documents)} 个节点需要索引。")
+    # 3. 读取上一次的索引清单，用于增量比对
+    previous = None if args.full else load_manifest()
+    if previous and chroma_collection.count() == 0:
+        logging.warning("索引清单存在但ChromaDB集合为空，将执行全量重建。")
+        previous = None
+    full_rebuild = previous is None
+    if full_rebuild:
+        logging.info("执行全量索引。")
+        previous = {}
 
-    if not documents:
-        logging.warning("没有找到可索引的文档，脚本结束。")
-        return
+    # 4. 统计待更新节点中重复的内容（第一遍扫描），相同内容只生成一次Embedding
+    reuse = None
+    if config.INDEX_DEDUP_CONTENT:
+        try:
+            counts, existing = count_contents(previous)
+        except Exception as e:
+            logging.error(f"解析知识库文件失败: {e}", exc_info=True)
+            return
+        reuse = EmbeddingReuse(counts, existing)
+        logging.info(
+            f"待更新节点 {sum(counts.values())} 个，不同内容 {len(counts)} 种，"
+            f"其中 {len(existing)} 种可复用已有节点的向量。"
+        )
 
-    # 4. 生成Embeddings
-    logging.info(f"正在为文档生成Embeddings，使用模型: {config.EMBEDDING_MODEL}...")
-    embeddings = embed_documents(documents, embedding_client)
-    if embeddings is None:
-        logging.error("无法生成Embeddings，索引流程中断。")
-        return
-    logging.info("Embeddings生成成功。")
+    # 5. 边解析边索引：只为新增或内容变化的节点生成Embeddings，每攒够一组就提交给写入线程
+    hashes = {}
+    new_entries = {}
+    pending = []
+    changed_count = 0
+    writer = ChunkWriter(chroma_collection)
 
-    # 4.1 过滤无效的向量，保持与文档/元数据/ID一一对应
-    original_len = len(documents)
-    if len(embeddings) != original_len:
-        logging.warning(
-            f"Embedding 数量({len(embeddings)})与文档数量({original_len})不一致，将按就地对齐并过滤无效项。"
-        )
-    filtered = [
-        (e, d, m, i)
-        for e, d, m, i in zip(embeddings, documents, metadatas, ids)
-        if e is not None
-    ]
-    if not filtered:
-        logging.error("所有向量均无效，无法写入 ChromaDB。")
+    def _flush():
+        index_chunk(pending, embedding_client, chroma_collection, reuse=reuse, writer=writer)
+        pending.clear()
+
+    try:
+        for document, metadata, path_id in iter_index_records():
+            h = content_hash(document)
+            hashes[path_id] = h
+            if previous.get(path_id) == h:
+                # 未变化的节点沿用旧清单
+                new_entries[path_id] = h
+                continue
+            changed_count += 1
+            pending.append((document, metadata, path_id))
+            if len(pending) >= config.INDEX_CHUNK_SIZE:
+                _flush()
+        if pending:
+            _flush()
+    except Exception as e:
+        logging.error(f"解析知识库文件失败: {e}", exc_info=True)
+        writer.close()
         return
-    embeddings, documents, metadatas, ids = (
-        [x[0] for x in filtered],
-        [x[1] for x in filtered],
-        [x[2] for x in filtered],
-        [x[3] for x in filtered],
+    written = writer.close()
+    new_entries.update((path_id, hashes[path_id]) for path_id in written)
+
+    logging.info(
+        f"数据准备完成，共 {len(hashes)} 个节点: 新增/变化 {changed_count} 个，"
+        f"未变化 {len(hashes) - changed_count} 个，成功写入 {len(written)} 个。"
     )
-    dropped_count = original_len - len(filtered)
-    if dropped_count:
-        logging.warning(f"因无效向量被丢弃的条目数: {dropped_count}")
 
-    # 5. 存入ChromaDB
+    # 6. 删除已从知识库中消失的条目
+    if full_rebuild:
+        # 全量模式下清单不可信，直接以集合中的实际ID判断哪些条目已过期
+        stale_ids = [i for i in chroma_collection.get(include=[])['ids'] if i not in hashes]
+    else:
+        stale_ids = [path_id for path_id in previous if path_id not in hashes]
+    if stale_ids:
+        try:
+            chroma_collection.delete(ids=stale_ids)
+            logging.info(f"已从ChromaDB中删除 {len(stale_ids)} 条过期数据。")
+        except Exception as e:
+            logging.error(f"删除过期数据时出错: {e}")
+            # 保留过期条目的旧清单记录，下次运行时重试删除
+            new_entries.update((path_id, previous[path_id]) for path_id in stale_ids if path_id in previous)
+
+    # 7. 编译服务端使用的二进制知识库和词法索引，并导出 NumPy 向量索引（相同的向量只保存一行）
+    compile_tree_file()
+    build_lexical_index_file()
+    exported = None
     try:
-        logging.info("正在将数据批量存入ChromaDB...")
-        # ChromaDB的add方法是upsert逻辑，如果ID已存在则会更新
-        chroma_collection.add(
-            embeddings=embeddings,
-            documents=documents,
-            metadatas=metadatas,
-            ids=ids
-        )
-        logging.info(f"成功将 {len(ids)} 条数据存入ChromaDB。")
-        logging.info("数据索引流程全部完成！")
+        exported = export_vectors(chroma_collection, config.VECTOR_MATRIX_FILE, config.VECTOR_META_FILE)
     except Exception as e:
-        logging.error(f"存入ChromaDB时出错: {e}")
+        logging.error(f"导出 NumPy 向量索引失败: {e}", exc_info=True)
+
+    # 8. 最后更新索引清单，只记录成功写入的节点。
+    #    服务端以清单的更新作为索引完成的标志，据此热重载新索引
+    save_manifest(new_entries)
+    write_report(build_report(hashes, changed_count, written, writer.failed, stale_ids, reuse, exported), args.report)
+    logging.info("数据索引流程全部完成！")
+
+
+def build_report(hashes, changed_count, written, write_failed, stale_ids, reuse, exported):
+    """汇总本次索引的统计信息：写入条目数、节省的Embedding调用和 NumPy 向量索引的去重效果。"""
+    report = {
+        "nodes": len(hashes),
+        "unique_contents": len(set(hashes.values())),
+        "changed": changed_count,
+        "written": len(written),
+        "write_failed": write_failed,
+        "stale_deleted": len(stale_ids),
+    }
+    if reuse is not None:
+        saved = reuse.stats["reused"] + reuse.stats["from_index"]
+        report.update({
+            "documents_embedded": reuse.stats["embedded"],
+            "documents_reused": reuse.stats["reused"],
+            "documents_from_index": reuse.stats["from_index"],
+            "embedding_inputs_saved": saved,
+            "embedding_requests_saved": (
+                math.ceil((reuse.stats["embedded"] + saved) / max(1, config.EMBEDDING_BATCH_SIZE))
+                - math.ceil(reuse.stats["embedded"] / max(1, config.EMBEDDING_BATCH_SIZE))
+            ),
+        })
+    if exported is not None:
+        report.update({
+            "vector_entries": exported["entries"],
+            "vector_rows": exported["rows"],
+            "vector_bytes_saved": exported["bytes_saved"],
+        })
+    return report
+
+
+def write_report(report, path=None):
+    """记录统计报告；指定 path 时同时写入 JSON 文件。"""
+    logging.info("索引统计: " + json.dumps(report, ensure_ascii=False))
+    if path:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,28 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# 使 `pytest tests/` 可直接导入 app 与 scripts 包
+project_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(project_root))
+
+from app.core import config  # noqa: E402
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """把知识库与索引文件路径指向临时目录（测试结束后自动恢复）。"""
+    paths = {
+        "DB_DIR": tmp_path,
+        "KNOWLEDGE_BASE_FILE": tmp_path / "combined_output.json",
+        "CHROMADB_PATH": tmp_path / "chromadb",
+        "INDEX_MANIFEST_FILE": tmp_path / "index_manifest.json",
+        "KNOWLEDGE_BASE_TREE_FILE": tmp_path / "knowledge_base.tree",
+        "VECTOR_MATRIX_FILE": tmp_path / "vectors.npy",
+        "VECTOR_META_FILE": tmp_path / "vectors_meta.json",
+        "LEXICAL_INDEX_FILE": tmp_path / "lexical_index.npz",
+    }
+    for name, path in paths.items():
+        monkeypatch.setattr(config, name, path)
+    return tmp_path
@@ -0,0 +1,236 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import main
+from app.core import config
+from app.services import answer
+from app.services.admission import AdmissionController, AdmissionRejected
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_acquire_within_limit_and_release():
+    async def scenario():
+        controller = AdmissionController(2, 0, 1.0)
+        first, second = await controller.acquire(), await controller.acquire()
+        assert controller.active == 2
+        first.release()
+        first.release()  # 重复释放只归还一次
+        second.release()
+        assert controller.active == 0
+        assert controller.stats()["admitted"] == 2
+
+    _run(scenario())
+
+
+def test_queue_full_is_rejected_with_429():
+    async def scenario():
+        controller = AdmissionController(1, 1, 5.0)
+        slot = await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        assert controller.waiting == 1
+        with pytest.raises(AdmissionRejected) as excinfo:
+            await controller.acquire()
+        assert excinfo.value.status_code == 429
+        assert excinfo.value.reason == "queue_full"
+        assert excinfo.value.retry_after >= 1
+        # 释放后名额按 FIFO 交给排队的请求
+        slot.release()
+        (await waiter).release()
+        assert controller.active == 0 and controller.waiting == 0
+
+    _run(scenario())
+
+
+def test_queue_timeout_is_rejected_with_503():
+    async def scenario():
+        controller = AdmissionController(1, 4, 0.05)
+        slot = await controller.acquire()
+        with pytest.raises(AdmissionRejected) as excinfo:
+            await controller.acquire()
+        assert excinfo.value.status_code == 503
+        assert excinfo.value.reason == "timeout"
+        assert controller.waiting == 0
+        assert controller.stats()["rejected_timeout"] == 1
+        slot.release()
+        assert controller.active == 0
+
+    _run(scenario())
+
+
+def test_cancel_while_waiting_leaves_no_leaked_slot():
+    async def scenario():
+        controller = AdmissionController(1, 4, 5.0)
+        slot = await controller.acquire()
+        cancelled = asyncio.create_task(controller.acquire())
+        queued = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        assert controller.waiting == 2
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        assert controller.waiting == 1
+        slot.release()
+        (await queued).release()
+        assert controller.active == 0 and controller.waiting == 0
+
+    _run(scenario())
+
+
+def test_cancel_after_slot_was_handed_over_passes_it_on():
+    async def scenario():
+        controller = AdmissionController(1, 4, 5.0)
+        slot = await controller.acquire()
+        first = asyncio.create_task(controller.acquire())
+        second = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        # 名额交给 first 后、first 恢复运行前被取消：要么 first 仍拿到名额（部分 Python 版本的 wait_for
+        # 在内部 future 已完成时忽略取消），要么名额转交给 second；两种情况下都不能泄漏名额
+        slot.release()
+        first.cancel()
+        try:
+            (await first).release()
+        except asyncio.CancelledError:
+            pass
+        (await second).release()
+        assert controller.active == 0 and controller.waiting == 0
+
+    _run(scenario())
+
+
+def test_timeout_in_same_iteration_as_handover_does_not_leak_slot(monkeypatch):
+    async def scenario():
+        controller = AdmissionController(1, 4, 5.0)
+        slot = await controller.acquire()
+        # 在超时请求之后排队（任务在下一次让出事件循环时才开始运行）
+        next_waiter = asyncio.create_task(controller.acquire())
+
+        async def _wait_for_racing_release(future, timeout):
+            # 名额在超时触发的同一轮中交给本请求，wait_for 仍报告超时
+            slot.release()
+            assert future.done() and not future.cancelled()
+            raise asyncio.TimeoutError
+
+        real_wait_for = asyncio.wait_for
+        monkeypatch.setattr(asyncio, "wait_for", _wait_for_racing_release)
+        try:
+            with pytest.raises(AdmissionRejected) as excinfo:
+                await controller.acquire()
+        finally:
+            monkeypatch.setattr(asyncio, "wait_for", real_wait_for)
+        assert excinfo.value.status_code == 503
+        # 预留给超时请求的名额已转交给下一个等待者
+        (await asyncio.wait_for(next_waiter, 1.0)).release()
+        assert controller.active == 0 and controller.waiting == 0
+
+    _run(scenario())
+
+
+class _FakeResponseCache:
+    def __init__(self, cached=None):
+        self.cached = cached
+
+    def make_key(self, *parts):
+        return "key"
+
+    def get(self, key, version):
+        return self.cached
+
+    def put(self, key, chunks, version):
+        self.cached = chunks
+
+
+@pytest.fixture
+def fake_answer_path(monkeypatch):
+    """回答缓存与LLM流替换为桩，返回 (缓存, LLM调用计数)。"""
+    cache = _FakeResponseCache()
+    calls = []
+
+    async def _fake_llm_stream(prompt, model):
+        calls.append(model)
+        for chunk in ("答", "案"):
+            await asyncio.sleep(0)
+            yield chunk
+
+    class _Snapshot:
+        version = (1,)
+
+    monkeypatch.setattr(answer, "get_response_cache", lambda: cache)
+    monkeypatch.setattr(answer, "get_snapshot", lambda: _Snapshot())
+    monkeypatch.setattr(answer, "get_llm_stream", _fake_llm_stream)
+    monkeypatch.setattr(answer, "build_prompt", lambda *args: "prompt")
+    return cache, calls
+
+
+def test_start_answer_cache_hit_needs_no_slot(fake_answer_path):
+    cache, calls = fake_answer_path
+    cache.cached = ["缓存"]
+
+    async def scenario():
+        controller = AdmissionController(1, 0, 1.0)
+        held = await controller.acquire()  # 名额已满，缓存命中仍可回答
+        chunks = await answer.start_answer("p", {"name": "p"}, "q", "m", admission=controller)
+        assert [c async for c in chunks] == ["缓存"]
+        held.release()
+
+    _run(scenario())
+    assert calls == []
+
+
+def test_start_answer_miss_holds_slot_until_stream_is_closed(fake_answer_path):
+    cache, calls = fake_answer_path
+
+    async def scenario():
+        controller = AdmissionController(1, 0, 1.0)
+        chunks = await answer.start_answer("p", {"name": "p"}, "q", "m", admission=controller)
+        assert controller.active == 1
+        # 名额已被占用，另一个未命中缓存的请求在开始响应前被拒绝
+        with pytest.raises(AdmissionRejected):
+            await answer.start_answer("p", {"name": "p"}, "q2", "m", admission=controller)
+        assert await chunks.__anext__() == "答"
+        await chunks.aclose()  # 请求中途取消
+        assert controller.active == 0
+        assert cache.cached is None  # 未完整生成的回答不写入缓存
+
+        chunks = await answer.start_answer("p", {"name": "p"}, "q", "m", admission=controller)
+        assert "".join([c async for c in chunks]) == "答案"
+        assert controller.active == 0
+        assert cache.cached == ["答", "案"]
+
+    _run(scenario())
+    assert len(calls) == 2
+
+
+def test_start_answer_unstarted_stream_releases_slot_when_dropped(fake_answer_path):
+    async def scenario():
+        controller = AdmissionController(1, 0, 1.0)
+        chunks = await answer.start_answer("p", {"name": "p"}, "q", "m", admission=controller)
+        assert controller.active == 1
+        del chunks
+        assert controller.active == 0
+
+    _run(scenario())
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_chat_completions_returns_429_with_retry_after(fake_answer_path, monkeypatch, stream):
+    controller = AdmissionController(1, 0, 1.0)
+    _run(controller.acquire())  # 占满名额
+
+    async def _context(user_messages):
+        return "01>A", {"name": "A", "desc": "", "child": []}
+
+    monkeypatch.setattr(main, "aget_conversation_context", _context)
+    monkeypatch.setattr(main, "get_admission_controller", lambda: controller)
+    monkeypatch.setattr(config, "SSE_COALESCE_MS", 0)
+    client = TestClient(main.app)
+    response = client.post(
+        "/v1/chat/completions", json={"messages": [{"role": "user", "content": "q"}], "stream": stream}
+    )
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
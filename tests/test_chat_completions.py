@@ -0,0 +1,42 @@
+from fastapi.testclient import TestClient
+
+from app import main
+from app.services.llm_handler import LLM_ERROR_PREFIX
+from app.services.metrics import REQUESTS
+
+BODY = {"messages": [{"role": "user", "content": "发动机故障"}], "stream": False}
+
+
+def _answer(chunks, monkeypatch):
+    async def _context(user_messages):
+        return "02", {"name": "02", "desc": "发动机故障", "child": []}
+
+    async def _start_answer(*args, **kwargs):
+        async def _chunks():
+            for chunk in chunks:
+                yield chunk
+        return _chunks()
+
+    monkeypatch.setattr(main, "aget_conversation_context", _context)
+    monkeypatch.setattr(main, "start_answer", _start_answer)
+    return TestClient(main.app).post("/v1/chat/completions", json=BODY)
+
+
+def _count(status):
+    return REQUESTS.value(mode="json", status=status)
+
+
+def test_non_stream_answer_returns_completion(monkeypatch):
+    before = _count("ok")
+    response = _answer(["检查", "点火线圈"], monkeypatch)
+    assert response.status_code == 200
+    assert response.json()["choices"][0]["message"]["content"] == "检查点火线圈"
+    assert _count("ok") == before + 1
+
+
+def test_non_stream_llm_failure_returns_502(monkeypatch):
+    before = _count("error")
+    response = _answer(["检查", f"{LLM_ERROR_PREFIX} Details: timeout"], monkeypatch)
+    assert response.status_code == 502
+    assert LLM_ERROR_PREFIX not in response.text
+    assert _count("error") == before + 1
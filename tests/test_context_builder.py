@@ -0,0 +1,144 @@
+import json
+
+from app.services.context_builder import (
+    MergedContext, PrunedSubtree, _node_cost, collapse_paths, estimate_subtree_tokens, is_query_specific,
+    prune_subtree,
+)
+from app.utils.text import estimate_tokens
+
+
+class FakeBackend:
+    """按路径ID返回预设向量的向量后端。"""
+
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.requested = []
+
+    def get_embeddings(self, ids):
+        self.requested.append(list(ids))
+        return {i: self.vectors[i] for i in ids if i in self.vectors}
+
+
+def _tree(width, depth, prefix="n"):
+    node = {"name": prefix, "desc": f"{prefix} 的描述", "child": []}
+    if depth:
+        node["child"] = [_tree(width, depth - 1, f"{prefix}{i}") for i in range(width)]
+    return node
+
+
+def _estimated_cost(node, depth=0):
+    return _node_cost(node["name"], node.get("desc", ""), depth) + sum(
+        _estimated_cost(child, depth + 1) for child in node.get("child") or []
+    )
+
+
+def _names(node):
+    yield node["name"]
+    for child in node.get("child") or []:
+        yield from _names(child)
+
+
+def test_estimate_subtree_tokens_is_close_to_serialized_size():
+    tree = _tree(4, 3)
+    estimate = estimate_subtree_tokens(tree)
+    assert estimate == _estimated_cost(tree)
+    actual = estimate_tokens(json.dumps(tree, indent=2, ensure_ascii=False))
+    assert actual <= estimate <= actual * 1.2
+
+
+def test_estimate_subtree_tokens_stops_past_limit():
+    tree = _tree(4, 3)
+    limit = _estimated_cost(tree) // 10
+    assert limit < estimate_subtree_tokens(tree, limit) < _estimated_cost(tree)
+
+
+def test_prune_keeps_whole_subtree_within_budget():
+    tree = _tree(3, 2)
+    pruned = prune_subtree("n", tree, budget_tokens=_estimated_cost(tree) * 2)
+    assert isinstance(pruned, PrunedSubtree) and is_query_specific(pruned)
+    assert sorted(_names(pruned)) == sorted(_names(tree))
+
+
+def test_prune_respects_budget_and_summarises_omitted_branches():
+    tree = _tree(6, 3)
+    budget = _estimated_cost(tree) // 5
+    pruned = prune_subtree("n", tree, budget_tokens=budget)
+
+    assert pruned["name"] == "n"
+    assert _estimated_cost(pruned) <= budget
+    summaries = [name for name in _names(pruned) if name.startswith("（另有")]
+    assert summaries
+    # 广度优先：保留了更深层的节点时，上一层必须已全部保留
+    kept_children = [c for c in pruned["child"] if not c["name"].startswith("（")]
+    if any(not c["name"].startswith("（") for child in kept_children for c in child["child"]):
+        assert len(kept_children) == len(tree["child"])
+    assert len([n for n in _names(pruned) if not n.startswith("（")]) < len(list(_names(tree)))
+    assert json.loads(json.dumps(pruned, ensure_ascii=False)) == pruned
+
+
+def test_prune_orders_branches_by_query_similarity():
+    tree = {"name": "root", "desc": "", "child": [
+        {"name": f"c{i}", "desc": "描述" * 20, "child": []} for i in range(5)
+    ]}
+    backend = FakeBackend({f"root>c{i}": [1.0, 0.0] if i == 3 else [0.0, 1.0] for i in range(5)})
+    # 预算只够根节点和一个子节点
+    budget = int((_node_cost("root", "", 0) + _node_cost("c0", "描述" * 20, 1)) / 0.9) + 1
+    pruned = prune_subtree("root", tree, budget, query_vector=[1.0, 0.0], backend=backend)
+
+    kept = [c["name"] for c in pruned["child"] if not c["name"].startswith("（")]
+    assert kept == ["c3"]
+    assert backend.requested == [[f"root>c{i}" for i in range(5)]]
+
+
+def test_prune_keeps_root_even_when_budget_is_tiny():
+    tree = _tree(3, 1)
+    pruned = prune_subtree("n", tree, budget_tokens=1)
+    assert pruned["name"] == "n" and pruned["desc"] == tree["desc"]
+    assert all(c["name"].startswith("（") for c in pruned["child"])
+
+
+def test_node_cost_counts_cjk_per_character():
+    assert _node_cost("故障", "", 0) - _node_cost("", "", 0) == estimate_tokens("故障") == 2
+
+
+def test_collapse_paths_keeps_disjoint_results_in_rank_order():
+    assert collapse_paths(["02>A", "01", "03>B>C"]) == ["02>A", "01", "03>B>C"]
+
+
+def test_collapse_paths_drops_descendants_of_earlier_ancestor():
+    assert collapse_paths(["01", "01>A", "02", "01>A>x"]) == ["01", "02"]
+
+
+def test_collapse_paths_ancestor_takes_best_descendant_rank():
+    assert collapse_paths(["01>A", "02", "01>B", "01"]) == ["01", "02"]
+
+
+def test_collapse_paths_removes_duplicates_and_respects_name_boundaries():
+    # "01>AB" 不是 "01>A" 的后代
+    assert collapse_paths(["01>A", "01>A", "01>AB"]) == ["01>A", "01>AB"]
+    assert collapse_paths([]) == []
+
+
+def test_merged_context_query_specific_flag():
+    assert not is_query_specific(MergedContext([{"name": "a"}]))
+    assert is_query_specific(MergedContext([{"name": "a"}], pruned=True))
+
+
+def test_over_budget_subtree_is_pruned_without_serializing(monkeypatch):
+    from app.core import config
+    from app.services import retrieval
+    from app.services.tree_store import DictTree
+
+    class _Snapshot:
+        tree = DictTree([_tree(4, 3)])
+        backend = None
+        generation = 1
+
+    def _serialize(*args, **kwargs):
+        raise AssertionError("超出预算的子树不应为计数而序列化")
+
+    monkeypatch.setattr(config, "CONTEXT_TOKEN_BUDGET", _estimated_cost(_tree(4, 3)) // 5)
+    monkeypatch.setattr(retrieval, "serialize_subtree", _serialize)
+    path, subtree = retrieval._extract_context("n", None, _Snapshot())
+    assert path == "n"
+    assert isinstance(subtree, PrunedSubtree)
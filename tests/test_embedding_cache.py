@@ -0,0 +1,81 @@
+import asyncio
+import threading
+
+from app.services import retrieval
+from app.services.embedding_cache import EmbeddingCache
+
+
+def test_memory_tier_lru_and_normalized_keys():
+    cache = EmbeddingCache("m", max_entries=2)
+    cache.put("Ｅ01  故障", [1.0])
+    assert cache.get("e01 故障") == [1.0]
+    cache.put("b", [2.0])
+    cache.put("c", [3.0])
+    assert cache.get("e01 故障") is None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    cache = EmbeddingCache("m", max_entries=8, persist_path=path)
+    cache.put("q", [0.5, 0.25])
+    cache.close()
+
+    reopened = EmbeddingCache("m", max_entries=8, persist_path=path)
+    assert reopened.get_memory("q") is None
+    assert reopened.get_disk("q") == [0.5, 0.25]
+    # 磁盘命中后已回填内存层
+    assert reopened.get_memory("q") == [0.5, 0.25]
+    stats = reopened.stats()
+    assert (stats["hits"], stats["disk_hits"], stats["misses"]) == (1, 1, 0)
+    # 模型不同，键不同
+    assert EmbeddingCache("other", max_entries=8, persist_path=path).get("q") is None
+    reopened.close()
+
+
+def test_memory_only_methods_do_not_touch_disk(tmp_path):
+    cache = EmbeddingCache("m", max_entries=8, persist_path=tmp_path / "cache.sqlite")
+    cache.put_memory("q", [1.0])
+    assert cache.get_disk("q") is None
+    cache.put_disk("q", [1.0])
+    cache.clear()
+    assert cache.get("q") == [1.0]
+    cache.close()
+
+
+class _FakeBatcher:
+    async def embed(self, text):
+        return [0.5, 0.25]
+
+
+def test_aembed_query_runs_disk_tier_off_the_event_loop(tmp_path, monkeypatch):
+    cache = EmbeddingCache("m", max_entries=8, persist_path=tmp_path / "cache.sqlite")
+    threads = []
+    for name in ("get_disk", "put_disk"):
+        original = getattr(cache, name)
+
+        def _wrapped(*args, _original=original, _name=name):
+            threads.append((_name, threading.current_thread().name))
+            return _original(*args)
+
+        monkeypatch.setattr(cache, name, _wrapped)
+    monkeypatch.setattr(retrieval, "get_embedding_cache", lambda: cache)
+    monkeypatch.setattr(retrieval, "get_embedding_batcher", lambda: _FakeBatcher())
+
+    async def _run():
+        first = await retrieval.aembed_query("问题")
+        loop_thread = threading.current_thread().name
+        second = await retrieval.aembed_query("问题")
+        return first, second, loop_thread
+
+    try:
+        first, second, loop_thread = asyncio.run(_run())
+        retrieval.get_retrieval_executor().shutdown(wait=True)
+    finally:
+        retrieval.get_retrieval_executor.cache_clear()
+    assert first == second == [0.5, 0.25]
+    assert [name for name, _ in threads] == ["get_disk", "put_disk"]
+    assert all(thread != loop_thread and thread.startswith("retrieval") for _, thread in threads)
+    # 第二次查询命中内存层，不再访问磁盘
+    assert cache.get_disk("问题") == [0.5, 0.25]
+    cache.close()
@@ -0,0 +1,59 @@
+import json
+import os
+import sys
+
+import pytest
+
+from app.core import config
+from app.services import retrieval
+from scripts import data_indexer
+
+
+def _age(path, seconds):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns - int(seconds * 1e9)))
+
+
+def test_tree_only_refreshes_manifest_so_reload_sees_complete_index(data_dir):
+    config.KNOWLEDGE_BASE_FILE.write_text(json.dumps([{"name": "01", "desc": "电源"}]), encoding="utf-8")
+    data_indexer.save_manifest({"01": "old"})
+    _age(config.INDEX_MANIFEST_FILE, 60)
+    assert not retrieval._index_complete(retrieval.get_index_version())
+
+    data_indexer.main(["--tree-only"])
+
+    version = retrieval.get_index_version()
+    assert retrieval._index_complete(version)
+    assert config.KNOWLEDGE_BASE_TREE_FILE.exists()
+    # 只刷新时间，清单内容不变
+    assert data_indexer.load_manifest() == {"01": "old"}
+
+
+def test_reset_chroma_system_cache_falls_back_when_api_is_missing(monkeypatch, caplog):
+    monkeypatch.setitem(sys.modules, "chromadb.api.shared_system_client", None)
+    assert retrieval._reset_chroma_system_cache() is False
+    assert "VECTOR_BACKEND=numpy" in caplog.text
+
+
+class _FakeBackend:
+    def count(self):
+        return 0
+
+
+def test_failed_reload_keeps_current_snapshot(data_dir, monkeypatch):
+    monkeypatch.setattr(config, "KNOWLEDGE_BASE_LOADER", "compact")
+    monkeypatch.setattr(retrieval, "_load_vector_backend", lambda allow_chroma=True: _FakeBackend())
+    monkeypatch.setattr(retrieval, "_snapshot", None)
+    kb = [{"name": "01", "desc": "电源"}, {"name": "02", "desc": "照明"}]
+    config.KNOWLEDGE_BASE_FILE.write_text(json.dumps(kb, ensure_ascii=False), encoding="utf-8")
+    snapshot = retrieval.get_snapshot()
+    assert len(snapshot.tree) == 2
+
+    # 写入中途被截断的知识库文件
+    text = config.KNOWLEDGE_BASE_FILE.read_text(encoding="utf-8")
+    config.KNOWLEDGE_BASE_FILE.write_text(text[: len(text) // 2], encoding="utf-8")
+    with pytest.raises(Exception):
+        retrieval.reload_snapshot(force=True)
+
+    assert retrieval.get_snapshot() is snapshot
+    assert len(retrieval.get_snapshot().tree) == 2
@@ -0,0 +1,55 @@
+import sys
+
+import pytest
+
+from app.core import config
+from app.services import llm_handler
+from app.services.llm_handler import clear_context_cache, serialize_subtree
+
+
+@pytest.fixture
+def generation(monkeypatch):
+    monkeypatch.setattr(config, "PROMPT_CONTEXT_CACHE_SIZE", 100)
+    monkeypatch.setattr(config, "PROMPT_CONTEXT_CACHE_MAX_BYTES", 0)
+    monkeypatch.setattr(config, "PROMPT_CONTEXT_CACHE_MAX_ENTRY_BYTES", 0)
+    yield clear_context_cache()
+    clear_context_cache()
+
+
+def _text(n):
+    return "x" * n
+
+
+def test_entries_above_size_threshold_are_not_cached(monkeypatch, generation):
+    monkeypatch.setattr(config, "PROMPT_CONTEXT_CACHE_MAX_ENTRY_BYTES", sys.getsizeof(_text(1000)))
+    serialize_subtree("small", _text(1000), generation=generation)
+    serialize_subtree("root", _text(5000), generation=generation)
+    assert list(llm_handler._context_cache) == ["small"]
+
+
+def test_total_bytes_budget_evicts_least_recently_used(monkeypatch, generation):
+    entry = sys.getsizeof(_text(1000))
+    monkeypatch.setattr(config, "PROMPT_CONTEXT_CACHE_MAX_BYTES", entry * 2)
+    for path in ("a", "b"):
+        serialize_subtree(path, _text(1000), generation=generation)
+    serialize_subtree("a", "ignored", generation=generation)  # 命中，a 成为最近使用
+    serialize_subtree("c", _text(1000), generation=generation)
+    assert list(llm_handler._context_cache) == ["a", "c"]
+    assert llm_handler._context_cache_bytes == entry * 2
+
+
+def test_entry_count_limit_still_applies(monkeypatch, generation):
+    monkeypatch.setattr(config, "PROMPT_CONTEXT_CACHE_SIZE", 2)
+    for path in ("a", "b", "c"):
+        serialize_subtree(path, {"name": path}, generation=generation)
+    assert list(llm_handler._context_cache) == ["b", "c"]
+
+
+def test_clear_resets_byte_accounting(generation):
+    serialize_subtree("a", _text(100), generation=generation)
+    assert llm_handler._context_cache_bytes > 0
+    new_generation = clear_context_cache()
+    assert llm_handler._context_cache_bytes == 0
+    # 旧代的结果不再写入
+    serialize_subtree("a", _text(100), generation=new_generation - 1)
+    assert not llm_handler._context_cache
@@ -0,0 +1,65 @@
+import pytest
+
+from app import server
+from app.core import config
+from app.services import retrieval
+
+
+@pytest.fixture
+def no_snapshot(monkeypatch, data_dir):
+    monkeypatch.setattr(retrieval, "_snapshot", None)
+
+    def _no_chroma():
+        raise AssertionError("预加载时不应打开 ChromaDB")
+
+    monkeypatch.setattr(retrieval, "get_chroma_collection", _no_chroma)
+    monkeypatch.setattr(config, "VECTOR_BACKEND", "numpy")
+    return data_dir
+
+
+def test_preload_does_not_fall_back_to_chroma(no_snapshot):
+    # 向量文件不存在：NumPy 后端加载失败，不回退到 ChromaDB
+    assert retrieval.preload_snapshot() is False
+    assert retrieval._snapshot is None
+
+
+def test_preload_skips_non_numpy_backend(no_snapshot, monkeypatch):
+    monkeypatch.setattr(config, "VECTOR_BACKEND", "chroma")
+    assert retrieval.preload_snapshot() is False
+    assert retrieval._snapshot is None
+
+
+def test_preload_loads_numpy_snapshot(no_snapshot, monkeypatch):
+    class _Backend:
+        def count(self):
+            return 0
+
+    monkeypatch.setattr(retrieval.NumpyBackend, "load", classmethod(lambda cls, *args: _Backend()))
+    assert retrieval.preload_snapshot() is True
+    assert isinstance(retrieval._snapshot.backend, _Backend)
+
+
+@pytest.mark.parametrize("preload, loaded, frozen", [
+    (True, True, True),
+    (True, False, False),
+    (False, True, False),
+])
+def test_serve_freezes_gc_only_after_successful_preload(monkeypatch, preload, loaded, frozen):
+    calls = []
+
+    class _Arbiter:
+        def __init__(self, *args):
+            pass
+
+        def run(self):
+            return 0
+
+    monkeypatch.setattr(server, "_bind_socket", lambda *args: None)
+    monkeypatch.setattr(server, "Arbiter", _Arbiter)
+    monkeypatch.setattr(server.gc, "freeze", lambda: calls.append("freeze"))
+    monkeypatch.setattr(retrieval, "preload_snapshot", lambda: calls.append("preload") or loaded)
+    monkeypatch.setattr(config, "VECTOR_BACKEND", "numpy")
+
+    assert server.serve(app=None, workers=2, preload=preload) == 0
+    assert ("freeze" in calls) is frozen
+    assert ("preload" in calls) is preload
@@ -0,0 +1,79 @@
+import asyncio
+
+import pytest
+
+from app.core import config
+from app.services import retrieval
+from app.services.session_cache import SessionCache, SessionContext
+
+SUBTREE = {"name": "02", "desc": "发动机故障", "child": [
+    {"name": "检查点火线圈", "desc": "测量初级电阻", "child": []},
+]}
+
+
+def test_score_ignores_unindexed_words():
+    context = SessionContext("02", SUBTREE)
+    assert context.score("点火线圈") == pytest.approx(1.0)
+    assert context.score("变速箱漏油") < 0.5
+
+
+def test_score_without_any_indexed_word_is_none():
+    assert SessionContext("02", SUBTREE).score("？？") is None
+
+
+@pytest.fixture
+def conversation(monkeypatch):
+    """启用会话缓存，检索替换为桩，返回检索调用记录。"""
+    calls = []
+
+    async def _retrieve(question):
+        calls.append(question)
+        return "02", SUBTREE
+
+    class _Snapshot:
+        version = (1,)
+        lexical = None
+
+    cache = SessionCache(max_entries=16)
+    monkeypatch.setattr(config, "SESSION_CACHE_MIN_SCORE", 0.6)
+    monkeypatch.setattr(retrieval, "get_session_cache", lambda: cache)
+    monkeypatch.setattr(retrieval, "get_snapshot", lambda: _Snapshot())
+    monkeypatch.setattr(retrieval, "aget_context_from_retrieval", _retrieve)
+    return calls, cache
+
+
+def test_on_topic_follow_up_reuses_previous_retrieval(conversation):
+    calls, cache = conversation
+    asyncio.run(retrieval.aget_conversation_context(["发动机故障"]))
+    path, _ = asyncio.run(retrieval.aget_conversation_context(["发动机故障", "点火线圈"]))
+    assert path == "02"
+    assert calls == ["发动机故障"]
+    assert cache.stats()["hits"] == 1
+
+
+def test_follow_up_without_indexed_terms_runs_fresh_retrieval(conversation):
+    calls, cache = conversation
+    asyncio.run(retrieval.aget_conversation_context(["发动机故障"]))
+    asyncio.run(retrieval.aget_conversation_context(["发动机故障", "？？"]))
+    assert calls == ["发动机故障", "？？"]
+    assert cache.stats()["rejected"] == 1
+
+
+def test_session_cache_loads_lexical_index_without_hybrid_fusion(data_dir, monkeypatch):
+    from app.services.lexical_index import LexicalIndex
+
+    LexicalIndex.build([("02", "发动机故障", ""), ("03", "变速箱", "漏油")]).save(config.LEXICAL_INDEX_FILE)
+    config.KNOWLEDGE_BASE_FILE.write_text("[]", encoding="utf-8")
+    monkeypatch.setattr(config, "HYBRID_SEARCH_ENABLED", False)
+    monkeypatch.setattr(config, "EXACT_NAME_FAST_PATH", False)
+    monkeypatch.setattr(config, "SESSION_CACHE_ENABLED", True)
+
+    class _Backend:
+        def query(self, vector, n_results):
+            return {"ids": [["03"]], "distances": [[0.1]]}
+
+    monkeypatch.setattr(retrieval, "_load_vector_backend", lambda allow_chroma=True: _Backend())
+    snapshot = retrieval._build_snapshot(fresh=False)
+    assert snapshot.lexical is not None
+    # 词法索引只用于会话缓存打分，检索结果仍为纯向量检索
+    assert retrieval.hybrid_search("发动机故障", [0.0], snapshot) == ("vector", ["03"], [0.1])
@@ -0,0 +1,148 @@
+import json
+
+import pytest
+
+from app.services.tree_store import (
+    CompactTree, DictTree, MmapTree, compile_tree, iter_tree_nodes, load_tree,
+)
+
+
+def _write(tmp_path, data):
+    path = tmp_path / "kb.json"
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return path
+
+
+def _normalize(node):
+    """去掉叶子节点上空的 'child'，并按 name/desc/child 统一比较（CompactTree 物化时总会带上 'child'）。"""
+    if node is None:
+        return None
+    return {
+        "name": node.get("name"),
+        "desc": node.get("desc", ""),
+        "child": [_normalize(child) for child in node.get("child") or []],
+    }
+
+
+def _all_paths(data, prefix=""):
+    for node in data:
+        path_id = f"{prefix}>{node['name']}" if prefix else node["name"]
+        yield path_id
+        yield from _all_paths(node.get("child") or [], path_id)
+
+
+# 同一棵树的两种键顺序：name/desc 在 child 之前（可流式产出），以及 child 在前、desc 在后
+CANONICAL = [
+    {"name": "01", "desc": "电源", "child": [
+        {"name": "A", "desc": "主板", "child": [{"name": "x", "desc": "叶子"}]},
+        {"name": "B", "desc": "风扇"},
+    ]},
+    {"name": "02", "desc": "网络", "child": [{"name": "C", "desc": "网卡"}]},
+]
+REORDERED = [
+    {"child": [
+        {"child": [{"desc": "叶子", "name": "x"}], "name": "A", "desc": "主板"},
+        {"desc": "风扇", "name": "B"},
+    ], "name": "01", "desc": "电源"},
+    {"name": "02", "child": [{"name": "C", "desc": "网卡"}], "desc": "网络"},
+]
+
+
+@pytest.mark.parametrize("data", [CANONICAL, REORDERED], ids=["canonical", "reordered"])
+def test_iter_tree_nodes_is_independent_of_key_order(tmp_path, data):
+    nodes = list(iter_tree_nodes(_write(tmp_path, data)))
+    assert [(n.depth, n.name, n.desc) for n in nodes] == [
+        (0, "01", "电源"), (1, "A", "主板"), (2, "x", "叶子"), (1, "B", "风扇"),
+        (0, "02", "网络"), (1, "C", "网卡"),
+    ]
+
+
+@pytest.mark.parametrize("data", [CANONICAL, REORDERED], ids=["canonical", "reordered"])
+def test_compact_tree_matches_dict_tree(tmp_path, data):
+    path = _write(tmp_path, data)
+    dict_tree, compact_tree = DictTree.load(path), CompactTree.load(path)
+    paths = list(_all_paths(data))
+    assert len(compact_tree) == len(dict_tree) == len(paths)
+    for path_id in paths:
+        assert _normalize(compact_tree.find(path_id)) == _normalize(dict_tree.find(path_id)), path_id
+
+
+def test_nameless_node_is_skipped_with_its_subtree(tmp_path):
+    data = [
+        {"desc": "无名", "child": [{"name": "orphan", "desc": ""}]},
+        {"child": [{"name": "late", "desc": ""}], "desc": "名称在后", "name": "ok"},
+    ]
+    nodes = list(iter_tree_nodes(_write(tmp_path, data)))
+    assert [(n.depth, n.name) for n in nodes] == [(0, "ok"), (1, "late")]
+
+
+# 含重名节点：不同分支下的同名节点（路径不同）以及同一层级下的重名兄弟（以第一个为准）
+WITH_DUPLICATES = [
+    {"name": "01", "desc": "一", "child": [
+        {"name": "通用", "desc": "01 下的通用", "child": [{"name": "步骤", "desc": "01-步骤"}]},
+        {"name": "重复", "desc": "第一个", "child": [{"name": "子", "desc": "第一个的子节点"}]},
+        {"name": "重复", "desc": "第二个", "child": [{"name": "另一个子", "desc": "不可达"}]},
+    ]},
+    {"name": "02", "desc": "二", "child": [
+        {"name": "通用", "desc": "02 下的通用", "child": [{"name": "步骤", "desc": "02-步骤"}]},
+    ]},
+    {"name": "01", "desc": "重复的根节点"},
+]
+
+
+def _compile(tmp_path, data):
+    source = _write(tmp_path, data)
+    compiled = compile_tree(CompactTree.load(source), tmp_path / "kb.tree", source_path=source)
+    return source, MmapTree.load(compiled)
+
+
+@pytest.mark.parametrize("data", [CANONICAL, WITH_DUPLICATES], ids=["canonical", "duplicates"])
+def test_mmap_tree_round_trip_matches_dict_tree(tmp_path, data):
+    source, mmap_tree = _compile(tmp_path, data)
+    dict_tree = DictTree.load(source)
+    try:
+        assert len(mmap_tree) == len(CompactTree.load(source))
+        for path_id in set(_all_paths(data)) | {"01>重复>另一个子", "03", "01>不存在", "通用>步骤"}:
+            assert (path_id in mmap_tree) == (path_id in dict_tree), path_id
+            assert _normalize(mmap_tree.find(path_id)) == _normalize(dict_tree.find(path_id)), path_id
+    finally:
+        mmap_tree.close()
+
+
+def test_mmap_tree_duplicate_names_resolve_by_full_path(tmp_path):
+    _, mmap_tree = _compile(tmp_path, WITH_DUPLICATES)
+    try:
+        assert mmap_tree.find("01>通用>步骤")["desc"] == "01-步骤"
+        assert mmap_tree.find("02>通用>步骤")["desc"] == "02-步骤"
+        assert mmap_tree.find("01>重复")["desc"] == "第一个"
+        assert mmap_tree.find("01")["desc"] == "一"
+        assert mmap_tree.find("01>重复>另一个子") is None
+    finally:
+        mmap_tree.close()
+
+
+def test_mmap_tree_empty(tmp_path):
+    _, mmap_tree = _compile(tmp_path, [])
+    try:
+        assert len(mmap_tree) == 0
+        assert "01" not in mmap_tree
+        assert mmap_tree.find("01") is None
+    finally:
+        mmap_tree.close()
+
+
+def test_mmap_tree_staleness(tmp_path):
+    source, mmap_tree = _compile(tmp_path, CANONICAL)
+    try:
+        assert not mmap_tree.is_stale(source)
+        _write(tmp_path, CANONICAL + [{"name": "03", "desc": "新增"}])
+        assert mmap_tree.is_stale(source)
+    finally:
+        mmap_tree.close()
+
+
+def test_load_tree_mmap_falls_back_when_compiled_file_is_missing(tmp_path):
+    source = _write(tmp_path, CANONICAL)
+    tree = load_tree(source, mode="mmap", compiled_path=tmp_path / "missing.tree")
+    assert isinstance(tree, CompactTree)
+    assert tree.find("01>A>x")["desc"] == "叶子"